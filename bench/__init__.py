@@ -0,0 +1,4 @@
+"""
+Benchmarks of plex, with its engines, and of PLY on the same grammars.
+Run them with python -m bench; see bench/run.py.
+"""
@@ -0,0 +1,314 @@
+"""
+Grammars of the benchmarks, each with a plex lexer, the same lexer in PLY
+(in bench/ply_*.py) when there is one, and a generator of synthetic input.
+
+The lexer classes are created again by every call of plex_class(), so the
+time of class creation and of the first token can be measured.
+"""
+
+import importlib.util
+import os
+import random
+import sys
+
+from plex import Lexer
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+def _load_example(name):
+    """
+    Import a module of example/ afresh.
+    """
+    spec = importlib.util.spec_from_file_location('_bench_' + name, os.path.join(EXAMPLE_DIR, name + '.py'))
+    module = sys.modules[spec.name] = importlib.util.module_from_spec(spec)  # PLY looks it up
+    spec.loader.exec_module(module)
+    return module
+
+
+def _fill(size, seed, piece):
+    """
+    Join the pieces made by piece(rng) until there are size characters.
+    """
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        part = piece(rng)
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)
+
+
+class Grammar:
+    name = None
+    description = ''
+
+    def plex_class(self, options):
+        """
+        Create the plex lexer class, with the options.
+        """
+        raise NotImplementedError
+
+    def plex_lexer(self, cls):
+        return cls()
+
+    def ply_lexer(self):
+        """
+        Build the PLY lexer, or return None if there's no PLY version.
+        ImportError is raised if PLY is not installed.
+        """
+        return None
+
+    def corpus(self, size, seed=0):
+        """
+        Return an input of about size characters, made from seed.
+        """
+        raise NotImplementedError
+
+
+class CalcGrammar(Grammar):
+    name = 'calc'
+    description = 'arithmetic of example/calc.py'
+
+    def plex_class(self, options):
+        lexer_options = dict(options)
+
+        class CalcLexer(Lexer):
+            options = lexer_options
+
+            __(r'\+')('PLUS')
+            __(r'-')('MINUS')
+            __(r'\*')('TIMES')
+            __(r'/')('DIVIDE')
+            __(r'\(')('LPAREN')
+            __(r'\)')('RPAREN')
+
+            @__(r'\d+')
+            def t_NUMBER(self, t):
+                t.type = 'NUMBER'
+                t.value = int(t.text)
+                return t
+
+            @__(r'\n+')
+            def t_newline(self, t):
+                self.lineno += len(t.text)
+
+            __(r'[ \t]')(None)
+
+            @__('__error__')
+            def t_error(self, t):
+                self.skip(1)
+
+        return CalcLexer
+
+    def ply_lexer(self):
+        from bench import ply_calc
+        return ply_calc.build()
+
+    def corpus(self, size, seed=0):
+        def expr(rng, depth=0):
+            if depth < 3 and rng.random() < 0.3:
+                return '(%s)' % expr(rng, depth + 1)
+            terms = [str(rng.randint(0, 10 ** rng.randint(1, 6))) for _ in range(rng.randint(1, 6))]
+            return ''.join(t + rng.choice([' + ', ' - ', '*', ' / ']) for t in terms[:-1]) + terms[-1]
+        return _fill(size, seed, lambda rng: expr(rng) + ' ' + rng.choice('+-*/') + ' ' + expr(rng) + '\n')
+
+
+class VerilogGrammar(Grammar):
+    name = 'verilog'
+    description = 'Verilog of example/verilog.py and example/verilog_ply.py'
+
+    def plex_class(self, options):
+        cls = _load_example('verilog').VerilogLexerPlex
+        # the engine is only read when a state is compiled, on the first token
+        cls._options.update(options)
+        return cls
+
+    def plex_lexer(self, cls):
+        return cls(error_func=None)
+
+    def ply_lexer(self):
+        import ply.lex
+        lexer = _load_example('verilog_ply').VerilogLexer(error_func=None)
+        lexer.build(optimize=False, errorlog=ply.lex.NullLogger())
+        return lexer
+
+    def corpus(self, size, seed=0):
+        def module(rng):
+            ids = ['%s_%d' % (rng.choice(['data', 'count', 'state', 'valid', 'addr']), rng.randint(0, 99))
+                   for _ in range(6)]
+            width = rng.choice([1, 8, 16, 32])
+            lines = ['// module %s\n' % ids[0], 'module %s\n  (\n   input CLK,\n   input RST,\n' % ids[0]]
+            lines += ['   input [%d:0] %s,\n' % (width - 1, name) for name in ids[1:3]]
+            lines += ['   output reg [%d:0] %s\n  );\n' % (width - 1, ids[3])]
+            lines += ['  reg [%d:0] %s;\n' % (width - 1, name) for name in ids[4:]]
+            lines += ['  /* %s is\n     updated on every clock */\n' % ids[4]]
+            lines += ['  always @(posedge CLK) begin\n    if(RST) begin\n'
+                      '      %s <= 0;\n    end else begin\n' % ids[4]]
+            for _ in range(rng.randint(1, 8)):
+                number = rng.choice(["%d'h%X" % (width, rng.getrandbits(width)), "%d'b1010" % width,
+                                     str(rng.randint(0, 999)), '3.25e2'])
+                lines.append('      if(%s == %s) %s <= %s + %s;\n' % (ids[1], number, ids[5], ids[5], ids[2]))
+            lines += ['      %s <= %s ^ ~%s;\n    end\n  end\n' % (ids[3], ids[4], ids[5])]
+            lines += ['  assign %s = %s[%d:0];\nendmodule\n\n' % (ids[4], ids[5], width - 1)]
+            return ''.join(lines)
+        return _fill(size, seed, module)
+
+
+class StringsGrammar(Grammar):
+    name = 'strings'
+    description = 'C-like source heavy in strings and comments'
+
+    def plex_class(self, options):
+        lexer_options = dict(options)
+
+        class StringsLexer(Lexer):
+            options = lexer_options
+
+            __(r'"([^"\\\n]|\\.)*"')('STRING')
+            __(r"'([^'\\\n]|\\.)'")('CHAR')
+            __(r'//[^\n]*')(None)
+            __(r'/\*(.|\n)*?\*/')(None)
+            __(r'[A-Za-z_][A-Za-z_0-9]*')('ID')
+            __(r'\d+')('NUMBER')
+            __(r'[-+*/=<>!&|]=?|[{}()\[\];,.]')('OP')
+            __(r'[ \t]+')(None)
+
+            @__(r'\n+')
+            def t_newline(self, t):
+                self.lineno += len(t.text)
+
+            @__('__error__')
+            def t_error(self, t):
+                self.skip(1)
+
+        return StringsLexer
+
+    def ply_lexer(self):
+        from bench import ply_strings
+        return ply_strings.build()
+
+    def corpus(self, size, seed=0):
+        words = ['value', 'index', 'name', 'buffer', 'result', 'count']
+
+        def function(rng):
+            lines = ['/* %s\n * %s\n */\n' % (' '.join(rng.choices(words, k=8)), ' '.join(rng.choices(words, k=6)))]
+            lines.append('int %s(char *%s) {\n' % tuple(rng.choices(words, k=2)))
+            for _ in range(rng.randint(2, 8)):
+                text = ' '.join(rng.choices(words, k=rng.randint(1, 12)))
+                lines.append('    log("%s: %%d\\n", %s); // %s\n' % (text, rng.choice(words), text))
+                lines.append("    if (%s == '\\n') return %d;\n" % (rng.choice(words), rng.randint(0, 99)))
+            lines.append('}\n\n')
+            return ''.join(lines)
+        return _fill(size, seed, function)
+
+
+class KeywordsGrammar(Grammar):
+    name = 'keywords'
+    description = 'case-insensitive SQL keywords'
+
+    keywords = ('SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'NULL', 'IS', 'IN', 'ORDER', 'BY',
+                'GROUP', 'HAVING', 'LIMIT', 'JOIN', 'ON', 'AS', 'INSERT', 'INTO', 'VALUES')
+
+    def plex_class(self, options):
+        lexer_options = dict(options, **{'case-insensitive': True})
+        keywords = self.keywords
+
+        class KeywordsLexer(Lexer):
+            options = lexer_options
+
+            for keyword in keywords:
+                __(keyword.lower())(keyword)
+            del keyword
+            __(r'[a-z_][a-z_0-9]*')('ID')
+            __(r'\d+')('NUMBER')
+            __(r"'[^']*'")('STRING')
+            __(r'[-+*/=<>(),;.]')('OP')
+            __(r'\s+')(None)
+
+            @__('__error__')
+            def t_error(self, t):
+                self.skip(1)
+
+        return KeywordsLexer
+
+    def ply_lexer(self):
+        from bench import ply_keywords
+        return ply_keywords.build()
+
+    def corpus(self, size, seed=0):
+        columns = ['id', 'name', 'price', 'created_at', 'user_id', 'selection', 'order_no']
+
+        def query(rng):
+            kw = [rng.choice([k, k.lower(), k.capitalize()]) for k in ('SELECT', 'FROM', 'WHERE', 'AND', 'LIMIT')]
+            return "%s %s %s t_%d %s %s = '%s' %s %s > %d %s %d;\n" % (
+                kw[0], ', '.join(rng.sample(columns, 3)), kw[1], rng.randint(0, 9), kw[2], rng.choice(columns),
+                rng.choice(columns), kw[3], rng.choice(columns), rng.randint(0, 9999), kw[4], rng.randint(1, 99))
+        return _fill(size, seed, query)
+
+
+class TemplateGrammar(Grammar):
+    name = 'template'
+    description = 'multi-state HTML-like template'
+
+    def plex_class(self, options):
+        lexer_options = dict(options)
+
+        class TemplateLexer(Lexer):
+            options = lexer_options
+            states = [('tag', 'exclusive'), ('expr', 'exclusive')]
+
+            __(r'[^<{]+')('TEXT')
+
+            @__(r'<[a-z]+')
+            def t_tag_open(self, t):
+                self.push_state('tag')
+                t.type = 'TAG'
+                return t
+
+            @__(r'</[a-z]+>')
+            def t_tag_close(self, t):
+                t.type = 'ENDTAG'
+                return t
+
+            @__(('INITIAL', 'tag'), r'\{\{')
+            def t_expr_open(self, t):
+                self.push_state('expr')
+
+            __('tag', r'[a-z-]+')('ATTR')
+            __('tag', r'=')('EQUALS')
+            __('tag', r'"[^"]*"')('VALUE')
+            __('tag', r'\s+')(None)
+
+            @__('tag', r'/?>')
+            def t_tag_end(self, t):
+                self.pop_state()
+
+            @__('expr', r'\}\}')
+            def t_expr_close(self, t):
+                self.pop_state()
+
+            __('expr', r'[a-z_][a-z_0-9.]*')('NAME')
+            __('expr', r'\|')('PIPE')
+            __('expr', r'\s+')(None)
+
+            @__(('INITIAL', 'tag', 'expr'), '__error__')
+            def t_error(self, t):
+                self.skip(1)
+
+        return TemplateLexer
+
+    def ply_lexer(self):
+        from bench import ply_template
+        return ply_template.build()
+
+    def corpus(self, size, seed=0):
+        def element(rng):
+            name = rng.choice(['div', 'span', 'li', 'p'])
+            return '<%s class="%s" data-id="%d">Hello, {{ user.name | upper }}! You have {{ count }} items.</%s>\n' % (
+                name, rng.choice(['row', 'item active', 'note']), rng.randint(0, 9999), name)
+        return _fill(size, seed, element)
+
+
+GRAMMARS = {g.name: g for g in (CalcGrammar(), VerilogGrammar(), StringsGrammar(), KeywordsGrammar(),
+                                TemplateGrammar())}
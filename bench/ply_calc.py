@@ -0,0 +1,34 @@
+"""
+The calc grammar in PLY. PLY checks the rules of a module for duplicates,
+so each grammar has its own module.
+"""
+
+import ply.lex
+
+
+class CalcLexerPLY:
+    tokens = ('PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'LPAREN', 'RPAREN', 'NUMBER')
+
+    t_PLUS = r'\+'
+    t_MINUS = r'-'
+    t_TIMES = r'\*'
+    t_DIVIDE = r'/'
+    t_LPAREN = r'\('
+    t_RPAREN = r'\)'
+    t_ignore = ' \t'
+
+    def t_NUMBER(self, t):
+        r'\d+'
+        t.value = int(t.value)
+        return t
+
+    def t_newline(self, t):
+        r'\n+'
+        t.lexer.lineno += len(t.value)
+
+    def t_error(self, t):
+        t.lexer.skip(1)
+
+
+def build():
+    return ply.lex.lex(object=CalcLexerPLY(), optimize=False, errorlog=ply.lex.NullLogger())
@@ -0,0 +1,35 @@
+"""
+The keywords grammar in PLY.
+"""
+
+import re
+
+import ply.lex
+
+KEYWORDS = ('SELECT', 'FROM', 'WHERE', 'AND', 'OR', 'NOT', 'NULL', 'IS', 'IN', 'ORDER', 'BY',
+            'GROUP', 'HAVING', 'LIMIT', 'JOIN', 'ON', 'AS', 'INSERT', 'INTO', 'VALUES')
+
+
+class KeywordsLexerPLY:
+    tokens = KEYWORDS + ('ID', 'NUMBER', 'STRING', 'OP')
+
+    # the keywords are looked up, as PLY sorts the rules of strings by length
+    def t_ID(self, t):
+        r'[a-z_][a-z_0-9]*'
+        upper = t.value.upper()
+        if upper in KEYWORDS:
+            t.type = upper
+        return t
+
+    t_NUMBER = r'\d+'
+    t_STRING = r"'[^']*'"
+    t_OP = r'[-+*/=<>(),;.]'
+    t_ignore = ' \t\n'
+
+    def t_error(self, t):
+        t.lexer.skip(1)
+
+
+def build():
+    return ply.lex.lex(object=KeywordsLexerPLY(), optimize=False, reflags=re.VERBOSE | re.IGNORECASE,
+                       errorlog=ply.lex.NullLogger())
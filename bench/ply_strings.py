@@ -0,0 +1,32 @@
+"""
+The strings grammar in PLY.
+"""
+
+import ply.lex
+
+
+class StringsLexerPLY:
+    tokens = ('STRING', 'CHAR', 'ID', 'NUMBER', 'OP')
+
+    # the rules of functions come first, and the rules of strings are sorted
+    # by the length of the regex, so the comments have to be functions
+    def t_COMMENT(self, t):
+        r'//[^\n]*|/\*(.|\n)*?\*/'
+
+    t_STRING = r'"([^"\\\n]|\\.)*"'
+    t_CHAR = r"'([^'\\\n]|\\.)'"
+    t_ID = r'[A-Za-z_][A-Za-z_0-9]*'
+    t_NUMBER = r'\d+'
+    t_OP = r'[-+*/=<>!&|]=?|[{}()\[\];,.]'
+    t_ignore = ' \t'
+
+    def t_newline(self, t):
+        r'\n+'
+        t.lexer.lineno += len(t.value)
+
+    def t_error(self, t):
+        t.lexer.skip(1)
+
+
+def build():
+    return ply.lex.lex(object=StringsLexerPLY(), optimize=False, errorlog=ply.lex.NullLogger())
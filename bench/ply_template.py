@@ -0,0 +1,47 @@
+"""
+The template grammar in PLY.
+"""
+
+import ply.lex
+
+
+class TemplateLexerPLY:
+    tokens = ('TEXT', 'TAG', 'ENDTAG', 'ATTR', 'EQUALS', 'VALUE', 'NAME', 'PIPE')
+    states = (('tag', 'exclusive'), ('expr', 'exclusive'))
+
+    t_TEXT = r'[^<{]+'
+
+    def t_TAG(self, t):
+        r'<[a-z]+'
+        t.lexer.push_state('tag')
+        return t
+
+    t_ENDTAG = r'</[a-z]+>'
+
+    def t_INITIAL_tag_begin_expr(self, t):
+        r'\{\{'
+        t.lexer.push_state('expr')
+
+    t_tag_ATTR = r'[a-z-]+'
+    t_tag_EQUALS = r'='
+    t_tag_VALUE = r'"[^"]*"'
+    t_tag_ignore = ' \t\n'
+
+    def t_tag_end(self, t):
+        r'/?>'
+        t.lexer.pop_state()
+
+    def t_expr_end(self, t):
+        r'\}\}'
+        t.lexer.pop_state()
+
+    t_expr_NAME = r'[a-z_][a-z_0-9.]*'
+    t_expr_PIPE = r'\|'
+    t_expr_ignore = ' \t\n'
+
+    def t_ANY_error(self, t):
+        t.lexer.skip(1)
+
+
+def build():
+    return ply.lex.lex(object=TemplateLexerPLY(), optimize=False, errorlog=ply.lex.NullLogger())
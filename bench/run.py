@@ -0,0 +1,245 @@
+"""
+Run the benchmarks and print a table of the results. With --history, they
+are compared with the last run of the same benchmarks in a JSON history,
+and appended to it.
+
+    python -m bench [--size 1000000] [--grammar calc,verilog] [--impl plex-loop,ply] [--history PATH]
+"""
+
+import argparse
+import datetime
+import gc
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import plex
+from bench.grammars import GRAMMARS
+
+# implementations compared: plex with the options (and the module made by
+# plex.generate() if 'generate' is set), or PLY
+IMPLEMENTATIONS = {
+    'plex-loop': {'engine': 'loop'},
+    'plex-dfa': {'engine': 'dfa'},
+    'plex-gen': {'engine': 'loop', 'generate': True},
+    'ply': None,
+}
+
+# the metrics compared with the history, and whether a larger value is
+# better; the times of class creation and of the first token are too short
+# to be compared reliably, they are only recorded
+METRICS = {
+    'tokens_per_sec': True,
+    'peak_memory_kb': False,
+}
+
+
+def _plex_class(grammar, options):
+    """
+    Create the plex lexer class of the grammar, or return None if it can't
+    be generated.
+    """
+    options = dict(options)
+    generate = options.pop('generate', False)
+    cls = grammar.plex_class(options)
+    if not generate:
+        return cls
+    try:
+        source = plex.generate(cls)
+    except ValueError:
+        return None  # the class is defined in a function
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'generated.py')
+        with open(path, 'w') as fd:
+            fd.write(source)
+        spec = importlib.util.spec_from_file_location('_bench_generated_' + grammar.name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return getattr(module, cls.__name__)
+
+
+def _new_lexer(grammar, impl):
+    """
+    Return a new lexer of the grammar, from a new lexer class.
+    """
+    options = IMPLEMENTATIONS[impl]
+    if options is None:
+        return grammar.ply_lexer()
+    return grammar.plex_lexer(_plex_class(grammar, options))
+
+
+def _lex(lexer, text, keep=False):
+    lexer.input(text)
+    token = lexer.token
+    if keep:
+        return list(iter(token, None))
+    count = 0
+    while token() is not None:
+        count += 1
+    return count
+
+
+def bench(grammar, impl, text, repeat=5):
+    """
+    Return the metrics of one implementation of a grammar on text, the best
+    of repeat runs for the times.
+    """
+    options = IMPLEMENTATIONS[impl]
+    if options is None and grammar.ply_lexer() is None:
+        return None  # no PLY version
+    if options is not None and _plex_class(grammar, options) is None:
+        return None  # no generated version
+
+    creation, first_token = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if options is None:
+            lexer = grammar.ply_lexer()
+        else:
+            cls = _plex_class(grammar, options)
+            creation.append(time.perf_counter() - start)
+            lexer = grammar.plex_lexer(cls)
+        lexer.input(text)
+        lexer.token()
+        first_token.append(time.perf_counter() - start)
+        if options is None:
+            creation.append(first_token[-1])  # PLY builds the lexer in one go
+
+    lexer = _new_lexer(grammar, impl)
+    elapsed, tokens = [], 0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        tokens = _lex(lexer, text)
+        elapsed.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _lex(lexer, text, keep=True)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = min(elapsed)
+    return {
+        'tokens': tokens,
+        'tokens_per_sec': tokens / best,
+        'mb_per_sec': len(text.encode('utf-8')) / 1e6 / best,
+        'seconds': best,
+        'seconds_median': statistics.median(elapsed),
+        'peak_memory_kb': peak / 1024,
+        'class_creation_ms': min(creation) * 1e3,
+        'first_token_ms': min(first_token) * 1e3,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(plex.__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except FileNotFoundError:
+        return []
+
+
+def compare(previous, result, threshold):
+    """
+    Return the changes of the metrics from previous to result, in percent,
+    and the metrics which got worse by more than threshold percent.
+    """
+    changes, regressions = {}, []
+    for metric, larger_is_better in METRICS.items():
+        old, new = previous.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        changes[metric] = change
+        if (-change if larger_is_better else change) > threshold:
+            regressions.append(metric)
+    return changes, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark plex and PLY lexers.')
+    parser.add_argument('--size', type=int, default=1000000, help='characters of each corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpora')
+    parser.add_argument('--grammar', default=','.join(GRAMMARS), help='grammars, separated by commas')
+    parser.add_argument('--impl', default=','.join(IMPLEMENTATIONS), help='implementations, separated by commas')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of which the best is kept')
+    parser.add_argument('--history', metavar='PATH', help='JSON file of the past results, compared and appended to')
+    parser.add_argument('--no-history', action='store_true', help="compare with the history, but don't write it")
+    parser.add_argument('--threshold', type=float, default=10.0, help='change in percent reported as regression')
+    args = parser.parse_args(argv)
+
+    grammars = [GRAMMARS[name] for name in args.grammar.split(',')]
+    impls = args.impl.split(',')
+    for impl in impls:
+        if impl not in IMPLEMENTATIONS:
+            parser.error("unknown implementation '%s'" % impl)
+
+    history = load_history(args.history) if args.history else []
+    previous = {}
+    for record in history:
+        if (record['size'], record['seed']) == (args.size, args.seed):
+            previous.update(record['results'])
+
+    results, regressions = {}, []
+    row = '%-10s %-10s %10s %12s %8s %10s %12s %12s  %s'
+    print(row % ('grammar', 'impl', 'tokens', 'tokens/s', 'MB/s', 'peak KB', 'class ms', '1st token ms', 'change'))
+    for grammar in grammars:
+        text = grammar.corpus(args.size, args.seed)
+        for impl in impls:
+            key = '%s/%s' % (grammar.name, impl)
+            try:
+                result = bench(grammar, impl, text, args.repeat)
+            except ImportError as e:
+                print('%-10s %-10s skipped: %s' % (grammar.name, impl, e))
+                continue
+            if result is None:
+                continue
+            results[key] = result
+            note = ''
+            if key in previous:
+                changes, worse = compare(previous[key], result, args.threshold)
+                note = '%+.1f%%' % changes['tokens_per_sec']
+                if worse:
+                    note += ' REGRESSION: ' + ', '.join(worse)
+                    regressions.append(key)
+            print(row % (grammar.name, impl, result['tokens'], '%.0f' % result['tokens_per_sec'],
+                         '%.2f' % result['mb_per_sec'], '%.0f' % result['peak_memory_kb'],
+                         '%.2f' % result['class_creation_ms'], '%.2f' % result['first_token_ms'], note))
+
+    if args.history and not args.no_history and results:
+        history.append({
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'plex': plex.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'size': args.size,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'results': results,
+        })
+        with open(args.history, 'w') as fd:
+            json.dump(history, fd, indent=1)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
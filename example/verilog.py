@@ -21,7 +21,6 @@
 import os
 import sys
 import re
-import time
 from plex import Lexer
 
 
@@ -39,12 +38,12 @@ class VerilogLexerPlex(Lexer):
     def _error(self, msg, token):
         location = self._make_tok_location(token)
         self.error_func(msg, location[0], location[1])
-        self.lexer.skip(1)
+        self.skip(1)
 
     def _find_tok_column(self, token):
         i = token.lexpos
         while i > 0:
-            if self.lexer.lexdata[i] == '\n':
+            if self.lexdata[i] == '\n':
                 break
             i -= 1
         return (token.lexpos - i) + 1
@@ -73,9 +72,9 @@ class VerilogLexerPlex(Lexer):
 
     @__(r'\`.*?\n')
     def t_DIRECTIVE(self, t):
-        self.directives.append((self.lexer.lineno, t.value))
-        self.lineno += t.value.count("\n")
-        m = re.match(r"^`default_nettype\s+(.+)\n", t.value)
+        self.directives.append((self.lineno, t.text))
+        self.lineno += t.text.count("\n")
+        m = re.match(r"^`default_nettype\s+(.+)\n", t.text)
         if m:
             self.default_nettype = m.group(1)
         pass
@@ -84,13 +83,13 @@ class VerilogLexerPlex(Lexer):
     @__(r'//.*?\n')
     def t_LINECOMMENT(self, t):
         t.type = 'LINECOMMENT'
-        self.lineno += t.value.count("\n")
+        self.lineno += t.text.count("\n")
         pass
 
     @__(r'/\*(.|\n)*?\*/')
     def t_COMMENTOUT(self, t):
         t.type = 'COMMENTOUT'
-        self.lineno += t.value.count("\n")
+        self.lineno += t.text.count("\n")
         pass
 
     # Operator
@@ -185,19 +184,16 @@ class VerilogLexerPlex(Lexer):
     __(signed_decimal_number)('SIGNED_INTNUMBER_DEC')
     __(decimal_number)('INTNUMBER_DEC')
 
-    @__(identifier)
-    def t_ID(self, t):
-        t.type = self.reserved.get(t.value, 'ID')
-        return t
+    __(identifier)('ID', keywords=reserved)
 
     @__(r'\n+')
     def t_NEWLINE(self, t):
-        self.lineno += t.value.count("\n")
+        self.lineno += t.text.count("\n")
         pass
 
     @__('__error__')
     def t_error(self, t):
-        msg = 'Illegal character %s' % repr(t.value[0])
+        msg = 'Illegal character %s' % repr(t.text[0])
         self._error(msg, t)
 
 
@@ -208,17 +204,13 @@ def tokenize_verilog_source(text):
 
     lex = VerilogLexerPlex(error_func=my_error_func)
 
-    time_start = time.time()
-    for _ in range(1000):
-        ret = []
-        lex.input(text)
-        while True:
-            tok = lex.token()
-            if not tok:
-                break  # No more input
-            ret.append('%s %s %d %d\n' % (tok.value, tok.type, tok.lineno, tok.lexpos))
-    time_end = time.time()
-    sys.stderr.write(str(time_end - time_start) + '\n')
+    ret = []
+    lex.input(text)
+    while True:
+        tok = lex.token()
+        if not tok:
+            break  # No more input
+        ret.append('%s %s %d %d\n' % (tok.value, tok.type, tok.lineno, tok.lexpos))
 
     return ''.join(ret)
 
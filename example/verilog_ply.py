@@ -19,7 +19,6 @@ from __future__ import print_function
 import sys
 import os
 import re
-import time
 
 from ply.lex import *
 
@@ -285,17 +284,13 @@ def dump_tokens(text):
     lexer.build()
 
     # Tokenize
-    time_start = time.time()
-    for _ in range(1000):
-        ret = []
-        lexer.input(text)
-        while True:
-            tok = lexer.token()
-            if not tok:
-                break  # No more input
-            ret.append("%s %s %d %d\n" % (tok.value, tok.type, tok.lineno, tok.lexpos))
-    time_end = time.time()
-    sys.stderr.write(str(time_end - time_start) + '\n')
+    ret = []
+    lexer.input(text)
+    while True:
+        tok = lexer.token()
+        if not tok:
+            break  # No more input
+        ret.append("%s %s %d %d\n" % (tok.value, tok.type, tok.lineno, tok.lexpos))
 
     return ''.join(ret)
 
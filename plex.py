@@ -1,5 +1,24 @@
+import bisect
+import codecs
+import copy
+import copyreg
+import enum
+import hashlib
+import io
+import mmap
+import os
+import pickle
 import re
+import sys
+import threading
+import time
 import types
+import warnings
+import weakref
+from array import array
+from collections import deque, namedtuple
+
+__version__ = '0.1.0'
 
 # This tuple contains known string types
 try:
@@ -18,7 +37,45 @@ class LexError(Exception):
         self.text = s
 
 
-class LexToken:
+class LexTokenBase:
+    """
+    Members shared by the token classes.
+    """
+    __slots__ = ()
+
+    # ... but still hold compatible member names from PLY
+    def type_getter(self): return self.char  # noqa
+    def type_setter(self, x): self.char = x  # noqa
+    type = property(type_getter, type_setter)
+    def value_getter(self): return self.lval  # noqa
+    def value_setter(self, x): self.lval = x  # noqa
+    value = property(value_getter, value_setter)
+
+    def __repr__(self):
+        return 'LexToken(%s,%r,%d,%d)' % (self.char, self.lval, self.lineno, self.lexpos)
+
+    @property
+    def type_id(self):
+        """
+        The integer code of the token type in the lexer class, see
+        Lexer.type_id(). None if the token has no lexer, or if its type isn't
+        known to the lexer class.
+        """
+        lexer = self.lexer
+        return None if lexer is None else lexer._token_types.codes.get(self.char)
+
+    def _location(self, name):
+        # column and lloc are looked up in the newline index of the lexer
+        # when it tracks lines, unless they have been assigned
+        lexer = self.lexer
+        if lexer is None or not lexer._track_lines:
+            return NotImplemented if name == 'column' else None
+        if name == 'column':
+            return lexer.find_column(self.lexpos)
+        return lexer.locate(self.lexpos) + lexer.locate(self.lexpos + len(self.text))
+
+
+class LexToken(LexTokenBase):
     """
     Token class. This class is used to represent the tokens produced.
     """
@@ -35,19 +92,653 @@ class LexToken:
         self.lineno = lineno  # yylineno
         self.lval = lval  # yylval
         self.extra = None  # yyextra
-        self.column = NotImplemented  # yycolumn
-        self.lloc = None  # yylloc
+        # column (yycolumn) and lloc (yylloc) are computed on first access
 
-    # ... but still hold compatible member names from PLY
-    def type_getter(self): return self.char  # noqa
-    def type_setter(self, x): self.char = x  # noqa
-    type = property(type_getter, type_setter)
-    def value_getter(self): return self.lval  # noqa
-    def value_setter(self, x): self.lval = x  # noqa
-    value = property(value_getter, value_setter)
+    def __getattr__(self, name):
+        if name in ('column', 'lloc'):
+            return self._location(name)
+        raise AttributeError(name)
+
+
+class CompactLexToken(LexTokenBase):
+    """
+    Token class with slots, for lexers producing lots of tokens.
+    Select it by options = {'token-class': CompactLexToken}.
+
+    The lexer is held by a weak reference, so tokens don't keep the lexer and
+    its input alive. The rarely used members (leng, extra, column and lloc)
+    are stored in a dict which is only allocated once one of them is set.
+    """
+    __slots__ = ('char', 'text', 'lineno', 'lexpos', 'lval', '_lexer', '_more')
+
+    def __init__(self, *, lexer=None, char=None, text='', leng=None,
+                 lineno=None, lexpos=None, lval=None):
+        self._lexer = None if lexer is None else weakref.ref(lexer)
+        self._more = None if leng is None else {'leng': leng}
+        self.lexpos = lexpos
+        self.char = char
+        self.text = text
+        self.lineno = lineno
+        self.lval = lval
+
+    @property
+    def lexer(self):
+        return None if self._lexer is None else self._lexer()
+
+    @lexer.setter
+    def lexer(self, x):
+        self._lexer = None if x is None else weakref.ref(x)
+
+    def _get_more(self, name):
+        if self._more is None or name not in self._more:
+            if name == 'leng':
+                return len(self.text)
+            return None if name == 'extra' else self._location(name)
+        return self._more[name]
+
+    def _set_more(self, name, x):
+        if self._more is None:
+            self._more = {}
+        self._more[name] = x
+
+    leng = property(lambda self: self._get_more('leng'), lambda self, x: self._set_more('leng', x))
+    extra = property(lambda self: self._get_more('extra'), lambda self, x: self._set_more('extra', x))
+    column = property(lambda self: self._get_more('column'), lambda self, x: self._set_more('column', x))
+    lloc = property(lambda self: self._get_more('lloc'), lambda self, x: self._set_more('lloc', x))
+
+
+# State of a lexer saved by Lexer.snapshot(): where it is in the input, the
+# lexer state and state stack (as a tuple), the text kept by more() and the
+# offset set by less() in the current token handler (or -1)
+LexerSnapshot = namedtuple('LexerSnapshot', 'lexpos lineno state stack more less')
+
+
+class TokenTypes:
+    """
+    Symbol table of the token types of a lexer class, numbered from 0.
+
+    The types of the rules and their keywords are numbered when the class
+    is created, in the order of the rules, and then the types listed in the
+    tokens attribute of the class, like the ones returned by token handlers.
+    """
+
+    def __init__(self, names=()):
+        self.names = []  # type code -> token type
+        self.codes = {}  # token type -> type code
+        self._lock = threading.Lock()
+        for name in names:
+            self.add(name)
+
+    def __getstate__(self):
+        return self.names
+
+    def __setstate__(self, names):
+        self.__init__(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """
+        Return the code of a token type, numbering it if it's new.
+        """
+        code = self.codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(name)
+                if code is None:
+                    self.names.append(name)
+                    code = self.codes[name] = len(self.names) - 1
+        return code
+
+    def enum(self, name='TokenType'):
+        """
+        Return an IntEnum of the token types numbered so far. The types which
+        aren't identifiers, or which start with an underscore, are left out.
+        """
+        return enum.IntEnum(name, [(t, code) for code, t in enumerate(self.names)
+                                   if isinstance(t, str) and t.isidentifier() and not t.startswith('_')])
+
+
+class TokenColumns:
+    """
+    Tokens in columnar form, as returned by Lexer.tokenize_all().
+
+    Token types are stored as integer codes into type_names, and positions as
+    offsets into lexdata. Token text is only sliced when asked for. The codes
+    are the ones of token_types, which starts as a copy of the TokenTypes of
+    the lexer class for the columns made by a lexer. Types the class doesn't
+    know are numbered after its own, in these columns only.
+    """
+
+    def __init__(self, lexdata, checkpoints=False, token_types=None):
+        self.lexdata = lexdata
+        self.token_types = TokenTypes(() if token_types is None else token_types.names)
+        self.type_names = self.token_types.names  # type code -> token type
+        self.type_codes = self.token_types.codes  # token type -> type code
+        self.types = array('I')
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.lines = array('I')
+
+        # With checkpoints, the state of the lexer after each token:
+        # where it resumes, (state, state stack, more() text) and lineno,
+        # and how far the scans up to it looked into the input
+        self.checkpoints = array('Q') if checkpoints else None
+        self.checkpoint_states = array('I')
+        self.checkpoint_lines = array('I')
+        self.looks = array('Q')
+        self.state_names = []  # state code -> (state, stack, more)
+        self.state_codes = {}  # (state, stack, more) -> state code
+
+    no_state = 0xffffffff  # state code of checkpoints where lexing can't resume
+
+    def append(self, char, start, end, lineno):
+        code = self.type_codes.get(char)
+        if code is None:
+            code = self.token_types.add(char)
+        self.types.append(code)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(lineno)
+
+    def checkpoint(self, lexer, resume):
+        """
+        Record the state of the lexer after the last token appended.
+        """
+        self.checkpoints.append(resume)
+        if lexer is None:
+            self.checkpoint_states.append(self.no_state)
+            self.checkpoint_lines.append(0)
+            self.looks.append(max(self.looks[-1], resume) if self.looks else resume)
+            return
+        self.looks.append(max(lexer._lex_look, resume))
+        state = (lexer._active_state, tuple(lexer._state_stack), lexer._lex_more_buffer or '')
+        self.checkpoint_states.append(self._state_code(state))
+        self.checkpoint_lines.append(lexer.lineno)
+
+    def _state_code(self, state):
+        code = self.state_codes.get(state)
+        if code is None:
+            code = self.state_codes[state] = len(self.state_names)
+            self.state_names.append(state)
+        return code
+
+    def extend(self, other, line_offset=0, pos_offset=0, first=0, last=None):
+        """
+        Append the tokens of another TokenColumns (from first to last),
+        adding line_offset to their line numbers and pos_offset to their
+        positions.
+        """
+        def shifted(a, offset):
+            a = a if first == 0 and last is None else a[first:last]
+            return array(a.typecode, map(offset.__add__, a)) if offset else a
+
+        table = list(map(self.token_types.add, other.type_names))
+        types = shifted(other.types, 0)
+        self.types.extend(types if table == list(range(len(table))) else array('I', map(table.__getitem__, types)))
+        self.starts.extend(shifted(other.starts, pos_offset))
+        self.ends.extend(shifted(other.ends, pos_offset))
+        self.lines.extend(shifted(other.lines, line_offset))
+
+        if self.checkpoints is not None:
+            table = [self._state_code(state) for state in other.state_names]
+            states = shifted(other.checkpoint_states, 0)
+            self.checkpoints.extend(shifted(other.checkpoints, pos_offset))
+            self.checkpoint_states.extend(array('I', (table[c] if c != self.no_state else c for c in states)))
+            self.checkpoint_lines.extend(shifted(other.checkpoint_lines, line_offset))
+            self.looks.extend(shifted(other.looks, pos_offset))
+
+    def __len__(self):
+        return len(self.types)
+
+    def type(self, i):
+        return self.type_names[self.types[i]]
+
+    def text(self, i):
+        return self.lexdata[self.starts[i]:self.ends[i]]
+
+    def to_numpy(self):
+        """
+        Return the columns as NumPy arrays sharing the memory of this object.
+        """
+        import numpy
+        return {name: numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+                for name in ('types', 'starts', 'ends', 'lines')}
+
+
+class LexInputView:
+    """
+    The rest of the input from a position, without copying it.
+
+    Error tokens and LexError carry this instead of lexdata[lexpos:], so a
+    lexing error costs the same whatever the size of the remaining input.
+    Indexing, slicing, len() and the search methods work on lexdata in
+    place; anything else works on the text, which is sliced on first use.
+    """
+
+    def __init__(self, data, start):
+        self.data = data
+        self.start = start
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.data[self.start:]
+        return self._text
+
+    def __len__(self):
+        return len(self.data) - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self.text[key]
+            return self.data[self.start + start:self.start + max(start, stop)]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('index out of range')
+        return self.data[self.start + key]
+
+    def __iter__(self):
+        return (self.data[i] for i in range(self.start, len(self.data)))
+
+    def _found(self, i):
+        return i if i < 0 else i - self.start
+
+    def startswith(self, prefix, start=0):
+        return self.data.startswith(prefix, self.start + start)
+
+    def find(self, sub, start=0):
+        return self._found(self.data.find(sub, self.start + start))
+
+    def index(self, sub, start=0):
+        return self.data.index(sub, self.start + start) - self.start
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)  # e.g. while being copied, before __init__
+        return getattr(self.text, name)
+
+    def __reduce__(self):
+        # copied and pickled as the text it stands for
+        return type(self.text), (self.text,)
+
+    def __eq__(self, other):
+        return self.text == (other.text if isinstance(other, LexInputView) else other)
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __str__(self):
+        return str(self.text)
 
     def __repr__(self):
-        return 'LexToken(%s,%r,%d,%d)' % (self.char, self.lval, self.lineno, self.lexpos)
+        return repr(self.text)
+
+
+class IncrementalTokens:
+    """
+    Tokens of lexdata with the state of the lexer after each of them, as
+    returned by Lexer.tokenize_incremental() and Lexer.relex().
+
+    The tokens are held as segments of TokenColumns, each shifted by a
+    position and a line offset, so an edit shares the tokens it doesn't
+    change with the tokens before the edit instead of copying them.
+    """
+
+    max_segments = 64
+
+    def __init__(self, lexdata, initial, segments):
+        self.lexdata = lexdata
+        self.initial = initial  # state of the lexer before the first token
+        self.segments = [seg for seg in segments if seg[2] > seg[1]]  # (columns, first, last, pos, line offset)
+        if len(self.segments) > self.max_segments:
+            self.segments = [(self.to_columns(), 0, sum(seg[2] - seg[1] for seg in self.segments), 0, 0)]
+        self._bounds = [0]
+        for columns, first, last, _, _ in self.segments:
+            self._bounds.append(self._bounds[-1] + last - first)
+
+    def __len__(self):
+        return self._bounds[-1]
+
+    def _locate(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError('token index out of range')
+        k = bisect.bisect_right(self._bounds, i) - 1
+        columns, first, last, pos_offset, line_offset = self.segments[k]
+        return columns, first + i - self._bounds[k], pos_offset, line_offset
+
+    def type(self, i):
+        columns, j, _, _ = self._locate(i)
+        return columns.type_names[columns.types[j]]
+
+    def start(self, i):
+        columns, j, pos_offset, _ = self._locate(i)
+        return columns.starts[j] + pos_offset
+
+    def end(self, i):
+        columns, j, pos_offset, _ = self._locate(i)
+        return columns.ends[j] + pos_offset
+
+    def line(self, i):
+        columns, j, _, line_offset = self._locate(i)
+        return columns.lines[j] + line_offset
+
+    def text(self, i):
+        return self.lexdata[self.start(i):self.end(i)]
+
+    def resume(self, i):
+        """
+        Return the offset where lexing resumes after token i.
+        """
+        if i < 0:
+            return self.initial[0]
+        columns, j, pos_offset, _ = self._locate(i)
+        return columns.checkpoints[j] + pos_offset
+
+    def checkpoint(self, i):
+        """
+        Return the state of the lexer after token i (before the first one
+        if i is -1) as (lexpos, state, stack, more() text, lineno), or None if
+        lexing can't resume there.
+        """
+        if i < 0:
+            return self.initial
+        columns, j, pos_offset, line_offset = self._locate(i)
+        code = columns.checkpoint_states[j]
+        if code == columns.no_state:
+            return None
+        return ((columns.checkpoints[j] + pos_offset,) + columns.state_names[code]
+                + (columns.checkpoint_lines[j] + line_offset,))
+
+    def look(self, i):
+        """
+        Return how far the scans up to token i looked into lexdata.
+        """
+        if i < 0:
+            return self.initial[0]
+        columns, j, pos_offset, _ = self._locate(i)
+        return columns.looks[j] + pos_offset
+
+    def find_resume(self, pos):
+        """
+        Return the index of the first token after which lexing resumes at
+        pos or later, or len(self) if there's none.
+        """
+        for k, (columns, first, last, pos_offset, _) in enumerate(self.segments):
+            if columns.checkpoints[last - 1] + pos_offset >= pos:
+                j = bisect.bisect_left(columns.checkpoints, pos - pos_offset, first, last)
+                return self._bounds[k] + j - first
+        return len(self)
+
+    def find_checkpoint(self, pos):
+        """
+        Return the index of the last token after which lexing can resume at
+        pos or before, or -1 for the start of the input.
+        """
+        i = self.find_resume(pos + 1) - 1
+        while i >= 0 and self.checkpoint(i) is None:
+            i -= 1
+        return i
+
+    def find_unseen(self, pos):
+        """
+        Return the index of the last token after which lexing can resume,
+        with the scans up to it having looked before pos only, or -1.
+        """
+        i = len(self)
+        for k, (columns, first, last, pos_offset, _) in enumerate(self.segments):
+            if columns.looks[last - 1] + pos_offset > pos:
+                i = self._bounds[k] + bisect.bisect_right(columns.looks, pos - pos_offset, first, last) - first
+                break
+        i -= 1
+        while i >= 0 and self.checkpoint(i) is None:
+            i -= 1
+        return i
+
+    def _slice(self, lo, hi, pos_offset=0, line_offset=0):
+        """
+        Return the segments of tokens lo to hi, shifted by the offsets.
+        """
+        segments = []
+        for k, (columns, first, last, pos, line) in enumerate(self.segments):
+            a, b = max(lo - self._bounds[k], 0), min(hi - self._bounds[k], last - first)
+            if a < b:
+                segments.append((columns, first + a, first + b, pos + pos_offset, line + line_offset))
+        return segments
+
+    def to_columns(self):
+        """
+        Return all the tokens as one TokenColumns.
+        """
+        token_types = self.segments[0][0].token_types if self.segments else None
+        columns = TokenColumns(self.lexdata, True, token_types)
+        for other, first, last, pos_offset, line_offset in self.segments:
+            columns.extend(other, line_offset, pos_offset, first, last)
+        return columns
+
+
+class TokenBuffer:
+    """
+    Lookahead over the tokens of a lexer, as returned by Lexer.lookahead().
+
+    Tokens are lexed when peek() or next() first reaches them, and only
+    once: reset() goes back over buffered tokens without lexing them again.
+    Their handlers ran when they were lexed, so the lexer (its state,
+    lineno, lexpos) is after the last buffered token, not after the last
+    token returned by next(). snapshot() is the state after the latter, and
+    sync() moves the lexer back to it, dropping the tokens lexed ahead, for
+    a parser to change the state of the lexer.
+    """
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self._tokens = deque()  # from the first mark, or the next token
+        self._snaps = deque()   # state of the lexer after each token
+        self._start = lexer.snapshot()  # state before the first token
+        self._first = 0         # index of the first token in the input
+        self._pos = 0           # index of the next token
+        self._marks = []
+        self._ended = False
+
+    def _fill(self, n):
+        """
+        Lex until n tokens from the next one are buffered, or return False
+        at the end of the input.
+        """
+        tokens, snaps, lexer = self._tokens, self._snaps, self.lexer
+        while len(tokens) < self._pos - self._first + n:
+            tok = None if self._ended else lexer.token()
+            if tok is None:
+                self._ended = True
+                return False
+            tokens.append(tok)
+            snaps.append(lexer.snapshot())
+        return True
+
+    def _trim(self):
+        keep = self._marks[0] if self._marks else self._pos
+        while self._first < keep:
+            self._tokens.popleft()
+            self._start = self._snaps.popleft()
+            self._first += 1
+
+    def peek(self, k=1):
+        """
+        Return the k-th next token, from 1, without consuming it, or None
+        after the end of the input.
+        """
+        if k < 1:
+            raise ValueError('peek() counts tokens from 1')
+        if not self._fill(k):
+            return None
+        return self._tokens[self._pos - self._first + k - 1]
+
+    def next(self):
+        """
+        Consume and return the next token, or None at the end of the input.
+        """
+        if not self._fill(1):
+            return None
+        tok = self._tokens[self._pos - self._first]
+        self._pos += 1
+        if not self._marks:
+            self._trim()
+        return tok
+
+    def mark(self):
+        """
+        Remember the position of the next token, for reset(), and return
+        its index. Marks are nested: reset() and release() end the last one.
+        """
+        self._marks.append(self._pos)
+        return self._pos
+
+    def reset(self):
+        """
+        Go back to the last mark, and end it.
+        """
+        self._pos = self._marks.pop()
+        self._trim()
+
+    def release(self):
+        """
+        End the last mark, keeping the position.
+        """
+        self._marks.pop()
+        self._trim()
+
+    def snapshot(self):
+        """
+        Return the state of the lexer after the last consumed token, as a
+        LexerSnapshot.
+        """
+        if self._pos == self._first:
+            return self._start
+        return self._snaps[self._pos - self._first - 1]
+
+    def sync(self):
+        """
+        Drop the tokens after the position, and restore the lexer to the
+        state after the last consumed token. They are lexed again, in the
+        state the lexer is then put in.
+        """
+        keep = self._pos - self._first
+        while len(self._tokens) > keep:
+            self._tokens.pop()
+            self._snaps.pop()
+        self._ended = False
+        self.lexer.restore(self.snapshot())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        tok = self.next()
+        if tok is None:
+            raise StopIteration
+        return tok
+
+
+class MappedFileInput:
+    """
+    Memory-mapped input file, decoded lazily by chunks.
+
+    The offset pair (characters, bytes) at the end of every decoded chunk is
+    recorded, so a character offset is mapped to a byte offset by decoding
+    at most one chunk again.
+    """
+
+    def __init__(self, path, encoding=None):
+        self.encoding = encoding
+        with open(path, 'rb') as fd:
+            try:
+                self.mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.mmap = b''  # an empty file can't be mapped
+        self._marks_chars = [0]
+        self._marks_bytes = [0]
+
+    def chunks(self, chunk_size):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        data, end, chars = self.mmap, 0, 0
+        while end < len(data):
+            start, end = end, min(end + chunk_size, len(data))
+            text = decoder.decode(data[start:end], final=end == len(data))
+            chars += len(text)
+            # bytes of a character split by the chunk end are kept in decoder
+            self._marks_chars.append(chars)
+            self._marks_bytes.append(end - len(decoder.getstate()[0]))
+            yield text
+
+    def byte_offset(self, pos):
+        if self.encoding is None:
+            return pos
+        i = bisect.bisect_right(self._marks_chars, pos) - 1
+        chars, start = self._marks_chars[i], self._marks_bytes[i]
+        if chars == pos or i + 1 == len(self._marks_chars):
+            return start
+        text = codecs.decode(self.mmap[start:self._marks_bytes[i + 1]], self.encoding)
+        return start + len(codecs.encode(text[:pos - chars], self.encoding))
+
+
+class AsyncChunks:
+    """
+    Chunk iterator of Lexer.atokens(), fed with the chunks as they are read.
+    When no chunk has come yet, it returns STREAM_WAIT, and token() returns
+    STREAM_WAIT to wait for more data.
+    """
+
+    def __init__(self):
+        self.chunks = deque()
+        self.ended = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.chunks:
+            return self.chunks.popleft()
+        if self.ended:
+            raise StopIteration
+        return STREAM_WAIT
+
+
+STREAM_WAIT = object()
+
+
+class _ChunkUntrusted(Exception):
+    pass
+
+
+def _tokenize_chunk(lexer, text, start, end):
+    """
+    Lex a chunk of tokenize_parallel() in a worker process. The chunk starts
+    at offset start of the whole input, and lexing stops at offset end.
+    Return the tokens and the state of the lexer, or None on errors, or if
+    a match may have been cut by the end of the text.
+    """
+    try:
+        # each chunk needs its own copy when the executor runs threads
+        lexer = copy.deepcopy(lexer)
+        lexer._worker_start()
+        if start:
+            lexer.begin('INITIAL')
+            lexer._state_stack = []
+            lexer.lineno = 1
+        lexer.input(text)
+        lexer._lexbase = lexer.lexpos = start
+        lexer._lex_end = None if end is None else end - start
+        lexer._lex_window = end is not None
+        columns = lexer.tokenize_all()
+        columns.lexdata = None
+        return columns, lexer._get_sync_state()
+    except Exception:
+        return None  # lexed again by the caller, which reports the error if it's real
 
 
 class LexerAtomRule:
@@ -57,6 +748,7 @@ class LexerAtomRule:
         self.token_handler = None
         self.token_type = None
         self.token_value_handler = None
+        self.keywords = None
 
     def __repr__(self):
         s = 'LexerAtomRule(%s, %s)->' % (self.state, self.pattern)
@@ -90,10 +782,180 @@ def get_constant_pattern(pattern):
             break
         chars.append(t[1])
     else:
+        if isinstance(pattern, bytes):
+            return bytes(chars)
         return ''.join((chr(c) for c in chars))
     return None
 
 
+_fold_table = None
+# characters which fold_case leaves as they are though re.IGNORECASE equates
+# them with others, because they aren't alphanumeric like their equals and
+# \w and \b must see the same on the folded text
+_fold_kept = None
+
+
+def _get_fold_table():
+    """
+    Some characters are equal to others under re.IGNORECASE but not after
+    lower(), e.g. the long s and 's'. Map each of them to one representative.
+    """
+    global _fold_table, _fold_kept
+    if _fold_table is None:
+        try:
+            import sre_compile
+            cases = getattr(sre_compile, '_EXTRA_CASES', None)\
+                or getattr(sre_compile, '_ignorecase_fixes', {})
+        except ImportError:
+            cases = {}
+        cases = {c: [x for x in (c,) + others if chr(x).isalnum()] for c, others in cases.items()}
+        _fold_kept = ''.join(chr(c) for c in cases if not chr(c).isalnum())
+        _fold_table = {c: min(others) for c, others in cases.items() if chr(c).isalnum() and min(others) < c}
+    return _fold_table
+
+
+def fold_case(s):
+    """
+    Lowercase a string the way re.IGNORECASE compares characters, keeping its
+    length. A character whose lowercase form is longer takes its first
+    character, which is the simple lowercase used by re.IGNORECASE. Bytes are
+    folded in ASCII, like bytes patterns are.
+    """
+    if not isinstance(s, str):
+        return bytes(s).lower()
+    folded = s.lower()
+    if len(folded) != len(s):
+        folded = ''.join(c.lower()[0] for c in s)
+    return folded.translate(_get_fold_table())
+
+
+_AT_CODES = {'AT_BEGINNING': '^', 'AT_BEGINNING_STRING': '\\A', 'AT_END': '$',
+             'AT_END_STRING': '\\Z', 'AT_BOUNDARY': '\\b', 'AT_NON_BOUNDARY': '\\B'}
+_CATEGORY_CODES = {'CATEGORY_DIGIT': '\\d', 'CATEGORY_NOT_DIGIT': '\\D', 'CATEGORY_SPACE': '\\s',
+                   'CATEGORY_NOT_SPACE': '\\S', 'CATEGORY_WORD': '\\w', 'CATEGORY_NOT_WORD': '\\W'}
+
+
+def _fold_pattern(pattern, flags, max_range=0x1000):
+    """
+    Rewrite a regex pattern to run on the folded input of the case-fold mode.
+    Each literal and set becomes the set of folded characters it matches under
+    re.IGNORECASE, so the pattern compiles without IGNORECASE. Return the new
+    pattern and flags, or the given ones if the pattern can't be rewritten.
+    """
+    try:
+        import sre_parse
+        tree = sre_parse.parse(pattern, flags)
+    except ImportError:
+        return pattern, flags
+    tree_flags = tree.state.flags
+    if not tree_flags & re.IGNORECASE or tree_flags & (re.LOCALE | re.ASCII):
+        return pattern, flags
+    is_bytes = isinstance(pattern, bytes)
+    names = {gid: name for name, gid in tree.state.groupdict.items()}
+
+    def char(c):
+        if c < 0x80 and (chr(c).isalnum() or chr(c) == '_'):
+            return chr(c)
+        return ('\\x%02x' if c < 0x100 else '\\u%04x' if c < 0x10000 else '\\U%08x') % c
+
+    def folded_set(items):
+        # the folded characters matched by the literals and ranges of a set
+        chars = set()
+        for op_, av_ in items:
+            lo, hi = (av_, av_) if str(op_) == 'LITERAL' else av_
+            if hi - lo > max_range:
+                raise ValueError('range too large to fold')
+            chars.update(range(lo, hi + 1))
+        if is_bytes:
+            candidates = {bytes((c,)).lower()[0] for c in chars}
+        else:
+            # the folded forms of the characters, and the characters equal
+            # to others under re.IGNORECASE which fold_case handles apart
+            candidates = {ord(fold_case(chr(c))) for c in chars}
+            candidates.update(_get_fold_table().values(), map(ord, _fold_kept))
+        match = _predicate(('item', (sre_parse.IN, items), tree_flags, is_bytes))
+        return sorted(c for c in candidates if match(c if is_bytes else chr(c)))
+
+    def char_set(items, negate=False):
+        chars = folded_set([(op_, av_) for op_, av_ in items if str(op_) in ('LITERAL', 'RANGE')])
+        parts = []
+        for op_, av_ in items:
+            if str(op_) == 'NEGATE':
+                negate = not negate
+            elif str(op_) == 'CATEGORY':
+                parts.append(_CATEGORY_CODES[str(av_)])
+            elif str(op_) not in ('LITERAL', 'RANGE'):
+                raise ValueError('unknown set item %s' % op_)
+        i = 0
+        while i < len(chars):
+            j = i
+            while j + 1 < len(chars) and chars[j + 1] == chars[j] + 1:
+                j += 1
+            if j - i >= 2:
+                parts.append('%s-%s' % (char(chars[i]), char(chars[j])))
+            else:
+                parts.extend(char(c) for c in chars[i:j + 1])
+            i = j + 1
+        if len(parts) == 1 and len(chars) <= 1 and not negate:
+            return parts[0]
+        return '[%s%s]' % ('^' if negate else '', ''.join(parts))
+
+    def unparse(tree):
+        return ''.join(unparse_item(op, av) for op, av in tree)
+
+    def unparse_item(op, av):
+        name = str(op)
+        if name in ('LITERAL', 'NOT_LITERAL'):
+            return char_set([(sre_parse.LITERAL, av)], name == 'NOT_LITERAL')
+        elif name == 'IN':
+            return char_set(av)
+        elif name == 'ANY':
+            return '.'
+        elif name == 'AT':
+            return _AT_CODES[str(av)]
+        elif name == 'BRANCH':
+            return '(?:%s)' % '|'.join(unparse(p) for p in av[1])
+        elif name == 'SUBPATTERN':
+            group, add_flags, del_flags, p = av
+            if add_flags or del_flags:
+                raise ValueError('inline flags')
+            if group is None:
+                return '(?:%s)' % unparse(p)
+            elif group in names:
+                return '(?P<%s>%s)' % (names[group], unparse(p))
+            return '(%s)' % unparse(p)
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            lo, hi, p = av
+            hi = '' if str(hi) == 'MAXREPEAT' else hi
+            count = {(0, ''): '*', (1, ''): '+', (0, 1): '?'}.get((lo, hi), '{%s,%s}' % (lo, hi))
+            suffix = {'MAX_REPEAT': '', 'MIN_REPEAT': '?', 'POSSESSIVE_REPEAT': '+'}[name]
+            body = unparse(p)
+            if len(p) != 1 or str(p[0][0]) not in SRE_CHAR_ITEMS:
+                body = '(?:%s)' % body
+            return body + count + suffix
+        elif name in ('ASSERT', 'ASSERT_NOT'):
+            direction, p = av
+            return '(?%s%s%s)' % ('<' if direction < 0 else '', '=' if name == 'ASSERT' else '!', unparse(p))
+        elif name == 'ATOMIC_GROUP':
+            return '(?>%s)' % unparse(av)
+        elif name == 'GROUPREF_EXISTS':
+            group, yes, no = av
+            return '(?(%d)%s|%s)' % (group, unparse(yes), unparse(no) if no is not None else '')
+        # backreferences compare ignoring case, which the folded input can't do
+        raise ValueError('unsupported item %s' % name)
+
+    try:
+        folded = unparse(tree)
+        if is_bytes:
+            folded = folded.encode('latin-1')
+        folded_flags = tree_flags & ~(re.IGNORECASE | re.VERBOSE)
+        if re.compile(folded, folded_flags).groupindex != re.compile(pattern, flags).groupindex:
+            return pattern, flags
+    except (ValueError, KeyError, re.error):
+        return pattern, flags
+    return folded, folded_flags
+
+
 def match_constant_pattern(pattern, ignorecase, s, start=0, end=None):
     if end is None:
         ss = s[start:start+len(pattern)]
@@ -114,149 +976,1837 @@ def inject_pattern_definition(s, d):
     return s
 
 
-class RuleAdder(object):
-    def __init__(self, lexer, targets: list):
-        self.lexer = lexer
-        self.rule_list = []
-        self.preset_targets = targets[:]
+class RuleAdder(object):
+    def __init__(self, lexer, targets: list):
+        self.lexer = lexer
+        self.rule_list = []
+        self.preset_targets = targets[:]
+
+    def parse_target(self, tar):
+        rule_list = self.rule_list
+
+        def append_rule(state, pattern):
+            rule = LexerAtomRule()
+            rule.pattern, rule.state = pattern, state
+            rule_list.append(rule)
+
+        if len(tar) == 1:
+            state, pattern = None, tar[0]
+        elif len(tar) == 2:
+            state, pattern = tar
+        else:
+            raise TypeError('Invalid value. Accept only "pattern" or "(state, pattern)".')
+
+        if isinstance(pattern, list):
+            for t in pattern:
+                if isinstance(t, tuple):
+                    if state is not None:
+                        raise TypeError('Duplicate state assignment.')
+                    self.parse_target(t)
+                else:
+                    self.parse_target((state, t))
+        elif isinstance(state, (list, tuple)):
+            for s in state:
+                append_rule(s, pattern)
+        else:
+            append_rule(state, pattern)
+
+    def __call__(self, f, value=None, keywords=None):
+        self.parse_target(self.preset_targets)
+        rule_list = self.rule_list
+
+        f_callable = callable(f)
+        if f_callable:
+            if keywords is not None:
+                raise TypeError('Keywords need a token type, not a handler.')
+            for r in rule_list:
+                r.token_handler = f
+        else:
+            for r in rule_list:
+                if r.pattern == '__error__':
+                    raise TypeError('Error handler must be callable.')
+                r.token_type = f
+                r.token_value_handler = value
+                r.keywords = keywords
+
+        self.lexer._rules += rule_list
+        if f_callable:
+            return f
+
+    def __enter__(self):
+        return lambda *headers:\
+            self.__class__(self.lexer, self.preset_targets + list(headers))
+
+    def __exit__(self, *args):
+        pass
+
+
+def _normalize_states(lexer, state_list):
+    try:
+        _ = iter(state_list)
+    except TypeError:
+        raise TypeError("'states' must be iterable.")
+
+    for s in state_list:
+        if not isinstance(s, tuple) or len(s) != 2:
+            raise TypeError("Invalid state specifier %s. Must be a tuple (statename,'exclusive|inclusive')" % repr(s))
+
+        if s[0] == 's' or s[0] == 'x':
+            state_type, state_name = s
+        elif s[1] == 'inclusive' or s[1] == 'exclusive':
+            state_name, state_type = s
+        else:
+            raise ValueError("State type for state %s must be 'inclusive' or 'exclusive'" % state_name)
+
+        if state_name in lexer._states:
+            raise ValueError("State '%s' already defined" % state_name)
+        if state_type == 'x' or state_type == 'exclusive':
+            state_flag = 'exclusive'
+        elif state_type == 's' or state_type == 'inclusive':
+            state_flag = 'inclusive'
+        lexer._states[state_name] = state_flag
+
+
+MATCHER_MATCH_MODE_STR = 1
+MATCHER_MATCH_MODE_REG = 2
+MATCHER_HANDLER_TYPE_TOKEN = 1
+MATCHER_HANDLER_TYPE_TPVAL = 2
+
+
+def _scan_matchers(matchers, ignorecase, lexdata, lexpos):
+    """
+    Try every matcher at lexpos and pick the longest match.
+    The earliest matcher wins if several ones have the same length.
+    """
+    match_obj, match_endpos, match_group, match_len, matcher = None, 0, '', 0, None
+
+    for mr in matchers:
+        match_mode, pattern, regex = mr[0:3]
+
+        # match mode 1: simple string match
+        if match_mode == MATCHER_MATCH_MODE_STR:
+            m_obj = match_constant_pattern(pattern, ignorecase, lexdata, lexpos)
+            if not m_obj:
+                continue
+            m_group = m_obj
+            m_len = len(m_group)
+            m_endpos = lexpos + m_len
+
+        # match mode 2: regex match
+        elif match_mode == MATCHER_MATCH_MODE_REG:
+            m_obj = regex.match(lexdata, lexpos)
+            if not m_obj:
+                continue
+            m_group = m_obj.group()
+            m_len = len(m_group)
+            m_endpos = m_obj.end()
+
+        # override previous match info
+        if match_obj is None or m_len > match_len:
+            match_obj, match_endpos, match_group, match_len, matcher\
+                = m_obj, m_endpos, m_group, m_len, mr
+
+    if match_obj is None:
+        return None
+    return match_obj, match_endpos, match_group, matcher
+
+
+# opcodes of sre_parse which match exactly one character
+SRE_CHAR_ITEMS = ('LITERAL', 'NOT_LITERAL', 'ANY', 'IN')
+
+
+def _predicate(desc):
+    """
+    Return a function telling whether a character matches, from a picklable
+    description of the predicate:
+        ('eq', c)               the character c
+        ('lower', c)            a character whose lowercase is c
+        ('ignorecase', c)       c ignoring case as re does
+        ('item', item, flags)   a single character item of a parsed pattern
+    Characters of bytes are ints. The description ends with is_bytes.
+    """
+    import sre_parse
+    import sre_compile
+    kind, is_bytes = desc[0], desc[-1]
+    if kind == 'eq':
+        return desc[1].__eq__
+    elif kind == 'lower' and is_bytes:
+        return lambda x, c=desc[1]: bytes((x,)).lower() == c
+    elif kind == 'lower':
+        return lambda x, c=desc[1]: x.lower() == c
+    elif kind == 'ignorecase':
+        c = bytes((desc[1],)) if is_bytes else desc[1]
+        match = re.compile(re.escape(c), re.IGNORECASE).match
+    else:
+        state = sre_parse.State()
+        state.flags = desc[2]
+        match = sre_compile.compile(sre_parse.SubPattern(state, [desc[1]]), desc[2]).match
+    if is_bytes:
+        return lambda x: match(bytes((x,)))
+    return match
+
+
+def _char_item(tree, item, flags, is_bytes=False):
+    """
+    Return the predicate description of a single character item.
+    """
+    return ('item', item, tree.state.flags | flags, is_bytes)
+
+
+def _char_predicate(tree, item, flags, is_bytes=False):
+    """
+    Return a function telling whether a character matches the given
+    single character item of a parsed pattern. Characters of bytes are ints.
+    """
+    return _predicate(_char_item(tree, item, flags, is_bytes))
+
+
+def _first_chars(tree, flags, is_bytes=False):
+    """
+    Collect predicate descriptions of the characters a parsed pattern can
+    start with. Return (descriptions, nullable), or None if the pattern can't
+    be analysed.
+    """
+    preds = []
+    for op, av in tree:
+        name = str(op)
+        if name in SRE_CHAR_ITEMS:
+            preds.append(_char_item(tree, (op, av), flags, is_bytes))
+            return preds, False
+        elif name in ('SUBPATTERN', 'ATOMIC_GROUP'):
+            if name == 'SUBPATTERN':
+                group, add_flags, del_flags, av = av
+                if add_flags or del_flags:
+                    return None
+            first = _first_chars(av, flags, is_bytes)
+        elif name == 'BRANCH':
+            first = [], False
+            for p in av[1]:
+                f = _first_chars(p, flags, is_bytes)
+                if f is None:
+                    return None
+                first = first[0] + f[0], first[1] or f[1]
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            lo, hi, p = av
+            first = _first_chars(p, flags, is_bytes)
+            if first is not None and lo == 0:
+                first = first[0], True
+        elif name in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            continue  # zero-width items, look at the next one
+        else:
+            return None
+
+        if first is None:
+            return None
+        preds += first[0]
+        if not first[1]:
+            return preds, False
+    return preds, True
+
+
+def _count_newlines(data, newline, start, end):
+    try:
+        return data.count(newline, start, end)
+    except AttributeError:
+        # mmap has no count()
+        n, start = 0, data.find(newline, start, end)
+        while start >= 0:
+            n, start = n + 1, data.find(newline, start + 1, end)
+        return n
+
+
+def _can_match_char(tree, c, flags, is_bytes=False):
+    """
+    Check whether a parsed pattern can consume character c (an int for
+    bytes). Items which can't be analysed are assumed to be able to.
+    """
+    for op, av in tree:
+        name = str(op)
+        if name in SRE_CHAR_ITEMS:
+            if _char_predicate(tree, (op, av), flags, is_bytes)(c):
+                return True
+        elif name in ('SUBPATTERN', 'ATOMIC_GROUP', 'BRANCH', 'MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            sub_flags = flags
+            if name == 'SUBPATTERN':
+                group, add_flags, del_flags, p = av
+                subs, sub_flags = [p], (flags | add_flags) & ~del_flags
+            elif name == 'BRANCH':
+                subs = av[1]
+            elif name == 'ATOMIC_GROUP':
+                subs = [av]
+            else:
+                subs = [av[-1]]
+            if any(_can_match_char(p, c, sub_flags, is_bytes) for p in subs):
+                return True
+        elif name not in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            return True
+    return False
+
+
+def _rule_chars(mr, ignorecase):
+    """
+    Return the set of characters (ints for bytes) a rule matches one or
+    more of at a time, if it matches nothing else, or None.
+    """
+    import sre_parse
+    match_mode, pattern = mr[0:2]
+    is_bytes = isinstance(pattern, bytes)
+    if match_mode == MATCHER_MATCH_MODE_STR:
+        if len(pattern) != 1 or ignorecase and pattern.lower() != pattern.upper():
+            return None
+        return {pattern[0]}
+
+    flags = mr[2].flags
+    tree = sre_parse.parse(pattern, flags)
+    if len(tree) == 1 and str(tree[0][0]) in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        lo, hi, sub = tree[0][1]
+        if lo != 1 or hi != 1 and str(hi) != 'MAXREPEAT':
+            return None
+        tree = sub
+    if len(tree) != 1 or str(tree[0][0]) not in ('LITERAL', 'IN'):
+        return None
+    return _desc_chars(_char_item(tree, tree[0], flags, is_bytes))
+
+
+def _desc_chars(desc):
+    """
+    Return the set of characters (ints for bytes) matched by the predicate
+    description of a single character item, if it's a small one, or None.
+    """
+    kind, (op, av), flags, is_bytes = desc
+    if str(op) not in ('LITERAL', 'IN'):
+        return None
+
+    # the candidates are all the characters the item could match
+    if is_bytes:
+        candidates = range(256)
+    else:
+        candidates = set()
+        for item_op, item_av in [(op, av)] if str(op) == 'LITERAL' else av:
+            name = str(item_op)
+            if name == 'LITERAL':
+                candidates.add(chr(item_av))
+            elif name == 'RANGE' and item_av[1] - item_av[0] < 256:
+                candidates.update(map(chr, range(item_av[0], item_av[1] + 1)))
+            elif name == 'CATEGORY' and str(item_av) in ('CATEGORY_SPACE', 'CATEGORY_UNI_SPACE'):
+                candidates.update(c for c in map(chr, range(0x3001)) if c.isspace())
+            else:
+                return None
+        if flags & re.IGNORECASE and any(c.lower() != c.upper() for c in candidates):
+            return None
+    pred = _predicate(desc)
+    return {c for c in candidates if pred(c)}
+
+
+def _disjoint(descs, other_descs):
+    """
+    Check whether no character matches both a predicate description of
+    descs and one of other_descs. Unknown sets are assumed to meet.
+    """
+    for desc in descs:
+        chars = _desc_chars(desc)
+        for other in other_descs:
+            if chars is not None:
+                if any(map(_predicate(other), chars)):
+                    return False
+                continue
+            other_chars = _desc_chars(other)
+            if other_chars is None or any(map(_predicate(desc), other_chars)):
+                return False
+    return True
+
+
+def _skip_pattern(matchers, ignorecase):
+    """
+    Merge the ignored rules of a state which match runs of single characters
+    (like whitespace) into one pattern, which consumes a whole run at once.
+    A rule is merged only if no other rule can start with its characters,
+    so the longest match at any of them is one of the merged rules.
+    Return the pattern, or None.
+    """
+    import sre_parse
+    chars, others = set(), []
+    for mr in matchers:
+        merged = None
+        if mr[3] == MATCHER_HANDLER_TYPE_TPVAL and mr[4] is None and mr[7] is None:
+            merged = _rule_chars(mr, ignorecase)
+        if merged:
+            chars |= merged
+        else:
+            others.append(mr)
+    if not chars:
+        return None
+
+    for mr in others:
+        match_mode, pattern = mr[0:2]
+        is_bytes = isinstance(pattern, bytes)
+        if match_mode == MATCHER_MATCH_MODE_STR:
+            if not pattern:
+                return None
+            first = pattern[:1].lower() if ignorecase else pattern[:1]
+            if any((bytes((c,)) if is_bytes else c) == first for c in chars):
+                return None
+        else:
+            first = _first_chars(sre_parse.parse(pattern, mr[2].flags), mr[2].flags, is_bytes)
+            if first is None or first[1]:
+                return None
+            for desc in first[0]:
+                if any(map(_predicate(desc), chars)):
+                    return None
+
+    if isinstance(matchers[0][1], bytes):
+        return b'[' + re.escape(bytes(sorted(chars))) + b']+'
+    return '[' + re.escape(''.join(sorted(chars))) + ']+'
+
+
+def _matcher_firsts(matchers, ignorecase):
+    """
+    Return for each matcher the predicate descriptions of the characters it
+    can start with, or None if they are unknown or it can match an empty
+    string.
+    """
+    import sre_parse
+
+    firsts = []
+    for mr in matchers:
+        match_mode, pattern = mr[0:2]
+        is_bytes = isinstance(pattern, bytes)
+        if match_mode == MATCHER_MATCH_MODE_STR:
+            c = pattern[:1]
+            if is_bytes and ignorecase:
+                first = [('lower', c.lower(), True)]
+            elif is_bytes:
+                first = [('eq', c[0], True)] if c else []
+            elif ignorecase and len(c.lower()) != 1:
+                first = None
+            elif ignorecase:
+                first = [('lower', c.lower(), False)]
+            else:
+                first = [('eq', c, False)]
+        else:
+            flags = mr[2].flags
+            first = _first_chars(sre_parse.parse(pattern, flags), flags, is_bytes)
+            if first is not None:
+                first = None if first[1] else first[0]
+        firsts.append(first)
+    return firsts
+
+
+class LexerDispatch:
+    """
+    First character dispatch of the matchers active in one state.
+
+    A matcher is tried only if the character at lexpos is able to start a
+    match of it. Matchers whose first characters are unknown (or which can
+    match an empty string) are tried on every character. The table is filled
+    the first time a character is seen, so it's exact for any alphabet,
+    Unicode categories included.
+
+    Constant patterns of a bucket are merged into hash tables by length, so
+    finding the longest literal costs a lookup per distinct length rather
+    than a comparison per rule.
+    """
+
+    max_table_size = 4096
+
+    def __init__(self, matchers, ignorecase, tables=None):
+        self.matchers = matchers
+        self.ignorecase = ignorecase
+        self.table = {}
+
+        # the first character analysis, which is saved by the table cache
+        self.tables = _matcher_firsts(matchers, ignorecase) if tables is None else tables
+        self._firsts = [None if first is None else [_predicate(d) for d in first] for first in self.tables]
+
+    def __deepcopy__(self, memo):
+        return self  # the scanner belongs to the lexer class, and copies of lexers share it
+
+    def bucket(self, c):
+        """
+        Return the matchers able to start with character c, as a tuple
+        (literal_tables, regexes). Constant patterns are grouped by length in
+        descending order, each group is a table from the literal to its
+        matcher. Each matcher is paired with its index to break ties.
+        """
+        bucket = self.table.get(c)
+        if bucket is None:
+            literals, regexes = {}, []
+            for idx, (mr, first) in enumerate(zip(self.matchers, self._firsts)):
+                if first is not None and not any(pred(c) for pred in first):
+                    continue
+                if mr[0] == MATCHER_MATCH_MODE_STR:
+                    key = mr[1].lower() if self.ignorecase else mr[1]
+                    # the earliest rule wins on the same literal
+                    literals.setdefault(len(mr[1]), {}).setdefault(key, (idx, mr))
+                else:
+                    regexes.append((idx, mr))
+            literal_tables = tuple(sorted(literals.items(), reverse=True))
+            bucket = literal_tables, tuple(regexes)
+            if len(self.table) < self.max_table_size:
+                self.table[c] = bucket
+        return bucket
+
+    def scan(self, lexdata, lexpos):
+        """
+        Same as _scan_matchers(), but only with the matchers in the bucket.
+        The longest literal is found with one lookup per literal length.
+        """
+        bucket = self.table.get(lexdata[lexpos])
+        if bucket is None:
+            bucket = self.bucket(lexdata[lexpos])
+        literal_tables, regexes = bucket
+
+        match_obj, match_endpos, match_len, match_idx, matcher = None, 0, -1, 0, None
+        for length, literals in literal_tables:
+            m_group = lexdata[lexpos:lexpos+length]
+            hit = literals.get(m_group.lower() if self.ignorecase else m_group)
+            if hit is not None:
+                match_idx, matcher = hit
+                match_obj, match_len = m_group, len(m_group)
+                match_endpos = lexpos + match_len
+                break
+
+        for idx, mr in regexes:
+            m_obj = mr[2].match(lexdata, lexpos)
+            if not m_obj:
+                continue
+            m_endpos = m_obj.end()
+            m_len = m_endpos - lexpos
+            if m_len > match_len or m_len == match_len and idx < match_idx:
+                match_obj, match_endpos, match_len, match_idx, matcher\
+                    = m_obj, m_endpos, m_len, idx, mr
+
+        if match_obj is None:
+            return None
+        if matcher[0] == MATCHER_MATCH_MODE_STR:
+            return match_obj, match_endpos, match_obj, matcher
+        return match_obj, match_endpos, match_obj.group(), matcher
+
+
+class _DFAUnsupported(Exception):
+    pass
+
+
+class LexerDFA:
+    """
+    Combined automaton of all matchers active in one state.
+
+    The rule patterns are translated into a single NFA, which is turned into
+    a DFA lazily while scanning, i.e. a DFA state and its transition on a
+    character are built the first time they are needed. One pass over the
+    input gives the longest possible match of every rule.
+
+    Python regexes are not POSIX ones: alternations are ordered and lazy
+    repeats stop early, so the match found by `re` may be shorter than the
+    longest one accepted by the automaton. The automaton is an upper bound
+    for each rule, and rules whose pattern can't be proved to match greedily
+    are verified by their real matcher, in the order of their upper bound.
+    Rules which can't be translated, or with lazy parts which would make the
+    automaton look far past their match, are run as usual when the character
+    at lexpos can start them.
+
+    It's used with the option 'engine': 'dfa'. Walking the automaton costs a
+    Python step per character, where the 'loop' engine runs the few rules
+    which can start with the character at lexpos in C. So the automaton only
+    pays off when many rules, about 5 or more, can start with the same
+    character; with fewer, e.g. on the grammars of the benchmarks, the 'loop'
+    engine is 10% to 25% faster.
+    """
+
+    max_nfa_states = 20000
+    max_dfa_states = 5000
+    max_heads = 10000
+    max_head_size = 64
+
+    def __init__(self, matchers, ignorecase, tables=None, probe=False):
+        self.matchers = matchers
+        self.ignorecase = ignorecase
+        # the scanner is shared by the lexers of all threads: the automaton
+        # is only extended under the lock
+        self._lock = threading.Lock()
+        # a probe only tells which rules may read past the end of the input
+        # (see live()): a rule matching its shortest string stops at the first
+        self._probe = probe
+
+        if tables is None:
+            self._build_nfa()
+        else:
+            (self._eps, self._edges, self._final, self.exact, self.fallback, self._pred_descs,
+             self._fallback_descs) = tables
+        self._preds = [_predicate(d) for d in self._pred_descs]
+        self._fallback_firsts = [None if first is None else [_predicate(d) for d in first]
+                                 for first in self._fallback_descs]
+        self._fallback_table = {}  # char -> fallback matchers able to start with it
+        self._anywhere_table = {}  # char -> whether reach() is the end of the text
+        self._reset_dfa()
+
+    def __deepcopy__(self, memo):
+        return self  # the scanner belongs to the lexer class, and copies of lexers share it
+
+    @property
+    def tables(self):
+        """
+        The NFA, which is saved by the table cache.
+        """
+        return (self._eps, self._edges, self._final, self.exact, self.fallback, self._pred_descs,
+                self._fallback_descs)
+
+    # NFA construction
+
+    def _build_nfa(self):
+        import sre_parse
+
+        matchers = self.matchers
+        self._sre_parse = sre_parse
+        self._flags = 0
+        self._is_bytes = False
+
+        self._eps = [[]]        # epsilon transitions of NFA states
+        self._edges = [[]]      # character transitions (predicate index, target)
+        self._final = {}        # NFA state -> matcher index
+        self._pred_descs = []   # descriptions of character predicates
+        self._owner = [None]    # NFA state -> matcher index, for live()
+
+        self.exact = [False] * len(matchers)
+        self.shortest = [False] * len(matchers)  # rules matching their shortest string
+        self.lookahead = [False] * len(matchers)  # rules with lookahead assertions
+        self.fallback = []  # matchers can't be translated to the automaton
+
+        for idx, mr in enumerate(matchers):
+            size = len(self._eps)
+            self._building = idx
+            try:
+                rule_start = self._new_state()
+                self._eps[0].append(rule_start)
+                rule_final, self.exact[idx] = self._build_matcher(mr, rule_start)
+                self._final[rule_final] = idx
+            except _DFAUnsupported:
+                del self._eps[size:], self._edges[size:], self._owner[size:]
+                self._eps[0] = [s for s in self._eps[0] if s < size]
+                self.fallback.append(idx)
+        self.fallback = tuple(self.fallback)
+        self._fallback_descs = _matcher_firsts([matchers[idx] for idx in self.fallback], self.ignorecase)
+
+    def _new_state(self):
+        if len(self._eps) >= self.max_nfa_states:
+            raise _DFAUnsupported()
+        self._eps.append([])
+        self._edges.append([])
+        self._owner.append(self._building)
+        return len(self._eps) - 1
+
+    def _add_edge(self, start, pred):
+        target = self._new_state()
+        self._edges[start].append((len(self._pred_descs), target))
+        self._pred_descs.append(pred)
+        return target
+
+    def _build_matcher(self, mr, start):
+        match_mode, pattern = mr[0:2]
+        if match_mode == MATCHER_MATCH_MODE_STR:
+            if not pattern:
+                raise _DFAUnsupported()  # empty strings are never matched
+            is_bytes = isinstance(pattern, bytes)
+            # match_constant_pattern compares lowercased strings, which is
+            # the same as comparing the characters for bytes and ASCII
+            # literals, but may differ from re on exotic characters
+            lower = self.ignorecase and (is_bytes or pattern.isascii())
+            for c in pattern:
+                if lower:
+                    pred = ('lower', bytes((c,)).lower() if is_bytes else c.lower(), is_bytes)
+                else:
+                    pred = ('ignorecase' if self.ignorecase else 'eq', c, is_bytes)
+                start = self._add_edge(start, pred)
+            return start, lower or not self.ignorecase
+        else:
+            self._flags = mr[2].flags
+            self._is_bytes = isinstance(pattern, bytes)
+            tree = self._sre_parse.parse(pattern, self._flags)
+            self.shortest[self._building] = self._is_shortest(tree)
+            return self._build(tree, start), self._is_greedy(tree)
+
+    def _build(self, tree, start):
+        for op, av in tree:
+            start = self._build_item(tree, op, av, start)
+        return start
+
+    def _build_item(self, tree, op, av, start):
+        name = str(op)
+        if name in SRE_CHAR_ITEMS:
+            return self._add_edge(start, _char_item(tree, (op, av), self._flags, self._is_bytes))
+        elif name == 'SUBPATTERN':
+            group, add_flags, del_flags, p = av
+            if add_flags or del_flags:
+                raise _DFAUnsupported()
+            return self._build(p, start)
+        elif name == 'ATOMIC_GROUP' and self._probe:
+            return self._build(av, start)
+        elif name == 'BRANCH':
+            end = self._new_state()
+            for p in av[1]:
+                s = self._new_state()
+                self._eps[start].append(s)
+                self._eps[self._build(p, s)].append(end)
+            return end
+        elif name == 'MAX_REPEAT' or name in ('MIN_REPEAT', 'POSSESSIVE_REPEAT') and self._probe:
+            lo, hi, p = av
+            for _ in range(lo):
+                start = self._build(p, start)
+            if str(hi) == 'MAXREPEAT':
+                loop = self._new_state()
+                self._eps[start].append(loop)
+                self._eps[self._build(p, loop)].append(loop)
+                return loop
+            end = self._new_state()
+            for _ in range(hi - lo):
+                self._eps[start].append(end)
+                start = self._build(p, start)
+            self._eps[start].append(end)
+            return end
+        elif name in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            # assertions only shrink the language, ignoring them keeps the
+            # automaton an upper bound of the regex
+            if name != 'AT' and av[0] > 0:
+                self.lookahead[self._building] = True
+            return start
+        else:
+            # lazy and possessive repeats and atomic groups stop before the
+            # longest match, which the automaton would look for up to the end
+            # of the input (e.g. the last */ after a comment): such rules are
+            # run by their own matcher. A probe follows them as greedy ones.
+            raise _DFAUnsupported()
+
+    def _is_greedy(self, tree):
+        """
+        Whether re always finds the longest match for this pattern. It does
+        if the pattern has no choice to make but at its tail: the characters
+        which start the alternatives of a branch, and those which go on a
+        greedy repeat, must be told apart from what may come after them.
+        """
+        return self._is_decided(tree, [])
+
+    def _is_decided(self, tree, follow):
+        """
+        Whether the next character decides every choice in tree, when it's
+        followed by the characters of the predicate descriptions follow
+        (none at the end of the pattern).
+        """
+        items = list(tree)
+        for i, (op, av) in enumerate(items):
+            name = str(op)
+            if name in SRE_CHAR_ITEMS:
+                continue
+            rest = self._first(tree, items[i+1:], follow)
+            if rest is None:
+                return False
+            if name == 'SUBPATTERN':
+                group, add_flags, del_flags, p = av
+                if add_flags or del_flags or not self._is_decided(p, rest):
+                    return False
+            elif name == 'BRANCH':
+                firsts = []
+                for p in av[1]:
+                    first = self._first(p, list(p), None)
+                    if first is None or not self._is_decided(p, rest):
+                        return False
+                    if any(not _disjoint(first, other) for other in firsts):
+                        return False
+                    firsts.append(first)
+            elif name == 'MAX_REPEAT':
+                lo, hi, p = av
+                first = self._first(p, list(p), None)
+                if first is None or not self._is_decided(p, first + rest):
+                    return False
+                if lo != hi and not _disjoint(first, rest):
+                    return False
+            else:
+                return False
+        return True
+
+    def _first(self, tree, items, follow):
+        """
+        Return the predicate descriptions of the characters items (a part of
+        tree) can start with, and of follow if they can match an empty
+        string. Return None if they are unknown, or if items can match an
+        empty string and follow is None.
+        """
+        first = _first_chars(self._sre_parse.SubPattern(tree.state, items), self._flags, self._is_bytes)
+        if first is None or first[1] and follow is None:
+            return None
+        return first[0] + follow if first[1] else first[0]
+
+    def _is_shortest(self, tree):
+        """
+        Whether re always finds the shortest match for this pattern, like a
+        comment: single characters, and one lazy repeat of a single character
+        among them.
+        """
+        def single(p):
+            p = list(p)
+            if len(p) != 1:
+                return False
+            op, av = p[0]
+            if str(op) == 'SUBPATTERN':
+                return not av[1] and not av[2] and single(av[3])
+            if str(op) == 'BRANCH':
+                return all(single(q) for q in av[1])
+            return str(op) in SRE_CHAR_ITEMS
+
+        lazy = [av for op, av in tree if str(op) == 'MIN_REPEAT']
+        return (len(lazy) == 1 and single(lazy[0][2])
+                and all(str(op) in SRE_CHAR_ITEMS + ('MIN_REPEAT',) for op, av in tree))
+
+    # lazy DFA construction
+
+    def _reset_dfa(self):
+        # the automaton is (NFA state set -> DFA state, and by DFA state: its
+        # NFA state set, {char: DFA state}, accepted matcher indexes, and
+        # {token text: DFA state} for live()); a new one is made, so the
+        # threads still walking the old one go on
+        dfa = ({}, [], [], [], {})
+        self._dfa_state(dfa, self._closure([0]))
+        self._dfa = dfa
+
+    def _closure(self, states):
+        eps = self._eps
+        stack, seen = list(states), set(states)
+        while stack:
+            for t in eps[stack.pop()]:
+                if t not in seen:
+                    seen.add(t)
+                    stack.append(t)
+        return frozenset(seen)
+
+    def _dfa_state(self, dfa, nfa_set):
+        index, sets, trans, accepts = dfa[:4]
+        if self._probe:
+            # a rule which matches its shortest string stops at the first
+            final, owner = self._final, self._owner
+            done = {final[s] for s in nfa_set if s in final and self.shortest[final[s]]}
+            if done:
+                nfa_set = frozenset(s for s in nfa_set if owner[s] not in done or s in final)
+        d = index.get(nfa_set)
+        if d is None:
+            final = self._final
+            sets.append(nfa_set)
+            trans.append({})
+            accepts.append(tuple(sorted(final[s] for s in nfa_set if s in final)))
+            d = index[nfa_set] = len(sets) - 1
+        return d
+
+    def _step(self, dfa, d, c):
+        with self._lock:
+            nd = dfa[2][d].get(c)
+            if nd is None:
+                edges, preds = self._edges, self._preds
+                targets = [t for s in dfa[1][d] for p, t in edges[s] if preds[p](c)]
+                nd = self._dfa_state(dfa, self._closure(targets)) if targets else -1
+                # published last, when the new state is complete
+                dfa[2][d][c] = nd
+                if len(dfa[1]) > self.max_dfa_states and dfa is self._dfa:
+                    self._reset_dfa()  # the walks on the old automaton go on
+        return nd
+
+    def run(self, s, pos):
+        """
+        Walk the automaton from pos. Return a list of (endpos, matchers)
+        for every position where some matchers accept.
+        """
+        dfa = self._dfa
+        trans, accepts = dfa[2], dfa[3]
+        hits = [(pos, accepts[0])] if accepts[0] else []
+        d = 0
+        for i in range(pos, len(s)):
+            c = s[i]
+            nd = trans[d].get(c)
+            if nd is None:
+                nd = self._step(dfa, d, c)
+            if nd < 0:
+                break
+            d = nd
+            accept = accepts[d]
+            if accept:
+                hits.append((i + 1, accept))
+        return hits
+
+    def _walk(self, s, pos, head):
+        """
+        Walk the automaton from pos, over head first, the text already
+        matched there (the walks over the short ones are remembered). Return
+        the DFA state at the end of s, or -1 and the position where it died.
+        """
+        dfa = self._dfa
+        trans = dfa[2]
+        d = 0
+        if 0 < len(head) <= self.max_head_size:
+            heads = dfa[4]
+            walked = heads.get(head)
+            if walked is None:
+                n = 0
+                for c in head:
+                    nd = trans[d].get(c)
+                    nd = self._step(dfa, d, c) if nd is None else nd
+                    if nd < 0:
+                        d = nd
+                        break
+                    d, n = nd, n + 1
+                walked = d, n
+                if len(heads) < self.max_heads:
+                    heads[head] = walked
+            d, n = walked
+            if d < 0:
+                return d, pos + n
+            pos += n
+        for i in range(pos, len(s)):
+            c = s[i]
+            nd = trans[d].get(c)
+            if nd is None:
+                nd = self._step(dfa, d, c)
+            if nd < 0:
+                return nd, i
+            d = nd
+        return d, len(s)
+
+    def live(self, s, pos, head=''):
+        """
+        Walk the automaton from pos, and return the indexes of the matchers
+        which may still match more at the end of s. head is the text already
+        matched at pos, if any.
+        """
+        d, i = self._walk(s, pos, head)
+        if d < 0:
+            return ()
+        edges, owner = self._edges, self._owner
+        return {owner[st] for st in self._dfa[1][d] if edges[st]}
+
+    def reach(self, s, pos, head=''):
+        """
+        Return the end of the text of s the matchers may look at from pos:
+        up to the character where the automaton dies, or past the end of s
+        if it doesn't. The matchers it can't follow, or with a lookahead, may
+        look at the whole text.
+        """
+        if pos < len(s) and self._looks_anywhere(s[pos]):
+            return len(s) + 1
+        d, i = self._walk(s, pos, head)
+        return i + 1
+
+    def _looks_anywhere(self, c):
+        anywhere = self._anywhere_table.get(c)
+        if anywhere is None:
+            d = self._step(self._dfa, 0, c)
+            owner = self._owner
+            anywhere = bool(self._fallbacks(c)) or d >= 0 and any(
+                self.lookahead[owner[st]] for st in self._dfa[1][d])
+            if len(self._anywhere_table) < LexerDispatch.max_table_size:
+                self._anywhere_table[c] = anywhere
+        return anywhere
+
+    def _match(self, idx, lexdata, lexpos):
+        mr = self.matchers[idx]
+        if mr[0] == MATCHER_MATCH_MODE_STR:
+            m_obj = match_constant_pattern(mr[1], self.ignorecase, lexdata, lexpos)
+            return (m_obj, lexpos + len(m_obj), m_obj) if m_obj else None
+        m_obj = mr[2].match(lexdata, lexpos)
+        return (m_obj, m_obj.end(), m_obj.group()) if m_obj else None
+
+    def _fallbacks(self, c):
+        """
+        Return the indexes of the fallback matchers able to start with
+        character c.
+        """
+        fallbacks = tuple(idx for idx, first in zip(self.fallback, self._fallback_firsts)
+                          if first is None or any(pred(c) for pred in first))
+        if len(self._fallback_table) < LexerDispatch.max_table_size:
+            self._fallback_table[c] = fallbacks
+        return fallbacks
+
+    def _found(self, idx, lexdata, lexpos, endpos):
+        mr = self.matchers[idx]
+        group = lexdata[lexpos:endpos]
+        if mr[0] == MATCHER_MATCH_MODE_REG and mr[3] == MATCHER_HANDLER_TYPE_TOKEN:
+            return mr[2].match(lexdata, lexpos), endpos, group
+        return group, endpos, group
+
+    def scan(self, lexdata, lexpos):
+        """
+        Same as _scan_matchers(), but driven by the automaton.
+        """
+        if self.fallback:
+            fallbacks = self._fallback_table.get(lexdata[lexpos])
+            if fallbacks is None:
+                fallbacks = self._fallbacks(lexdata[lexpos])
+            if fallbacks:
+                return self._scan_all(lexdata, lexpos, fallbacks)
+
+        # walk the automaton, keeping only the longest accepting position
+        dfa = self._dfa
+        trans, accepts = dfa[2], dfa[3]
+        d, endpos, accept = 0, lexpos, accepts[0]
+        for i in range(lexpos, len(lexdata)):
+            nd = trans[d].get(lexdata[i])
+            if nd is None:
+                nd = self._step(dfa, d, lexdata[i])
+            if nd < 0:
+                break
+            d = nd
+            if accepts[d]:
+                endpos, accept = i + 1, accepts[d]
+
+        # the first rule accepting the longest upper bound, if it's exact, is
+        # the match: no rule can be longer, or as long and before it
+        if not accept:
+            return None
+        idx = accept[0]
+        if not self.exact[idx]:
+            return self._scan_all(lexdata, lexpos, ())
+        mr = self.matchers[idx]
+        group = lexdata[lexpos:endpos]
+        if mr[3] == MATCHER_HANDLER_TYPE_TOKEN and mr[0] == MATCHER_MATCH_MODE_REG:
+            return mr[2].match(lexdata, lexpos), endpos, group, mr  # the handler gets lexmatch
+        return group, endpos, group, mr
+
+    def _scan_all(self, lexdata, lexpos, fallbacks):
+        """
+        Try the fallback matchers, and the matchers accepted by the automaton
+        from the longest upper bound down, until no one can be longer.
+        """
+        hits = self.run(lexdata, lexpos)
+        best, best_len, best_idx = None, -1, len(self.matchers)
+
+        for idx in fallbacks:
+            found = self._match(idx, lexdata, lexpos)
+            if found and (found[1] - lexpos > best_len
+                          or found[1] - lexpos == best_len and idx < best_idx):
+                best, best_len, best_idx = found, found[1] - lexpos, idx
+
+        seen = set()
+        for endpos, accepts in reversed(hits):
+            upper_len = endpos - lexpos
+            if upper_len < best_len:
+                break
+            for idx in accepts:
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if upper_len == best_len and idx > best_idx:
+                    continue
+                if self.exact[idx]:
+                    found = self._found(idx, lexdata, lexpos, endpos)
+                else:
+                    found = self._match(idx, lexdata, lexpos)
+                if found and (found[1] - lexpos > best_len
+                              or found[1] - lexpos == best_len and idx < best_idx):
+                    best, best_len, best_idx = found, found[1] - lexpos, idx
+
+        if best is None:
+            return None
+        return best[0], best[1], best[2], self.matchers[best_idx]
+
+
+def _make_scanner(lexer, matchers, tables=None):
+    # folded literals are compared to the folded input as they are
+    ignorecase = bool(lexer._reflags & re.IGNORECASE) and not lexer._case_fold
+    engine = lexer._options['engine']
+    if engine == 'dfa':
+        try:
+            return LexerDFA(matchers, ignorecase, tables).scan
+        except ImportError:
+            pass  # sre_parse is not available, use the plain loop
+    elif engine != 'loop':
+        raise ValueError("Unknown engine '%s'. Must be 'loop' or 'dfa'" % engine)
+    else:
+        try:
+            return LexerDispatch(matchers, ignorecase, tables).scan
+        except ImportError:
+            pass
+    return lambda lexdata, lexpos: _scan_matchers(matchers, ignorecase, lexdata, lexpos)
+
+
+def _rule_pattern(lexer, rule):
+    """
+    Return the pattern of a rule with definitions injected. In bytes mode,
+    str patterns are encoded by Latin-1, so \\xNN means the byte NN.
+    """
+    def as_str(p):
+        return p.decode('latin-1') if isinstance(p, bytes) else p
+
+    definitions = {k: as_str(v) for k, v in lexer._definitions.items()}
+    pat = inject_pattern_definition(as_str(rule.pattern), definitions)
+    if lexer._options['bytes']:
+        try:
+            return pat.encode('latin-1')
+        except UnicodeEncodeError:
+            raise TypeError('Pattern %r for rule %s is not a bytes pattern' % (pat, rule))
+    return pat
+
+
+def _matches_newline(lexer, pattern, const_pat):
+    """
+    Check whether a rule can match a newline, which decides if the lexer
+    counts lines in its matches.
+    """
+    if not lexer._track_lines:
+        return False
+    if const_pat is not None:
+        return lexer._newline in const_pat
+    try:
+        import sre_parse
+        tree = sre_parse.parse(pattern, lexer._reflags)
+    except ImportError:
+        return True
+    return _can_match_char(tree, lexer._newline[0], lexer._reflags, lexer._options['bytes'])
+
+
+def _analyse_rule(lexer, rule):
+    """
+    Return (match mode, pattern, regex flags, whether it matches a newline)
+    of a general rule.
+    """
+    pat = _rule_pattern(lexer, rule)
+    try:
+        const_pat = get_constant_pattern(pat)
+    except re.error:
+        raise re.error('Invalid regex pattern %s for rule %s' % (pat, rule))
+    newline = _matches_newline(lexer, pat, const_pat)
+    if const_pat is None:
+        if lexer._case_fold:
+            pat, reflags = _fold_pattern(pat, lexer._reflags)
+            return MATCHER_MATCH_MODE_REG, pat, reflags, newline
+        return MATCHER_MATCH_MODE_REG, pat, lexer._reflags, newline
+    elif lexer._case_fold:
+        return MATCHER_MATCH_MODE_STR, fold_case(const_pat), 0, newline
+    else:
+        return MATCHER_MATCH_MODE_STR, const_pat, 0, newline
+
+
+def _rule_is_active(rule, state, state_is_inclusive):
+    return rule.state == state or rule.state == '*' or (rule.state is None and state_is_inclusive)
+
+
+def _compile_state(lexer, state):
+    """
+    Build the matcher table of a state, the first time it's entered. Each
+    rule is compiled once, and its matcher is shared by all the states it's
+    active in. The lexers of several threads may enter it at once, so it's
+    built under the lock of the class.
+    """
+    with lexer._compile_lock:
+        compiled = lexer._compiled.get(state)
+        if compiled is None:
+            compiled = _compile_state_locked(lexer, state)
+    return compiled
+
+
+def _compile_state_locked(lexer, state):
+    tables = lexer._tables
+    state_is_inclusive = lexer._states[state] == 'inclusive'
+    matchers, errf, eoff = [], None, None
+    for idx, r in enumerate(lexer._rules):
+        if not _rule_is_active(r, state, state_is_inclusive):
+            continue
+
+        if r.pattern == '__error__':
+            # error handler function
+            if not r.token_handler:
+                raise TypeError('Error handler must be a function.')
+            if errf is None:
+                errf = r.token_handler
+        elif r.pattern == '__eof__':
+            # EOF handler
+            if eoff is None:
+                if r.token_handler:
+                    eoff = (MATCHER_HANDLER_TYPE_TOKEN, r.token_handler, None)
+                else:
+                    eoff = (MATCHER_HANDLER_TYPE_TPVAL, r.token_type, r.token_value_handler)
+        else:
+            # general rules
+            matcher = lexer._rule_matchers.get(idx)
+            if matcher is None:
+                matcher = lexer._rule_matchers[idx] = _compile_rule(lexer, idx, r)
+            matchers.append(matcher)
+
+    ignorecase = bool(lexer._reflags & re.IGNORECASE) and not lexer._case_fold
+    skips = tables.setdefault('skips', {})
+    if state not in skips:
+        try:
+            skips[state] = _skip_pattern(matchers, ignorecase)
+        except ImportError:
+            skips[state] = None
+    skip = None
+    if skips[state] is not None:
+        merged = re.compile(skips[state]).match
+        # the lines are counted in the skipped text like the rules would do
+        skip = merged, lexer._track_lines and merged(lexer._newline) is not None
+
+    cached = tables['scanners'].get(state)
+    scan = _make_scanner(lexer, matchers, cached)
+    if cached is None:
+        tables['scanners'][state] = getattr(getattr(scan, '__self__', None), 'tables', None)
+        _save_tables(lexer, tables)
+    compiled = lexer._compiled[state] = (matchers, errf, eoff, scan, skip)
+    return compiled
+
+
+def _compile_rule(lexer, idx, rule):
+    """
+    Return the matcher of a general rule.
+    """
+    rule_tables = lexer._tables['rules']
+    if idx not in rule_tables:
+        rule_tables[idx] = _analyse_rule(lexer, rule)
+    match_mode, pat, reflags, newline = rule_tables[idx]
+    if match_mode == MATCHER_MATCH_MODE_REG:
+        try:
+            regex = re.compile(pat, reflags)
+        except re.error:
+            raise re.error('Invalid regex pattern %s for rule %s' % (pat, rule))
+        matcher_match = (MATCHER_MATCH_MODE_REG, pat, regex)
+    else:
+        matcher_match = (MATCHER_MATCH_MODE_STR, pat, None)
+
+    keywords = rule.keywords
+    if keywords is not None and lexer._reflags & re.IGNORECASE:
+        keywords = {k.lower(): v for k, v in keywords.items()}
+    elif keywords is not None:
+        keywords = dict(keywords)
+
+    if rule.token_handler:
+        matcher_handler = (MATCHER_HANDLER_TYPE_TOKEN, rule.token_handler, None)
+    else:
+        matcher_handler = (MATCHER_HANDLER_TYPE_TPVAL, rule.token_type, rule.token_value_handler)
+
+    return matcher_match + matcher_handler + (newline, keywords)
+
+
+# Table cache
+
+# the layout of the saved tables, bumped when it changes
+TABLE_FORMAT = 2
+
 
-    def parse_target(self, tar):
-        rule_list = self.rule_list
+def _table_cache_path(lexer):
+    directory = lexer._options['table-cache']
+    if directory is None:
+        return None
+    return os.path.join(directory, '%s.%s.plextab' % (lexer.__module__, lexer.__qualname__))
 
-        def append_rule(state, pattern):
-            rule = LexerAtomRule()
-            rule.pattern, rule.state = pattern, state
-            rule_list.append(rule)
 
-        if len(tar) == 1:
-            state, pattern = None, tar[0]
-        elif len(tar) == 2:
-            state, pattern = tar
-        else:
-            raise TypeError('Invalid value. Accept only "pattern" or "(state, pattern)".')
+def _table_fingerprint(lexer):
+    """
+    Digest of everything the analysis of the rules depends on.
+    """
+    key = (__version__, TABLE_FORMAT, sys.version, lexer._reflags, lexer._case_fold, lexer._track_lines,
+           lexer._options['engine'], lexer._options['bytes'],
+           sorted(lexer._states.items()), sorted(lexer._definitions.items()),
+           [(r.state, r.pattern, r.token_type is None, r.token_handler is not None,
+             r.token_value_handler is not None, r.keywords) for r in lexer._rules])
+    return hashlib.sha256(repr(key).encode()).hexdigest()
 
-        if isinstance(pattern, list):
-            for t in pattern:
-                if isinstance(t, tuple):
-                    if state is not None:
-                        raise TypeError('Duplicate state assignment.')
-                    self.parse_target(t)
-                else:
-                    self.parse_target((state, t))
-        elif isinstance(state, (list, tuple)):
-            for s in state:
-                append_rule(s, pattern)
-        else:
-            append_rule(state, pattern)
 
-    def __call__(self, f, value=None):
-        self.parse_target(self.preset_targets)
-        rule_list = self.rule_list
+def _sre_constant(name):
+    import sre_constants
+    return getattr(sre_constants, name)
 
-        f_callable = callable(f)
-        if f_callable:
-            for r in rule_list:
-                r.token_handler = f
-        else:
-            for r in rule_list:
-                if r.pattern == '__error__':
-                    raise TypeError('Error handler must be callable.')
-                r.token_type = f
-                r.token_value_handler = value
 
-        self.lexer._rules += rule_list
-        if f_callable:
-            return f
+def _load_tables(lexer):
+    """
+    Return the tables of the lexer in the table cache, or empty tables if
+    they are missing or out of date.
+    """
+    path = _table_cache_path(lexer)
+    if path is not None:
+        try:
+            with open(path, 'rb') as fd:
+                tables = pickle.load(fd)
+            if tables['fingerprint'] == _table_fingerprint(lexer):
+                return tables
+        except Exception:
+            pass  # rebuild the broken tables
+    return {'rules': {}, 'scanners': {}}
+
+
+def _save_tables(lexer, tables):
+    path = _table_cache_path(lexer)
+    if path is None:
+        return
+    import sre_constants
+    tables['fingerprint'] = _table_fingerprint(lexer)
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    # the opcodes of parsed patterns are pickled by name
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[type(sre_constants.LITERAL)] = lambda c: (_sre_constant, (str(c),))
+    try:
+        pickler.dump(tables)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+        with open(temp, 'wb') as fd:
+            fd.write(buf.getvalue())
+        os.replace(temp, path)
+    except (OSError, pickle.PicklingError) as e:
+        warnings.warn("Couldn't write the table cache %s: %s" % (path, e))
 
-    def __enter__(self):
-        return lambda *headers:\
-            self.__class__(self.lexer, self.preset_targets + list(headers))
 
-    def __exit__(self, *args):
-        pass
+# Profiling
 
+class ProfileCounters:
+    """
+    What a rule did in one state, while a lexer was profiled. The times
+    are in seconds.
+    """
 
-def _normalize_states(lexer, state_list):
-    try:
-        _ = iter(state_list)
-    except TypeError:
-        raise TypeError("'states' must be iterable.")
+    __slots__ = ('state', 'rule', 'attempts', 'matches', 'chosen', 'consumed',
+                 'match_time', 'handler_calls', 'handler_time', 'value_calls', 'value_time')
+
+    def __init__(self, state, rule):
+        self.state = state
+        self.rule = rule
+        self.attempts = 0      # times the rule was tried
+        self.matches = 0       # times it matched
+        self.chosen = 0        # times it was the longest match
+        self.consumed = 0      # characters (or bytes) of its chosen matches
+        self.match_time = 0.0
+        self.handler_calls = 0  # calls of its token handler (or __error__, __eof__)
+        self.handler_time = 0.0
+        self.value_calls = 0
+        self.value_time = 0.0
 
-    for s in state_list:
-        if not isinstance(s, tuple) or len(s) != 2:
-            raise TypeError("Invalid state specifier %s. Must be a tuple (statename,'exclusive|inclusive')" % repr(s))
+    @property
+    def time(self):
+        return self.match_time + self.handler_time + self.value_time
 
-        if s[0] == 's' or s[0] == 'x':
-            state_type, state_name = s
-        elif s[1] == 'inclusive' or s[1] == 'exclusive':
-            state_name, state_type = s
-        else:
-            raise ValueError("State type for state %s must be 'inclusive' or 'exclusive'" % state_name)
+    def __repr__(self):
+        return 'ProfileCounters(%s, %s)' % (self.state, self.rule.pattern)
 
-        if state_name in lexer._states:
-            raise ValueError("State '%s' already defined" % state_name)
-        if state_type == 'x' or state_type == 'exclusive':
-            state_flag = 'exclusive'
-        elif state_type == 's' or state_type == 'inclusive':
-            state_flag = 'inclusive'
-        lexer._states[state_name] = state_flag
 
+class LexerProfile:
+    """
+    Counters collected by Lexer.start_profile(): a ProfileCounters of each
+    rule in each state, by (state, rule index), and the state switches, by
+    (method, new state).
 
-MATCHER_MATCH_MODE_STR = 1
-MATCHER_MATCH_MODE_REG = 2
-MATCHER_HANDLER_TYPE_TOKEN = 1
-MATCHER_HANDLER_TYPE_TPVAL = 2
+    While a lexer is profiled, every rule of the state is tried at every
+    position, whatever the engine, so the counters don't depend on it.
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.switches = {}
+        self._compiled = {}
 
+    def rows(self, sort_by='time'):
+        """
+        Return the ProfileCounters, in descending order of attribute sort_by.
+        """
+        return sorted(self.rules.values(), key=lambda c: getattr(c, sort_by), reverse=True)
 
-def _compile_rules(lexer):
-    # translate collected rules to matchers identified by state
-    for state in lexer._states:
+    def table(self, sort_by='time'):
+        """
+        Return the counters as a text table, sorted like rows().
+        """
+        columns = ('state', 'rule', 'attempts', 'matches', 'chosen', 'consumed',
+                   'match ms', 'handler calls', 'handler ms', 'value calls', 'value ms')
+        lines = [columns]
+        for c in self.rows(sort_by):
+            lines.append((c.state, c.rule.pattern, c.attempts, c.matches, c.chosen, c.consumed,
+                          '%.3f' % (c.match_time * 1e3), c.handler_calls, '%.3f' % (c.handler_time * 1e3),
+                          c.value_calls, '%.3f' % (c.value_time * 1e3)))
+        for (method, state), count in sorted(self.switches.items()):
+            lines.append(('%s(%s)' % (method, state), '', count) + ('',) * (len(columns) - 3))
+        lines = [[str(x) for x in line] for line in lines]
+        widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+        return '\n'.join('  '.join(x.ljust(w) if i < 2 else x.rjust(w) for i, (x, w) in enumerate(zip(line, widths)))
+                         .rstrip() for line in lines) + '\n'
+
+    __str__ = table
+
+    def _counters(self, lexer, state, idx):
+        counters = self.rules.get((state, idx))
+        if counters is None:
+            counters = self.rules[(state, idx)] = ProfileCounters(state, lexer._rules[idx])
+        return counters
+
+    def _compile(self, lexer, state):
+        """
+        Return the compiled state with the matchers and handlers counting
+        into this profile.
+        """
+        compiled = self._compiled.get((lexer, state))
+        if compiled is not None:
+            return compiled
+        matchers, errf, eoff, _, _ = lexer._compiled[state]
+        rule_index = {id(mr): idx for idx, mr in lexer._rule_matchers.items()}
         state_is_inclusive = lexer._states[state] == 'inclusive'
-        matchers, errf, eoff = [], None, None
-        for r in lexer._rules:
-            if (r.state == state or r.state == '*') or\
-               (r.state is None and state_is_inclusive):
-                pass
-            else:
-                continue  # this rule is not active under this state
-
-            if r.pattern == '__error__':
-                # error handler function
-                if not r.token_handler:
-                    raise TypeError('Error handler must be a function.')
-                if errf is None:
-                    errf = r.token_handler
-            elif r.pattern == '__eof__':
-                # EOF handler
-                if eoff is None:
-                    if r.token_handler:
-                        eoff = (MATCHER_HANDLER_TYPE_TOKEN, r.token_handler, None)
-                    else:
-                        eoff = (MATCHER_HANDLER_TYPE_TPVAL, r.token_type, r.token_value_handler)
-            else:
-                # general rules
-                pat = inject_pattern_definition(r.pattern, lexer._definitions)
-                try:
-                    const_pat = get_constant_pattern(pat)
-                except re.error:
-                    raise re.error('Invalid regex pattern %s for rule %s' % (pat, r))
-                if const_pat is None:
-                    try:
-                        regex = re.compile(pat, lexer._reflags)
-                    except re.error:
-                        raise re.error('Invalid regex pattern %s for rule %s' % (pat, r))
-                    matcher_match = (MATCHER_MATCH_MODE_REG, pat, regex)
+        special = {}
+        for idx, r in enumerate(lexer._rules):
+            if r.pattern in ('__error__', '__eof__') and _rule_is_active(r, state, state_is_inclusive):
+                special.setdefault(r.pattern, idx)
+
+        rules = []
+        for mr in matchers:
+            counters = self._counters(lexer, state, rule_index[id(mr)])
+            rules.append((mr[:4] + (_timed(mr[4], counters, 'handler') if mr[3] == MATCHER_HANDLER_TYPE_TOKEN
+                                    else mr[4], _timed(mr[5], counters, 'value')) + mr[6:], counters))
+        if errf is not None:
+            errf = _timed(errf, self._counters(lexer, state, special['__error__']), 'handler')
+        if eoff is not None:
+            counters = self._counters(lexer, state, special['__eof__'])
+            eoff = (eoff[0], _timed(eoff[1], counters, 'handler') if eoff[0] == MATCHER_HANDLER_TYPE_TOKEN
+                    else eoff[1], _timed(eoff[2], counters, 'value'))
+
+        ignorecase = bool(lexer._reflags & re.IGNORECASE) and not lexer._case_fold
+        perf_counter = time.perf_counter
+
+        def scan(lexdata, lexpos):
+            # the same as _scan_matchers(), counting
+            match_obj, match_endpos, match_group, match_len, chosen = None, 0, '', 0, None
+            for mr, counters in rules:
+                counters.attempts += 1
+                start = perf_counter()
+                if mr[0] == MATCHER_MATCH_MODE_STR:
+                    m_obj = match_constant_pattern(mr[1], ignorecase, lexdata, lexpos)
+                    m_group = m_obj
                 else:
-                    matcher_match = (MATCHER_MATCH_MODE_STR, const_pat, None)
+                    m_obj = mr[2].match(lexdata, lexpos)
+                    m_group = m_obj.group() if m_obj else ''
+                counters.match_time += perf_counter() - start
+                if not m_obj:
+                    continue
+                counters.matches += 1
+                if match_obj is None or len(m_group) > match_len:
+                    match_obj, match_endpos, match_group, match_len, chosen\
+                        = m_obj, lexpos + len(m_group), m_group, len(m_group), (mr, counters)
+            if match_obj is None:
+                return None
+            chosen[1].chosen += 1
+            chosen[1].consumed += match_len
+            return match_obj, match_endpos, match_group, chosen[0]
+
+        # the ignored rules aren't merged, so they are counted too
+        compiled = self._compiled[(lexer, state)] = ([mr for mr, _ in rules], errf, eoff, scan, None)
+        return compiled
+
+    def _attach(self, lexer):
+        cls = lexer.__class__
+
+        def activate_state(lexer, state):
+            cls._activate_state(lexer, state)
+            lexer._active_matchers, lexer._active_errf, lexer._active_eoff, lexer._active_scan, lexer._active_skip\
+                = self._compile(cls, state)
+
+        def switch(method):
+            def switch_state(lexer, *args):
+                result = method(lexer, *args)
+                key = (method.__name__, lexer._active_state)
+                self.switches[key] = self.switches.get(key, 0) + 1
+                return result
+            return switch_state
+
+        lexer._activate_state = types.MethodType(activate_state, lexer)
+        for name in ('begin', 'push_state', 'pop_state'):
+            setattr(lexer, name, types.MethodType(switch(getattr(cls, name)), lexer))
+        lexer._activate_state(lexer._active_state)
+
+    @staticmethod
+    def _detach(lexer):
+        for name in _PROFILE_HOOKS:
+            lexer.__dict__.pop(name, None)
+        lexer._activate_state(lexer._active_state)
+
+
+# Lexer methods replaced on a profiled lexer
+_PROFILE_HOOKS = ('_activate_state', 'begin', 'push_state', 'pop_state')
+
+
+def _timed(handler, counters, kind):
+    """
+    Return handler counting its calls and time into counters.
+    """
+    if handler is None:
+        return None
+    perf_counter = time.perf_counter
+    calls, total = kind + '_calls', kind + '_time'
 
-                if r.token_handler:
-                    matcher_handler = (MATCHER_HANDLER_TYPE_TOKEN, r.token_handler, None)
+    def timed(*args):
+        start = perf_counter()
+        try:
+            return handler(*args)
+        finally:
+            setattr(counters, total, getattr(counters, total) + perf_counter() - start)
+            setattr(counters, calls, getattr(counters, calls) + 1)
+    return timed
+
+
+# Code generation
+
+# what the bookkeeping of token() after a handler is needed for, by the
+# names referring to it
+_HANDLER_MARKS = {
+    'more': ('more',), '_call_mark_more': ('more',), '_lex_more_buffer': ('more',),
+    'less': ('less',), '_assigned_next_lexpos': ('less',),
+    'terminate': ('terminate',), '_call_mark_terminate': ('terminate',),
+    'restore': ('more', 'less'),
+}
+
+
+def _handler_marks(lexer, handler):
+    """
+    Return which of more(), less() and terminate() a token handler may use,
+    from the names in its code and in the code of the functions it names.
+    """
+    marks, seen, todo = set(), set(), [handler]
+    while todo:
+        code = getattr(todo.pop(), '__code__', None)
+        if code is None:
+            return {'more', 'less', 'terminate'}  # can't be analysed
+        if code in seen:
+            continue
+        seen.add(code)
+        codes = [code]
+        while codes:
+            co = codes.pop()
+            codes += [c for c in co.co_consts if isinstance(c, types.CodeType)]
+            for name in co.co_names:
+                marks.update(_HANDLER_MARKS.get(name, ()))
+                if name in Lexer.__dict__:
+                    continue
+                target = getattr(lexer, name, None)
+                if not isinstance(target, types.FunctionType):
+                    target = getattr(handler, '__globals__', {}).get(name)
+                if isinstance(target, types.FunctionType):
+                    todo.append(target)
+    return marks
+
+
+def _generated_fingerprint(lexer):
+    """
+    Digest of the rules and options a generated lexer module depends on.
+    """
+    key = (lexer._reflags, lexer._case_fold, lexer._track_lines, lexer._options['bytes'],
+           sorted(lexer._states.items()), sorted(lexer._definitions.items()),
+           [(r.state, r.pattern, r.token_type, r.keywords, r.token_handler is not None,
+             r.token_value_handler is not None) for r in lexer._rules])
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+def _literal(value):
+    """
+    Return the source of a constant, or None if it has none.
+    """
+    if value is None or type(value) in (str, bytes, int, bool):
+        return repr(value)
+    return None
+
+
+class _LexerGenerator:
+    """
+    Source of a module with a lexer class specialized for the rules of
+    another one. See generate().
+    """
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.ignorecase = bool(lexer._reflags & re.IGNORECASE) and not lexer._case_fold
+        self.is_bytes = lexer._options['bytes']
+        self.rule_index = {id(mr): idx for idx, mr in lexer._rule_matchers.items()}
+        self.marks = {idx: _handler_marks(lexer, r.token_handler)
+                      for idx, r in enumerate(lexer._rules) if r.token_handler}
+        self.uses_more = any('more' in m for m in self.marks.values())
+        self.uses_less = any('less' in m for m in self.marks.values())
+        self.globals = {}  # name -> source, of the module globals
+        self.lines = []
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line if line else '')
+
+    def define(self, name, source):
+        self.globals[name] = source
+        return name
+
+    def constant(self, name, source, value):
+        # a constant inlined, or a global when it has no source
+        literal = _literal(value)
+        return self.define(name, source) if literal is None else literal
+
+    def buckets(self, matchers):
+        """
+        Group the characters a token can start with (the ASCII ones, or any
+        byte) by the matchers which can start with them.
+        """
+        firsts = LexerDispatch(matchers, self.ignorecase).tables
+        preds = [None if first is None else [_predicate(d) for d in first] for first in firsts]
+        buckets = {}
+        for c in (range(256) if self.is_bytes else map(chr, range(128))):
+            key = tuple(i for i, p in enumerate(preds) if p is None or any(pred(c) for pred in p))
+            if key:
+                buckets.setdefault(key, []).append(c)
+        return buckets
+
+    def emit_match(self, p, mr, idx):
+        """
+        Emit the code trying matcher p, which keeps the longest match in
+        (k, e, x).
+        """
+        if mr[0] == MATCHER_MATCH_MODE_REG:
+            regex = self.define('_R%d' % idx, 're.compile(%r, %d).match' % (mr[1], mr[2].flags))
+            self.emit(1, 'm = %s(lexscan, lexpos)' % regex)
+            self.emit(1, 'if m is not None:')
+            self.emit(2, 'n = m.end()')
+            self.emit(2, 'if n > e:')
+            self.emit(3, 'k, e, x = %d, n, m' % p)
+            return
+        length = len(mr[1])
+        if self.ignorecase:
+            cond = 'lexscan[lexpos:lexpos + %d].lower() == %r' % (length, mr[1].lower())
+        elif self.is_bytes:
+            cond = 'lexscan[lexpos:lexpos + %d] == %r' % (length, mr[1])  # mmap has no startswith()
+        else:
+            cond = 'lexscan.startswith(%r, lexpos)' % (mr[1],)
+        self.emit(1, 'if lexpos + %d > e and %s:' % (length, cond))
+        self.emit(2, 'k, e, x = %d, lexpos + %d, None' % (p, length))
+
+    def emit_lines(self, indent, start, end):
+        self.emit(indent, 'self.lineno += _count_newlines(lexdata, %r, %s, %s)' % (self.lexer._newline, start, end))
+
+    def emit_text(self, indent, used=False):
+        self.emit(indent, 'text = lexdata[lexpos:e]')
+        if self.uses_more:
+            self.emit(indent, 'if self._lex_more_buffer:')
+            self.emit(indent + 1, 'text = self._lex_more_buffer + text')
+            if used:
+                self.emit(indent + 1, "self._lex_more_buffer = ''")
+
+    def emit_tpval(self, mr, idx):
+        rule = self.lexer._rules[idx]
+        token_type = self.constant('_Y%d' % idx, '_rules[%d].token_type' % idx, rule.token_type)
+        if self.uses_less:
+            self.emit(2, 'self._assigned_next_lexpos = -1')
+        if mr[7] is not None:
+            if self.lexer._reflags & re.IGNORECASE:
+                keywords = '{k.lower(): v for k, v in _rules[%d].keywords.items()}' % idx
+                group = 'lexdata[lexpos:e].lower()'
+            else:
+                keywords, group = 'dict(_rules[%d].keywords)' % idx, 'lexdata[lexpos:e]'
+            keywords = self.define('_K%d' % idx, keywords)
+            self.emit(2, 'char = %s.get(%s, %s)' % (keywords, group, token_type))
+            token_type = 'char'
+        if mr[6]:
+            self.emit(2, 'lineno = self.lineno')
+            self.emit_lines(2, 'lexpos', 'e')
+        if token_type == 'None':
+            self.emit(2, 'self.lexpos = e')
+            self.emit(2, 'return None')
+            return
+        if token_type == 'char':
+            self.emit(2, 'if char is None:')
+            self.emit(3, 'self.lexpos = e')
+            self.emit(3, 'return None')
+        self.emit_text(2, True)
+        self.emit(2, 'tok = _Token(lexer=self, char=%s, text=text, lineno=%s, lexpos=lexpos)'
+                  % (token_type, 'lineno' if mr[6] else 'self.lineno'))
+        if rule.token_value_handler:
+            self.emit(2, 'tok.lval = %s(tok.text)' % self.define('_V%d' % idx, '_rules[%d].token_value_handler' % idx))
+        self.emit(2, 'self.lexpos = e')
+        self.emit(2, 'return tok')
+
+    def emit_handler(self, mr, idx, state):
+        marks = self.marks[idx]
+        handler = self.define('_H%d' % idx, '_rules[%d].token_handler' % idx)
+        self.emit_text(2)
+        self.emit(2, 'tok = _Token(lexer=self, char=None, text=text, lineno=self.lineno, lexpos=lexpos)')
+        if mr[0] == MATCHER_MATCH_MODE_REG:
+            self.emit(2, 'self.lexmatch = x')
+        else:
+            self.emit(2, 'self.lexmatch = lexscan[lexpos:e]')
+        if self.uses_less:
+            self.emit(2, 'self._assigned_next_lexpos = -1')
+        if 'less' in marks:
+            self.emit(2, 'self._lexpos_current = lexpos')
+        self.emit(2, 'self.lexpos = e')
+        self.emit(2, 'r = %s(self, tok)' % handler)
+        if 'terminate' in marks:
+            self.emit(2, 'if self._call_mark_terminate:')
+            self.emit(3, 'self._call_mark_terminate = False')
+            if mr[6]:
+                self.emit_lines(3, 'lexpos', 'e')
+            self.emit(3, 'self.lexpos = e')
+            self.emit(3, 'return _TERMINATE')
+        if 'more' in marks:
+            self.emit(2, 'if self._call_mark_more:')
+            self.emit(3, 'if not self._lex_more_buffer:')
+            self.emit(4, 'self._lex_more_start = lexpos')
+            self.emit(3, 'self._lex_more_buffer = tok.text')
+            self.emit(3, 'self._call_mark_more = False')
+            self.emit(2, 'else:')
+            self.emit(3, "self._lex_more_buffer = ''")
+        elif self.uses_more:
+            self.emit(2, "self._lex_more_buffer = ''")
+        # where lexing goes on, the handler may have moved it
+        if 'less' in marks:
+            self.emit(2, 'n = self.lexpos if self._assigned_next_lexpos == -1 else self._assigned_next_lexpos')
+            self.emit(2, 'self.lexpos = n')
+        elif mr[6] or self.lexer._track_lines:
+            self.emit(2, 'n = self.lexpos')
+        if mr[6]:
+            self.emit(2, 'if n > lexpos:')
+            self.emit_lines(3, 'lexpos', 'n')
+        elif self.lexer._track_lines:
+            self.emit(2, 'if n != e and n > lexpos:')
+            self.emit_lines(3, 'lexpos', 'n')
+        self.emit(2, 'if r is not tok:')
+        self.emit(3, 'tok.char = r')
+        self.emit(2, 'if tok.char is None:')
+        self.emit(3, 'return None if self._active_state == %r else _SWITCH' % (state,))
+        self.emit(2, 'return tok')
+
+    def emit_state(self, si, state):
+        matchers, _, _, _, skip = self.lexer._compiled[state]
+        table = {}
+        for bi, (key, chars) in enumerate(sorted(self.buckets(matchers).items())):
+            name = '_s%d_b%d' % (si, bi)
+            table.update(dict.fromkeys(chars, name))
+            self.emit(0, 'def %s(self, lexdata, lexscan, lexpos):' % name)
+            self.emit(1, 'k, e, x = -1, lexpos - 1, None')
+            for p in key:
+                self.emit_match(p, matchers[p], self.rule_index[id(matchers[p])])
+            for n, p in enumerate(key):
+                mr = matchers[p]
+                self.emit(1, '%s k == %d:' % ('elif' if n else 'if', p))
+                if mr[3] == MATCHER_HANDLER_TYPE_TOKEN:
+                    self.emit_handler(mr, self.rule_index[id(mr)], state)
                 else:
-                    matcher_handler = (MATCHER_HANDLER_TYPE_TPVAL, r.token_type, r.token_value_handler)
+                    self.emit_tpval(mr, self.rule_index[id(mr)])
+            self.emit(1, 'self.lexpos = lexpos')
+            self.emit(1, 'return _GENERIC')
+            self.emit(0, '')
+            self.emit(0, '')
+
+        self.define('_T%d' % si, '{%s}' % ', '.join('%r: %s' % (c, name) for c, name in table.items()))
+        self.emit(0, 'def _s%d(self, lexdata, lexscan, lexlen):' % si)
+        self.emit(1, '# state %r' % (state,))
+        self.emit(1, 'lexpos = self.lexpos')
+        self.emit(1, 'while lexpos < lexlen:')
+        if skip is not None:
+            match = self.define('_S%d' % si, 're.compile(%r).match' % (skip[0].__self__.pattern,))
+            self.emit(2, 'm = %s(lexscan, lexpos)' % match)
+            self.emit(2, 'if m is not None:')
+            if skip[1]:
+                self.emit_lines(3, 'lexpos', 'm.end()')
+            self.emit(3, 'lexpos = m.end()')
+            self.emit(3, 'if lexpos >= lexlen:')
+            self.emit(4, 'break')
+        self.emit(2, 'b = _T%d.get(lexscan[lexpos])' % si)
+        self.emit(2, 'if b is None:')
+        self.emit(3, 'break')
+        self.emit(2, 'tok = b(self, lexdata, lexscan, lexpos)')
+        self.emit(2, 'if tok is not None:')
+        self.emit(3, 'return tok')
+        self.emit(2, 'lexpos = self.lexpos')
+        self.emit(1, 'self.lexpos = lexpos')
+        self.emit(1, 'return _GENERIC')
+        self.emit(0, '')
+        self.emit(0, '')
+
+    def source(self):
+        lexer = self.lexer
+        module, qualname = lexer.__module__, lexer.__qualname__
+        if '<locals>' in qualname:
+            raise ValueError("Lexer class %s can't be imported, it's defined in a function" % qualname)
+        states = list(lexer._states)
+        for si, state in enumerate(states):
+            self.emit_state(si, state)
+
+        head = [
+            '"""',
+            'Lexer generated by plex.generate() from %s.%s. Generate it again' % (module, qualname),
+            'when the rules change, rather than editing it.',
+            '"""',
+            '',
+            'import re',
+            '',
+            'import plex',
+            'from %s import %s as _Base' % (module, qualname.split('.')[0]),
+        ]
+        head += ['_Base = _Base.%s' % name for name in qualname.split('.')[1:]]
+        head += [
+            '',
+            'if plex._generated_fingerprint(_Base) != %r:' % _generated_fingerprint(lexer),
+            "    raise ImportError('The rules of %s.%s have changed, generate %%s again' %% __name__)"
+            % (module, qualname),
+            '',
+            '_rules = _Base._rules',
+            '_Token = _Base._token_class',
+            '_count_newlines = plex._count_newlines',
+            '_generic = plex.Lexer.token',
+            '_GENERIC, _SWITCH, _TERMINATE = object(), object(), object()',
+            '',
+        ]
+        head += ['%s = %s' % item for item in self.globals.items() if not item[0].startswith('_T')]
+        head += ['', '']
+        tail = ['%s = %s' % item for item in self.globals.items() if item[0].startswith('_T')]
+        tail += ['_STATES = {%s}' % ', '.join('%r: _s%d' % (state, si) for si, state in enumerate(states))]
+        tail += [
+            '',
+            '',
+            'class %s(_Base):' % lexer.__name__,
+            '    def __init_subclass__(cls, **kwargs):',
+            '        super().__init_subclass__(**kwargs)',
+            '        # the scan functions only know the rules of _Base',
+            "        if 'token' not in cls.__dict__:",
+            '            cls.token = _generic',
+            '',
+            '    def token(self):',
+            '        if self._stream_margin or self._lex_columns is not None or self._lex_end is not None\\',
+            '                or self.profile is not None:',
+            '            return _generic(self)',
+            '        lexdata, lexscan, lexlen = self.lexdata, self._lexscan, self.lexlen',
+            '        while True:',
+            '            tok = _STATES[self._active_state](self, lexdata, lexscan, lexlen)',
+            '            if tok is _SWITCH:',
+            '                continue',
+            '            if tok is _GENERIC:',
+            '                # errors, EOF and the characters out of the tables',
+            '                return _generic(self)',
+            '            if tok is _TERMINATE:',
+            '                return None',
+            '            return tok',
+        ]
+        return '\n'.join(head + self.lines + tail) + '\n'
+
+
+def generate(lexer, path=None):
+    """
+    Return the source of a Python module defining a subclass of the lexer
+    class specialized for its rules, and write it to path if it's given.
+
+    Each state has its own scan function, with the matchers tried inline
+    after a dispatch on the first character, the token types inlined, and
+    the bookkeeping of more(), less() and terminate() left out for the
+    handlers which don't refer to them. The rare cases (errors, EOF, first
+    characters out of ASCII, input_stream(), tokenize_all() and profiling)
+    go through the generic token().
+
+    The module imports the lexer class, which must be defined at the top
+    level of a module, and refuses to load when its rules have changed.
+    """
+    for state in lexer._states:
+        if state not in lexer._compiled:
+            _compile_state(lexer, state)
+    source = _LexerGenerator(lexer).source()
+    if path is not None:
+        with open(path, 'w') as fd:
+            fd.write(source)
+    return source
 
-                matchers.append(matcher_match + matcher_handler)
 
-        lexer._compiled[state] = (matchers, errf, eoff)
+def _rule_token_types(rules, tokens=()):
+    for r in rules:
+        if r.token_type is not None and r.pattern != '__error__':
+            yield r.token_type
+        if r.keywords:
+            yield from (t for t in r.keywords.values() if t is not None)
+    yield from (t for t in tokens if t is not None)
 
 
 class LexerStoreProxy:
@@ -265,75 +2815,188 @@ class LexerStoreProxy:
 
 
 class LexerMeta(type):
-    _store_proxies = {}
-
     @classmethod
     def __prepare__(cls, name, bases):
-        proxy = cls._store_proxies[name] = LexerStoreProxy()
-        return {'__': RuleAdder(proxy, []).__enter__()}
+        # the rules are stored in the namespace of the class body, so classes
+        # of the same name (nested, or created by several threads) don't mix
+        proxy = LexerStoreProxy()
+        return {'__': RuleAdder(proxy, []).__enter__(), '_rule_store': proxy}
 
     def __init__(self, name, bases, namespace):
         # clean useless attributes
         del self.__
+        proxy = namespace['_rule_store']
+        del self._rule_store
+        # a subclass of a lexer class starts from its options, states,
+        # definitions and rules
+        parent = next((b for b in bases if isinstance(b, LexerMeta)), None)
 
         # collect options into lexer
-        self._options = {'case-insensitive': False, 'reflags': re.VERBOSE}
-        if hasattr(self, 'options'):
+        if parent is not None:
+            self._options = dict(parent._options)
+        else:
+            self._options = {'case-insensitive': False, 'case-fold': False, 'reflags': re.VERBOSE,
+                             'engine': 'loop', 'token-class': LexToken, 'bytes': False, 'track-lines': False,
+                             'table-cache': None, 'sync-pattern': r'\n'}
+        if 'options' in namespace:
             self._options.update(self.options)
             del self.options
 
         self._reflags = self._options['reflags']\
             | (re.IGNORECASE if self._options['case-insensitive'] else 0)
+        self._case_fold = bool(self._options['case-insensitive'] and self._options['case-fold'])
+        self._token_class = self._options['token-class']
+        self._empty_input = b'' if self._options['bytes'] else ''
+        self._newline = b'\n' if self._options['bytes'] else '\n'
+        self._track_lines = bool(self._options['track-lines'])
 
         # collect states into lexer
-        self._states = {'INITIAL': 'inclusive'}
-        if hasattr(self, 'states'):
+        self._states = {'INITIAL': 'inclusive'} if parent is None else dict(parent._states)
+        if 'states' in namespace:
             _normalize_states(self, self.states)
             del self.states
 
         # collect definitions into lexer
-        self._definitions = {}
-        if hasattr(self, 'definitions'):
+        self._definitions = {} if parent is None else dict(parent._definitions)
+        if 'definitions' in namespace:
             self._definitions.update(self.definitions)
             del self.definitions
 
         # collect rules into lexer and then compile them
-        proxy = self.__class__._store_proxies[name]
-        self._rules = proxy._rules
+        self._rules = proxy._rules if parent is None else parent._rules + proxy._rules
+        # the token types are numbered once for all, the ones which can't be
+        # found in the rules are declared by tokens like in PLY
+        self._token_types = TokenTypes(_rule_token_types(self._rules, getattr(self, 'tokens', ())))
+        # the states are compiled when they are entered for the first time
         self._compiled = {}
-        _compile_rules(self)
+        self._compile_lock = threading.Lock()
+        self._rule_matchers = {}
+        self._stream_probes = {}  # state -> LexerDFA telling when a stream needs more data
+        self._tables = _load_tables(self)
 
 
 class Lexer(metaclass=LexerMeta):
     def __init__(self):
+        self._reset()
+
+    def _reset(self):
         cls = self.__class__
 
         self.lexdata = None           # Actual input data (as a string)
+        self._lexscan = None          # Input data the rules are matched on
         self.lexlen = 0               # Length of the input text
+        self._lexbase = 0             # Offset of lexdata in the whole input
+        self._stream = None           # Chunk iterator of input_stream()
+        self._stream_margin = 0       # Lookahead kept in lexdata while streaming
+        self._stream_waiting = False  # Whether the stream had no chunk ready
+        self._mapped_file = None      # MappedFileInput of input_file()
         self.lexmatch = None
         self.lexpos = 0               # Current position in input text
         self.lineno = 1               # Current line number
+        self._track_lines = cls._track_lines
+        self._newlines = array('Q')   # Offsets of the newlines indexed so far
+        self._newlines_end = 0        # End of the indexed input
 
         self._active_state = None
         self._active_matchers = []
         self._active_errf = None
         self._active_eoff = None
+        self._active_scan = None
+        self._active_skip = None      # Merged ignored rules, see _skip_pattern()
         self._state_stack = []
         self._activate_state('INITIAL')
 
         self._reflags_ignorecase = bool(cls._reflags & re.IGNORECASE)
+        self._token_class = cls._token_class
         self._assigned_next_lexpos = -1
         self._lex_more_buffer = ''
+        self._lex_more_start = 0      # Where the text kept by more() starts
         self._lexpos_current = 0
         self._lex_current_token = None
+        self._lex_columns = None
+        self._lex_end = None          # Where tokenize_parallel() stops a chunk
+        self._lex_window = False      # Whether the input is cut after the chunk
+        self._lex_look = 0            # How far the scans looked, for the checkpoints
         self._call_mark_more = False
         self._call_mark_terminate = False
+        self.profile = None           # LexerProfile of start_profile()
 
         # shortcuts to lexer class attributes
         self.lexerstates = cls._states
         self.lexeroptions = cls._options
         self.lexerrules = cls._rules
 
+    def _worker_copy(self):
+        """
+        Return a copy of this lexer without its input and compiled rules, to
+        be pickled for the workers of tokenize_parallel(). The worker gets
+        them back by _worker_start().
+        """
+        state = self.__dict__.copy()
+        for name in ('lexdata', '_lexscan', '_stream', '_mapped_file', 'lexmatch', '_lex_current_token',
+                     '_lex_columns', '_active_matchers', '_active_errf', '_active_eoff', '_active_scan',
+                     '_active_skip', 'lexerstates', 'lexeroptions', 'lexerrules'):
+            state[name] = None
+        state.update(lexlen=0, _lexbase=0, _stream_margin=0, _newlines=array('Q'), _newlines_end=0)
+        # copies aren't profiled
+        for name in _PROFILE_HOOKS:
+            state.pop(name, None)
+        state['profile'] = None
+        lexer = self.__class__.__new__(self.__class__)
+        lexer.__dict__.update(state)
+        return lexer
+
+    def _worker_start(self):
+        """
+        Attach the compiled rules again to a copy made by _worker_copy().
+        """
+        cls = self.__class__
+        self.lexerstates = cls._states
+        self.lexeroptions = cls._options
+        self.lexerrules = cls._rules
+        self._activate_state(self._active_state)
+
+    def clone(self):
+        """
+        Return a new lexer of the same class, for lexing another input, in
+        another thread for instance. The compiled rules are shared with this
+        lexer, and the other attributes are copied, containers (lists, dicts,
+        sets, deques, arrays) one level deep, so that the clone can change them
+        on its own. The clone starts without input, in state INITIAL.
+        """
+        lexer = self._worker_copy()
+        lexer._reset()
+        for name, value in lexer.__dict__.items():
+            if isinstance(value, (list, dict, set, bytearray, deque, array)):
+                lexer.__dict__[name] = copy.copy(value)
+        return lexer
+
+    @classmethod
+    def type_id(cls, token_type):
+        """
+        Return the integer code of a token type in this class. The types of
+        the rules and their keywords are numbered from 0 in the order of the
+        rules, and then the types listed in the tokens attribute of the class,
+        like the ones returned by token handlers. KeyError is raised for
+        other types.
+        """
+        return cls._token_types.codes[token_type]
+
+    @classmethod
+    def type_name(cls, type_id):
+        """
+        Return the token type of an integer code.
+        """
+        return cls._token_types.names[type_id]
+
+    @classmethod
+    def type_enum(cls, name=None):
+        """
+        Return an IntEnum of the token types of this class, for parsers
+        dispatching on type_id. See TokenTypes.enum().
+        """
+        return cls._token_types.enum(name or cls.__name__ + 'Type')
+
     @property
     def lexstate(self):
         return self._active_state
@@ -345,16 +3008,262 @@ class Lexer(metaclass=LexerMeta):
         # Pull off the first character to see if s looks like a string
         if not isinstance(s[:1], StringTypes):
             raise ValueError('Expected a string')
+        if self.__class__._options['bytes'] and isinstance(s, str):
+            raise ValueError('Expected bytes')
         self.lexdata = s
         self.lexpos = 0
         self.lexlen = len(s)
+        # In case-fold mode, the rules are matched against the folded input
+        self._lexscan = fold_case(s) if self.__class__._case_fold else s
+        self._lexbase = 0
+        self._stream = None
+        self._stream_margin = 0
+        self._mapped_file = None
+        self._newlines = array('Q')
+        self._newlines_end = 0
+
+    def input_file(self, path, encoding=None, chunk_size=65536):
+        """
+        Push a file into the lexer without reading it up front.
+
+        The file is memory-mapped. Without encoding, the map itself is the
+        input, for grammars of bytes patterns. Otherwise it's decoded lazily
+        by chunks through input_stream(), and byte_offset() maps lexpos back
+        to the file.
+        """
+        mapped = MappedFileInput(path, encoding)
+        if encoding is None:
+            self.input(mapped.mmap)
+        else:
+            self.input_stream(mapped.chunks(chunk_size), chunk_size)
+        self._mapped_file = mapped
+
+    def byte_offset(self, lexpos):
+        """
+        Return the offset in the input file of character offset lexpos.
+        """
+        if self._mapped_file is None:
+            return lexpos
+        return self._mapped_file.byte_offset(lexpos)
+
+    def input_stream(self, source, chunk_size=65536):
+        """
+        Push a stream into the lexer. The source is a file-like object, or an
+        iterable of string chunks.
+
+        Only a window of the input is kept in lexdata, from the current token
+        to at least chunk_size characters ahead. It grows when a match runs to
+        the end of the window, or when a rule may still match up to there
+        (a long string, or a comment whose end isn't read yet), so tokens of
+        any length are matched as a whole. lexpos and token positions are offsets in the whole input, and
+        lexdata[lexpos - lexbase] is the character at lexpos.
+
+        An iterator which has no chunk ready yet may return STREAM_WAIT.
+        Then token() returns STREAM_WAIT too, and it goes on from there when
+        it's called again.
+        """
+        if hasattr(source, 'read'):
+            chunks = iter(lambda: source.read(chunk_size), source.read(0))
+        else:
+            chunks = iter(source)
+        first = next((c for c in chunks if c), self.__class__._empty_input)
+        self.input(first)
+        self._stream = chunks
+        self._stream_margin = chunk_size
+        self._stream_fill(0)
+
+    async def atokens(self, source, chunk_size=65536, encoding=None, yield_tokens=1000, yield_seconds=0.01):
+        """
+        Lex a stream like input_stream(), reading it asynchronously, and
+        yield the tokens. The source is an asyncio.StreamReader (or any
+        object with an async read(n)), or an async iterable of chunks. Bytes
+        are decoded with encoding if it's given.
+
+        Data is only read when the lexer needs it, and the __eof__ rule only
+        runs when the stream ends. Control is given back to the event loop
+        after every yield_tokens tokens or yield_seconds seconds.
+        """
+        import asyncio
+
+        reader = hasattr(source, 'read')
+        if reader:
+            async def read():
+                return await source.read(chunk_size)
+        else:
+            read = source.__aiter__().__anext__
+        decoder = None if encoding is None else codecs.getincrementaldecoder(encoding)()
+
+        chunks = AsyncChunks()
+        self.input(self.__class__._empty_input)
+        self._stream = chunks
+        self._stream_margin = chunk_size
+
+        perf_counter = time.perf_counter
+        count, deadline = 0, perf_counter() + yield_seconds
+        while True:
+            tok = self.token()
+            if tok is STREAM_WAIT:
+                try:
+                    data = await read()
+                    ended = reader and not data  # a reader returns nothing at the end
+                except StopAsyncIteration:
+                    data, ended = None, True
+                if decoder is not None:
+                    data = decoder.decode(data or b'', final=ended)
+                if data:
+                    chunks.chunks.append(data)
+                chunks.ended = ended
+                continue
+            if tok is None:
+                return
+            yield tok
+            count += 1
+            if count >= yield_tokens or perf_counter() >= deadline:
+                await asyncio.sleep(0)
+                count, deadline = 0, perf_counter() + yield_seconds
+
+    @property
+    def lexbase(self):
+        """
+        Offset of lexdata in the whole input.
+        """
+        return self._lexbase
+
+    def _stream_fill(self, lexpos, grow=0):
+        """
+        Read chunks until lexdata holds enough lookahead after lexpos (and at
+        least grow more characters), dropping the consumed text. Return
+        lexpos relative to the new lexdata.
+        """
+        need = max(self._stream_margin - (self.lexlen - lexpos), grow)
+        chunks = []
+        self._stream_waiting = False
+        while need > 0:
+            chunk = next(self._stream, None)
+            if chunk is STREAM_WAIT:
+                self._stream_waiting = True
+                break
+            if chunk is None:
+                self._stream = None
+                self._stream_margin = 0
+                break
+            if not isinstance(chunk[:1], type(self.lexdata[:0])):
+                raise ValueError('Expected a chunk of %s' % type(self.lexdata).__name__)
+            chunks.append(chunk)
+            need -= len(chunk)
+
+        # Nothing before the current token can be reached by less() any more
+        drop = lexpos if lexpos > self._stream_margin else 0
+        if self._track_lines:
+            self._index_newlines(self._lexbase + drop)
+        data = self.lexdata[:0].join(chunks)
+        self.lexdata = self.lexdata[drop:] + data
+        if self.__class__._case_fold:
+            self._lexscan = self._lexscan[drop:] + fold_case(data)
+        else:
+            self._lexscan = self.lexdata
+        self.lexlen = len(self.lexdata)
+        self._lexbase += drop
+        return lexpos - drop
+
+    def _stream_scan(self, lexpos):
+        """
+        Find the best match at lexpos, reading from the stream as needed.
+        """
+        while True:
+            if self._stream_margin and self.lexlen - lexpos < self._stream_margin:
+                lexpos = self._stream_fill(lexpos)
+                if self._stream_waiting:
+                    return lexpos, STREAM_WAIT
+            if lexpos >= self.lexlen:
+                return lexpos, None
+            found = self._active_scan(self._lexscan, lexpos)
+            if self._stream_margin and self._stream_needs_data(lexpos, found):
+                # the match may go on in the coming data: double the lookahead
+                lexpos = self._stream_fill(lexpos, self.lexlen - lexpos)
+                if self._stream_waiting:
+                    return lexpos, STREAM_WAIT
+                continue
+            return lexpos, found
+
+    def _stream_needs_data(self, lexpos, found):
+        """
+        Whether the match found at lexpos may change with the data after the
+        window: if it runs to the end of the window, or if a rule may still
+        match up to there by the automaton of _stream_probe().
+        """
+        if found is not None and found[1] == self.lexlen:
+            return True
+        probe = self.__class__._stream_probes.get(self._active_state, False)
+        if probe is False:
+            probe = self._stream_probe(self._active_state)
+        return probe is not None and bool(
+            probe.live(self._lexscan, lexpos, found[2] if found is not None else ''))
+
+    def _scan_reach(self, lexpos, found):
+        """
+        Return how far the scan finding found at lexpos may have looked into
+        the input, by the automaton of _stream_probe().
+        """
+        probe = self.__class__._stream_probes.get(self._active_state, False)
+        if probe is False:
+            probe = self._stream_probe(self._active_state)
+        if probe is None:
+            return self.lexlen + 1
+        return probe.reach(self._lexscan, lexpos, found[2] if found is not None else '')
+
+    def _stream_probe(self, state):
+        cls = self.__class__
+        ignorecase = bool(cls._reflags & re.IGNORECASE) and not cls._case_fold
+        try:
+            probe = LexerDFA(self._active_matchers, ignorecase, probe=True)
+        except ImportError:
+            probe = None  # sre_parse is not available
+        return cls._stream_probes.setdefault(state, probe)
+
+    def _index_newlines(self, end):
+        """
+        Extend the newline index up to offset end of the input.
+        """
+        base, lexdata, newline = self._lexbase, self.lexdata, self.__class__._newline
+        pos, end = max(self._newlines_end, base) - base, min(end - base, self.lexlen)
+        newlines = self._newlines
+        while pos < end:
+            pos = lexdata.find(newline, pos, end)
+            if pos < 0:
+                break
+            newlines.append(pos + base)
+            pos += 1
+        self._newlines_end = max(self._newlines_end, end + base)
+
+    def locate(self, lexpos):
+        """
+        Return (lineno, column) of an offset of the input, both from 1. The
+        lines are counted from the start of the input, whatever lineno is set
+        to. With input_stream(), only offsets in lexdata can be located
+        unless the 'track-lines' option is on.
+        """
+        if lexpos > self._newlines_end:
+            self._index_newlines(lexpos)
+        line = bisect.bisect_left(self._newlines, lexpos)
+        start = self._newlines[line - 1] + 1 if line else 0
+        return line + 1, lexpos - start + 1
+
+    def find_column(self, lexpos):
+        """
+        Return the column of an offset of the input, from 1.
+        """
+        return self.locate(lexpos)[1]
 
     def _activate_state(self, state):
         cls = self.__class__
         if state not in cls._states:
             raise ValueError('Undefined state')
+        compiled = cls._compiled.get(state)
+        if compiled is None:
+            compiled = _compile_state(cls, state)
         self._active_state = state
-        self._active_matchers, self._active_errf, self._active_eoff = cls._compiled[state]
+        self._active_matchers, self._active_errf, self._active_eoff, self._active_scan, self._active_skip = compiled
 
     def begin(self, state):
         """
@@ -384,6 +3293,25 @@ class Lexer(metaclass=LexerMeta):
     def current_state(self):
         return self.top_state()
 
+    def snapshot(self):
+        """
+        Return the state of the lexer as a LexerSnapshot, for restore().
+        """
+        return LexerSnapshot(self.lexpos, self.lineno, self._active_state, tuple(self._state_stack),
+                             self._lex_more_buffer, self._assigned_next_lexpos)
+
+    def restore(self, snap):
+        """
+        Go back to the state saved by snapshot(), on the same input.
+        """
+        if snap.lexpos < self._lexbase:
+            raise ValueError('Snapshot is before the input kept by input_stream()')
+        self._activate_state(snap.state)
+        self._state_stack = list(snap.stack)
+        self.lexpos, self.lineno = snap.lexpos, snap.lineno
+        self._lex_more_buffer, self._assigned_next_lexpos = snap.more, snap.less
+        self._lex_more_start = snap.lexpos - len(snap.more)
+
     def skip(self, n):
         """
         Skip the next n characters.
@@ -411,74 +3339,109 @@ class Lexer(metaclass=LexerMeta):
         """
         self._call_mark_terminate = True
 
+    def start_profile(self):
+        """
+        Start counting what the rules of the lexer do, and return the
+        LexerProfile, which is also kept in self.profile. Profiling slows
+        lexing down, but token() is left as it is when it's stopped.
+        """
+        if self.profile is None:
+            self.profile = LexerProfile()
+        if '_activate_state' not in self.__dict__:
+            self.profile._attach(self)
+        return self.profile
+
+    def stop_profile(self):
+        """
+        Stop profiling, and return the LexerProfile.
+        """
+        LexerProfile._detach(self)
+        return self.profile
+
     def token(self):
         """
         Return the next token.
         TODO: Careful tune for performance is needed.
         """
-        reflags_ignorecase = self._reflags_ignorecase
-        lexpos = self.lexpos
-        lexlen = self.lexlen
+        # Positions in this loop are relative to lexdata, which only holds a
+        # window of the input when it's read by input_stream().
+        base = self._lexbase
+        lexpos = self.lexpos - base
+        lexlen = self.lexlen if self._lex_end is None else self._lex_end
         lexdata = self.lexdata
-
-        while lexpos < lexlen:
+        lexscan = self._lexscan
+        token_class = self._token_class
+        columns = self._lex_columns
+        stream_margin = self._stream_margin
+        track_lines = self._track_lines
+        newline = self.__class__._newline
+        looks = columns is not None and columns.checkpoints is not None
+
+        while lexpos < lexlen or stream_margin:
             # Find the best match
-            match_obj, match_endpos, match_group, match_len, matcher = None, 0, '', 0, None
-
-            for mr in self._active_matchers:
-                match_mode, pattern, regex = mr[0:3]
-
-                # match mode 1: simple string match
-                if match_mode == MATCHER_MATCH_MODE_STR:
-                    m_obj = match_constant_pattern(pattern, reflags_ignorecase, lexdata, lexpos)
-                    if not m_obj:
-                        continue
-                    m_group = m_obj
-                    m_len = len(m_group)
-                    m_endpos = lexpos + m_len
-
-                # match mode 2: regex match
-                elif match_mode == MATCHER_MATCH_MODE_REG:
-                    m_obj = regex.match(lexdata, lexpos)
-                    if not m_obj:
-                        continue
-                    m_group = m_obj.group()
-                    m_len = len(m_group)
-                    m_endpos = m_obj.end()
-
-                # override previous match info
-                if match_obj is None or m_len > match_len:
-                    match_obj, match_endpos, match_group, match_len, matcher\
-                        = m_obj, m_endpos, m_group, m_len, mr
+            if stream_margin:
+                lexpos, found = self._stream_scan(lexpos)
+                base, lexlen, lexdata, lexscan, stream_margin\
+                    = self._lexbase, self.lexlen, self.lexdata, self._lexscan, self._stream_margin
+                if found is STREAM_WAIT:
+                    self.lexpos = lexpos + base
+                    return found  # the chunk iterator of atokens() has to be fed
+                if lexpos >= lexlen:
+                    break
+            else:
+                skip = self._active_skip
+                if skip is not None:
+                    # Consume a run of ignored characters in one go
+                    skipped = skip[0](lexscan, lexpos)
+                    if skipped is not None:
+                        if skip[1]:
+                            self.lineno += _count_newlines(lexdata, newline, lexpos, skipped.end())
+                        lexpos = skipped.end()
+                        if lexpos >= lexlen:
+                            break
+                found = self._active_scan(lexscan, lexpos)
+                if self._lex_window and self._stream_needs_data(lexpos, found):
+                    raise _ChunkUntrusted()  # the match may go on after the cut text
+                if looks:
+                    self._lex_look = max(self._lex_look, self._scan_reach(lexpos, found) + base)
 
             # Clean values able to be modified from exteral.
             self._assigned_next_lexpos = -1
 
-            if match_obj is not None:
+            if found is not None:
+                match_obj, match_endpos, match_group, matcher = found
+                if lexscan is not lexdata:
+                    match_group = lexdata[lexpos:match_endpos]
                 # There is a match.
-                # Create a token as the return value
-                tok = LexToken(lexer=self, char=None,
-                               text=(self._lex_more_buffer + match_group) if self._lex_more_buffer else match_group,
-                               lineno=self.lineno, lexpos=lexpos)
-                self._lex_current_token = tok
-
                 handler_type = matcher[3]
                 if handler_type == MATCHER_HANDLER_TYPE_TOKEN:
+                    # Create a token as the argument of the handler
+                    more_buffer = self._lex_more_buffer
+                    tok = token_class(lexer=self, char=None,
+                                      text=(more_buffer + match_group) if more_buffer else match_group,
+                                      lineno=self.lineno, lexpos=lexpos + base)
+                    self._lex_current_token = tok
+
                     # Call the token handler
                     self.lexmatch = match_obj
-                    self._lexpos_current = lexpos
-                    self.lexpos = lexpos = match_endpos
+                    self._lexpos_current = lexpos + base
+                    tok_lexpos, lexpos = lexpos, match_endpos
+                    self.lexpos = lexpos + base
                     token_handler = matcher[4]
                     handler_return = token_handler(self, tok)
 
                     # Terminate and return EOF if self.terminate called
                     if self._call_mark_terminate:
                         self._call_mark_terminate = False
-                        self.lexpos = lexpos
+                        if matcher[6]:
+                            self.lineno += _count_newlines(lexdata, newline, tok_lexpos, lexpos)
+                        self.lexpos = lexpos + base
                         return None
 
                     # Store tok.text if self.more has been called
                     if self._call_mark_more:
+                        if not more_buffer:
+                            self._lex_more_start = tok_lexpos + base
                         self._lex_more_buffer = tok.text
                         self._call_mark_more = False
                     else:
@@ -486,79 +3449,292 @@ class Lexer(metaclass=LexerMeta):
 
                     # Use manually assigned next lexpos first
                     if self._assigned_next_lexpos == -1:
-                        lexpos = self.lexpos
+                        lexpos = self.lexpos - base
                     else:
-                        lexpos = self._assigned_next_lexpos
+                        lexpos = self._assigned_next_lexpos - base
+
+                    # Count the lines of the consumed text, which the handler may have changed
+                    if (matcher[6] or track_lines and lexpos != match_endpos) and lexpos > tok_lexpos:
+                        self.lineno += _count_newlines(lexdata, newline, tok_lexpos, lexpos)
 
                     if handler_return is not tok:
                         tok.char = handler_return
                     if tok.char is None:
                         continue  # ignore this token if the token type as None
+                    elif columns is not None:
+                        columns.append(tok.char, self._lex_more_start if more_buffer else tok.lexpos,
+                                       min(lexpos, match_endpos) + base, tok.lineno)
+                        if columns.checkpoints is not None:
+                            columns.checkpoint(self, lexpos + base)
+                        continue
                     else:
-                        self.lexpos = lexpos
+                        self.lexpos = lexpos + base
                         return tok  # accept and return the token with a valid token type
 
                 elif handler_type == MATCHER_HANDLER_TYPE_TPVAL:
                     token_type, token_value_handler = matcher[4:6]
+                    if matcher[7] is not None:
+                        # the token type of a keyword
+                        token_type = matcher[7].get(match_group.lower() if self._reflags_ignorecase
+                                                    else match_group, token_type)
+                    lineno = self.lineno
+                    if matcher[6]:
+                        self.lineno += _count_newlines(lexdata, newline, lexpos, match_endpos)
                     # If no token type was set, it's an ignored token
                     if token_type is None:
                         lexpos = match_endpos
                         continue
+                    elif columns is not None:
+                        if self._lex_more_buffer:
+                            columns.append(token_type, self._lex_more_start, match_endpos + base, lineno)
+                            self._lex_more_buffer = ''
+                        else:
+                            columns.append(token_type, lexpos + base, match_endpos + base, lineno)
+                        lexpos = match_endpos
+                        if columns.checkpoints is not None:
+                            columns.checkpoint(self, lexpos + base)
+                        continue
                     else:
-                        tok.char = token_type
+                        # Create a token as the return value
+                        if self._lex_more_buffer:
+                            match_group = self._lex_more_buffer + match_group
+                            self._lex_more_buffer = ''
+                        tok = token_class(lexer=self, char=token_type, text=match_group,
+                                          lineno=lineno, lexpos=lexpos + base)
                         if token_value_handler:
                             tok.lval = token_value_handler(tok.text)
-                        self.lexpos = match_endpos
+                        self.lexpos = match_endpos + base
                         return tok
 
             else:
                 # No match. There is an error.
                 if self._active_errf:
-                    tok = LexToken(lexer=self, char='__error__',
-                                   text=self.lexdata[lexpos:],
-                                   lineno=self.lineno, lexpos=lexpos)
-                    self.lexpos = lexpos
+                    tok = token_class(lexer=self, char='__error__',
+                                      text=LexInputView(lexdata, lexpos),
+                                      lineno=self.lineno, lexpos=lexpos + base)
+                    self.lexpos = lexpos + base
 
                     newtok = self._active_errf(self, tok)
-                    if lexpos != self.lexpos:
-                        lexpos = self.lexpos
+                    if track_lines and self.lexpos > lexpos + base:
+                        self.lineno += _count_newlines(lexdata, newline, lexpos, self.lexpos - base)
+                    if lexpos + base != self.lexpos:
+                        if newtok and columns is not None:
+                            columns.append(newtok.char, newtok.lexpos, self.lexpos, newtok.lineno)
+                            if columns.checkpoints is not None:
+                                columns.checkpoint(self, self.lexpos)
+                            newtok = None
+                        lexpos = self.lexpos - base
                         if not newtok:
                             continue
                         return newtok
                     # Error method didn't change text position at all. This is an error.
 
-                self.lexpos = lexpos
-                raise LexError("Illegal character '%s' at index %d" % (lexdata[lexpos], lexpos), lexdata[lexpos:])
+                self.lexpos = lexpos + base
+                char = lexdata[lexpos:lexpos+1]
+                char = repr(char) if isinstance(char, bytes) else "'%s'" % char
+                raise LexError('Illegal character %s at index %d' % (char, lexpos + base),
+                               LexInputView(lexdata, lexpos))
+
+        if self._lex_end is not None:
+            # stopped at _lex_end, the end of the input is somewhere else
+            self.lexpos = lexpos + base
+            return None
 
         # EOF comes
         if self._active_eoff:
             handler_type, handler_token, _ = self._active_eoff
 
-            tok = LexToken(lexer=self, char='__eof__', text='',
-                           lineno=self.lineno, lexpos=lexpos)
+            tok = token_class(lexer=self, char='__eof__', text=self.__class__._empty_input,
+                              lineno=self.lineno, lexpos=lexpos + base)
 
+            self.lexpos = lexpos + base
             if handler_type == MATCHER_HANDLER_TYPE_TOKEN:
-                self.lexpos = lexpos
                 handler_return = handler_token(self, tok)
                 if handler_return is not tok:
                     tok.char = handler_return
-                if tok.char is None:
-                    return None
-                else:
-                    return tok
-
             elif handler_type == MATCHER_HANDLER_TYPE_TPVAL:
-                if handler_token is None:
-                    return None
-                else:
-                    tok.char = handler_token
-                    return tok
+                tok.char = handler_token
+
+            if tok.char is None:
+                return None
+            elif columns is not None:
+                columns.append(tok.char, tok.lexpos, tok.lexpos, tok.lineno)
+                if columns.checkpoints is not None:
+                    columns.checkpoint(None, tok.lexpos)  # lexing can't resume after EOF
+                return None
+            else:
+                return tok
 
-        self.lexpos = lexpos + 1
+        self.lexpos = lexpos + base + 1
         if self.lexdata is None:
             raise RuntimeError('No input string given with input()')
         return None
 
+    def tokenize_all(self):
+        """
+        Lex the rest of the input and return the tokens as TokenColumns.
+        Token handlers still run, but the tokens of rules with a plain token
+        type are never created, and their value handlers are not called.
+        """
+        return self._tokenize_into(TokenColumns(self.lexdata, token_types=self.__class__._token_types))
+
+    def _tokenize_into(self, columns):
+        self._lex_columns = columns
+        try:
+            self.token()
+        finally:
+            self._lex_columns = None
+        return columns
+
+    def tokenize_incremental(self, text):
+        """
+        Lex text like input(text) and tokenize_all(), and return the tokens
+        as IncrementalTokens, which relex() updates after edits.
+        """
+        self.input(text)
+        initial = self._get_sync_state()
+        self._lex_look = self.lexpos
+        columns = self._tokenize_into(TokenColumns(text, True, self.__class__._token_types))
+        return IncrementalTokens(text, initial, [(columns, 0, len(columns), 0, 0)])
+
+    def relex(self, tokens, start, end, new_text):
+        """
+        Return the IncrementalTokens of tokens.lexdata with the text from
+        start to end replaced by new_text.
+
+        Lexing restarts from the last checkpoint before the newline ending
+        the line before the edit, and before the edit's text was looked at:
+        a scan may look past its match (e.g. a comment left open looks up to
+        the end), as far as the automaton of the rules goes. It stops at the
+        first checkpoint after the edit where the lexer is in the same state
+        at the same (shifted) offset as before, having looked no further.
+        The old tokens from there on are reused, with shifted positions and
+        lines. The handlers shouldn't depend on state kept outside of the
+        lexer state, its stack and lineno, or on text they didn't match.
+        """
+        old = tokens.lexdata
+        text = old[:start] + new_text + old[end:]
+        delta = len(new_text) - (end - start)
+
+        k = min(tokens.find_checkpoint(old.rfind(self.__class__._newline, 0, start)),
+                tokens.find_unseen(start))
+        self.input(text)
+        self._set_sync_state(tokens.checkpoint(k))
+        self._lex_look = tokens.look(k)
+        columns = TokenColumns(text, True, self.__class__._token_types)
+
+        # try the old checkpoints after the edit, further and further apart
+        j, step, lined_up = tokens.find_resume(end), 1, None
+        try:
+            while True:
+                target = tokens.resume(j) + delta if j < len(tokens) else None
+                self._lex_end = target
+                self._tokenize_into(columns)
+                if target is None or self.lexpos < target:
+                    break  # the end of the input, or terminated
+                checkpoint = tokens.checkpoint(j)
+                if checkpoint is not None and self.lexpos == target\
+                        and self._get_sync_state()[1:4] == checkpoint[1:4]\
+                        and self._lex_look <= tokens.look(j) + delta:
+                    lined_up = j
+                    break
+                j, step = max(j + step, tokens.find_resume(self.lexpos - delta)), step * 2
+        finally:
+            self._lex_end = None
+
+        segments = tokens._slice(0, k + 1) + [(columns, 0, len(columns), 0, 0)]
+        if lined_up is not None:
+            line_offset = self.lineno - tokens.checkpoint(lined_up)[4]
+            segments += tokens._slice(lined_up + 1, len(tokens), delta, line_offset)
+        return IncrementalTokens(text, tokens.initial, segments)
+
+    def _get_sync_state(self):
+        return (self.lexpos, self._active_state, tuple(self._state_stack),
+                self._lex_more_buffer or '', self.lineno)
+
+    def _set_sync_state(self, sync_state):
+        self.lexpos, state, stack, self._lex_more_buffer, self.lineno = sync_state
+        self._lex_more_start = self.lexpos - len(self._lex_more_buffer)
+        self._activate_state(state)
+        self._state_stack = list(stack)
+
+    def tokenize_parallel(self, text, workers=None, chunk_size=1 << 22, lookahead=65536, executor=None):
+        """
+        Lex text in chunks by a pool of worker processes, and return the
+        tokens as TokenColumns, like input(text) and tokenize_all().
+
+        The text is cut after the first match of the 'sync-pattern' option
+        (a newline by default) past every chunk_size characters. A chunk is
+        lexed from the INITIAL state with an empty state stack, seeing at
+        most lookahead characters after its end. The chunks are run by
+        executor, or by a ProcessPoolExecutor of workers processes. The
+        lexer has to be picklable, and each chunk is lexed by its own copy.
+
+        A chunk is kept if the one before it ended exactly at the cut in the
+        INITIAL state with an empty stack, and no match in it may run past
+        the lookahead (see input_stream()). Otherwise it's lexed again in
+        this process, from where the chunk before it really ended.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        cls = self.__class__
+        sync = cls._options['sync-pattern']
+        if cls._options['bytes'] and isinstance(sync, str):
+            sync = sync.encode('latin-1')
+        sync = re.compile(sync, cls._reflags)
+        cuts = [0]
+        while len(text) - cuts[-1] > chunk_size:
+            m = sync.search(text, cuts[-1] + chunk_size)
+            if m is None or m.end() >= len(text):
+                break
+            cuts.append(m.end())
+        cuts.append(len(text))
+
+        columns = TokenColumns(text, token_types=cls._token_types)
+        results = [None] * (len(cuts) - 1)
+        if len(cuts) > 2 and (workers != 1 or executor is not None):
+            args = ([self._worker_copy()] * (len(cuts) - 1), [text[i:j + lookahead] for i, j in zip(cuts, cuts[1:])],
+                    cuts[:-1], cuts[1:-1] + [None])
+            if executor is None:
+                with ProcessPoolExecutor(workers) as executor:
+                    results = list(executor.map(_tokenize_chunk, *args))
+            else:
+                results = list(executor.map(_tokenize_chunk, *args))
+
+        self.input(text)
+        cond = None  # (lexpos, state, stack, more buffer, lineno) where the last chunk ended
+        try:
+            for k, result in enumerate(results):
+                end = cuts[k + 1] if k + 2 < len(cuts) else None
+                if end is not None and k and cond[0] >= end:
+                    continue  # a token runs over this chunk
+                if result is not None and (k == 0 or cond[:4] == (cuts[k], 'INITIAL', (), '')):
+                    # the lines of a chunk but the first are counted from 1
+                    line_offset = cond[4] - 1 if k else 0
+                    chunk, cond = result
+                    columns.extend(chunk, line_offset)
+                    cond = cond[:4] + (cond[4] + line_offset,)
+                else:
+                    # lex the chunk again from where the one before ended
+                    if k:
+                        self._set_sync_state(cond)
+                    self._lex_end = end
+                    columns.extend(self.tokenize_all())
+                    cond = self._get_sync_state()
+                if end is not None and cond[0] < end:
+                    break  # terminated
+        finally:
+            self._lex_end = None
+        self._set_sync_state(cond)
+        return columns
+
+    def lookahead(self):
+        """
+        Return a TokenBuffer over the next tokens, with peek(k), next() and
+        mark()/reset(). Tokens should then be taken from it only.
+        """
+        return TokenBuffer(self)
+
     # Iterator interface
     def __iter__(self):
         return self
@@ -0,0 +1,94 @@
+import asyncio
+from plex import Lexer
+
+
+class InterfaceAtokensLexer(Lexer):
+    options = {'engine': 'dfa'}
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'"[^"]*"')('STRING', lambda s: s[1:-1])
+    __(r'[a-zé]+')('WORD')
+
+    @__(r'\n')
+    def t_newline(self, t):
+        self.lineno += 1
+
+    @__('__eof__')
+    def t_eof(self, t):
+        self.eofs += 1
+
+    def __init__(self):
+        super().__init__()
+        self.eofs = 0
+
+
+def dump(tokens):
+    return ' '.join('%s:%r@%d,%d' % (tok.type, tok.value, tok.lineno, tok.lexpos) for tok in tokens) + '\n'
+
+
+async def pieces(*texts):
+    for text in texts:
+        await asyncio.sleep(0)
+        yield text
+
+
+async def main():
+    global result
+    text = '12 ab "a long\nstring" 345\ncafé 6'
+    lex = InterfaceAtokensLexer()
+    lex.input(text)
+    result = dump(lex)
+
+    # an async iterator cutting tokens, read by chunks of 4 characters
+    lex = InterfaceAtokensLexer()
+    result += dump([tok async for tok in lex.atokens(pieces('12 a', 'b "a lo', 'ng\nstr', 'ing" 3', '45\ncafé 6'),
+                                                     chunk_size=4)])
+    result += 'eof: %d\n' % lex.eofs
+
+    # a StreamReader fed with bytes, cutting the é in two
+    reader = asyncio.StreamReader()
+    data = text.encode('utf-8')
+    cut = data.index(b'\xa9')
+
+    async def feed():
+        for part in (data[:5], data[5:cut], data[cut:]):
+            await asyncio.sleep(0)
+            reader.feed_data(part)
+        await asyncio.sleep(0)
+        reader.feed_eof()
+
+    lex = InterfaceAtokensLexer()
+    feeding = asyncio.ensure_future(feed())
+    result += dump([tok async for tok in lex.atokens(reader, chunk_size=8, encoding='utf-8')])
+    await feeding
+    result += 'eof: %d\n' % lex.eofs
+
+    # other tasks run while a long input is lexed
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    ticker = asyncio.ensure_future(tick())
+    count = 0
+    async for tok in InterfaceAtokensLexer().atokens(pieces('1 ' * 5000), yield_tokens=100):
+        count += 1
+    ticker.cancel()
+    result += '%d tokens, %s\n' % (count, ticks >= 50)
+
+
+result = ''
+asyncio.run(main())
+
+expect = """\
+NUMBER:12@1,0 WORD:None@1,3 STRING:'a long\\nstring'@1,6 NUMBER:345@1,22 WORD:None@2,26 NUMBER:6@2,31
+NUMBER:12@1,0 WORD:None@1,3 STRING:'a long\\nstring'@1,6 NUMBER:345@1,22 WORD:None@2,26 NUMBER:6@2,31
+eof: 1
+NUMBER:12@1,0 WORD:None@1,3 STRING:'a long\\nstring'@1,6 NUMBER:345@1,22 WORD:None@2,26 NUMBER:6@2,31
+eof: 1
+5000 tokens, True
+"""
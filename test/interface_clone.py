@@ -0,0 +1,76 @@
+import threading
+
+from plex import Lexer
+
+
+def make_lexer(kind, options):
+    # classes of the same name, holding different rules
+    class CloneLexer(Lexer):
+        __(r'\s+')(None)
+        __(r'\d+')('NUMBER')
+        __(r'[a-z]+')(kind)
+
+        @__('__error__')
+        def t_error(self, t):
+            self.skip(1)
+
+    CloneLexer._options.update(options)
+    return CloneLexer
+
+
+def lex_all(lex, text):
+    lex.input(text)
+    tokens = []
+    tok = lex.token()
+    while tok is not None:
+        tokens.append('%s:%r@%d' % (tok.type, tok.text, tok.lexpos))
+        tok = lex.token()
+    return ' '.join(tokens)
+
+
+texts = ['ab 12 %s cd %d' % ('x' * (i % 7), i) for i in range(16)]
+
+result = ''
+for engine in ('loop', 'dfa'):
+    classes = {}
+
+    def create(kind):
+        classes[kind] = make_lexer(kind, {'engine': engine})
+
+    threads = [threading.Thread(target=create, args=(kind,)) for kind in ('WORD', 'NAME', 'ID', 'KEY')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result += ' '.join('%s:%s' % (kind, cls._rules[2].token_type) for kind, cls in sorted(classes.items())) + '\n'
+
+    lex = classes['WORD']()
+    lex.input('ab 12')
+    lex.custom = ['kept']
+    lex.token()
+    clone = lex.clone()
+    clone.custom.append('own')
+    result += '%s %s %s %s %s\n' % (clone.lexdata, clone.lexpos, clone.lexstate, clone.custom, lex.custom)
+    serial = [lex_all(lex, text) for text in texts]
+    parallel = [None] * len(texts)
+
+    def work(i):
+        parallel[i] = lex_all(lex.clone(), texts[i])
+
+    # a new class, so the states are compiled by the threads at once
+    lex = make_lexer('WORD', {'engine': engine})()
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result += '%s %s\n' % (parallel == serial, serial[3])
+
+expect = '''\
+ID:ID KEY:KEY NAME:NAME WORD:WORD
+None 0 INITIAL ['kept', 'own'] ['kept']
+True WORD:'ab'@0 NUMBER:'12'@3 WORD:'xxx'@6 WORD:'cd'@10 NUMBER:'3'@13
+ID:ID KEY:KEY NAME:NAME WORD:WORD
+None 0 INITIAL ['kept', 'own'] ['kept']
+True WORD:'ab'@0 NUMBER:'12'@3 WORD:'xxx'@6 WORD:'cd'@10 NUMBER:'3'@13
+'''
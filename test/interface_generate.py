@@ -0,0 +1,102 @@
+import importlib.util
+import os
+import tempfile
+
+import plex
+from plex import Lexer
+
+
+class InterfaceGenerateLexer(Lexer):
+    options = {'track-lines': True}
+    states = [('comment', 'exclusive')]
+
+    __(r'[ \t\n]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('ID', keywords={'if': 'IF', 'end': 'END'})
+    __(r'==')('EQ')
+    __(r'=')('ASSIGN')
+
+    @__(r'/\*')
+    def t_comment(self, t):
+        self.begin('comment')
+
+    @__('comment', r'\*/')
+    def t_comment_end(self, t):
+        self.begin('INITIAL')
+
+    @__('comment', r'[^*]+|\*')
+    def t_comment_body(self, t):
+        self.more()
+
+    @__(r'<[a-z]+>')
+    def t_tag(self, t):
+        self.less(1)
+        return 'LT'
+
+    @__(r'!')
+    def t_stop(self, t):
+        self.terminate()
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+        t.value = t.text[0]
+        return t
+
+
+def lex_all(lex, text):
+    lex.input(text)
+    tokens = []
+    for _ in range(2):
+        tok = lex.token()
+        while tok is not None:
+            tokens.append('%s:%r:%r@%d,%d' % (tok.type, tok.text, tok.value, tok.lineno, tok.lexpos))
+            tok = lex.token()
+    return ' '.join(tokens)
+
+
+source = plex.generate(InterfaceGenerateLexer)
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'interface_generate_gen.py')
+    with open(path, 'w') as fd:
+        fd.write(source)
+    spec = importlib.util.spec_from_file_location('interface_generate_gen', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+text = 'if x == 12 /* a\n* b */\n<ab> ? y = 3 end! z\xe9 9'
+generated = lex_all(module.InterfaceGenerateLexer(), text)
+result = generated + '\n'
+result += '%s\n' % (generated == lex_all(InterfaceGenerateLexer(), text))
+result += '%s %s\n' % (source.count('_call_mark_terminate = False'), source.count('_call_mark_more = False'))
+
+
+# a subclass of a generated lexer has more rules than its scan functions
+class InterfaceGenerateSubclassLexer(module.InterfaceGenerateLexer):
+    __(r'[a-z]+\d+')('NAME')
+
+
+result += lex_all(InterfaceGenerateSubclassLexer(), 'ab12 cd') + '\n'
+
+
+def make_local():
+    class LocalLexer(Lexer):
+        __(r'a')('A')
+    return LocalLexer
+
+
+try:
+    plex.generate(make_local())
+except ValueError as e:
+    result += '%s\n' % e
+
+expect = """\
+IF:'if':None@1,0 ID:'x':None@1,3 EQ:'==':None@1,5 NUMBER:'12':12@1,8 LT:'<ab>':None@3,23 ID:'ab':None@3,24 \
+__error__:'> ? y = 3 end! z\xe9 9':'>'@3,26 __error__:'? y = 3 end! z\xe9 9':'?'@3,28 ID:'y':None@3,30 \
+ASSIGN:'=':None@3,32 NUMBER:'3':3@3,34 END:'end':None@3,36 ID:'z':None@3,41 __error__:'\xe9 9':'\xe9'@3,42 \
+NUMBER:'9':9@3,44
+True
+1 2
+NAME:'ab12':None@1,0 ID:'cd':None@1,5
+Lexer class make_local.<locals>.LocalLexer can't be imported, it's defined in a function
+"""
@@ -0,0 +1,33 @@
+import os
+import tempfile
+from plex import Lexer
+
+
+class InterfaceInputFileLexer(Lexer):
+    __(r'[ \n]+')(None)
+    __(r'\w+')('WORD', lambda _: _)
+    __(r'\W')('SYMBOL', lambda _: _)
+
+
+fd, path = tempfile.mkstemp()
+with os.fdopen(fd, 'w', encoding='utf-8') as f:
+    f.write('Grüße € 10\nnaïve ∑ x')
+
+result = ''
+expect = """\
+WORD='Grüße' (0,0)
+SYMBOL='€' (6,8)
+WORD='10' (8,12)
+WORD='naïve' (11,15)
+SYMBOL='∑' (17,22)
+WORD='x' (19,26)
+"""
+
+try:
+    lex = InterfaceInputFileLexer()
+    lex.input_file(path, encoding='utf-8', chunk_size=3)
+    for tok in lex:
+        result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lexpos, lex.byte_offset(tok.lexpos))
+    del lex
+finally:
+    os.remove(path)
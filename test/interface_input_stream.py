@@ -0,0 +1,96 @@
+import io
+from plex import Lexer
+
+
+class InterfaceInputStreamLexer(Lexer):
+    options = {'engine': 'dfa'}
+
+    states = [('comment', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'"[^"]*"')('STRING', lambda s: s[1:-1])
+
+    @__(r'[a-z]+')
+    def t_word(self, t):
+        if t.text == 'split':
+            self.less(2)
+        t.type = 'WORD'
+        t.value = t.text[:2] if t.text == 'split' else t.text
+        return t
+
+    @__(r'\n')
+    def t_newline(self, t):
+        self.lineno += 1
+
+    @__(r'/\*')
+    def t_comment(self, t):
+        self.begin('comment')
+
+    @__('comment', r'(.|\n)*?\*/')
+    def t_comment_body(self, t):
+        self.lineno += t.text.count('\n')
+        self.begin('INITIAL')
+        t.type = 'COMMENT'
+        t.value = len(t.text)
+        return t
+
+
+result = ''
+expect = """\
+NUMBER=12 (1,0)
+WORD='abc' (1,3)
+STRING='a long string' (1,7)
+COMMENT=15 (2,25)
+WORD='sp' (4,41)
+WORD='lit' (4,43)
+NUMBER=345 (4,47)
+max window: 30
+"""
+
+
+lex = InterfaceInputStreamLexer()
+lex.input_stream(io.StringIO('12 abc "a long string"\n/* a \n comment */\nsplit 345'), chunk_size=4)
+max_window = 0
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+    max_window = max(max_window, lex.lexlen)
+result += 'max window: %d\n' % max_window
+
+
+class InterfaceInputStreamLoopLexer(Lexer):
+    __(r'/\*(.|\n)*?\*/')('COMMENT')
+    __(r'"[^"]*"')('STRING')
+    __(r'<[a-z]*?>(>>)?')('TAG')
+    __(r'[a-z]+')('WORD')
+    __(r'[*/">]')('OP')
+    __(r'\s+')(None)
+
+
+class InterfaceInputStreamDFALexer(InterfaceInputStreamLoopLexer):
+    options = {'engine': 'dfa'}
+
+
+# tokens longer than a chunk, which need their closing delimiter or go on
+# after a lazy part, are matched as a whole, and short comments don't make
+# the window grow
+for cls in (InterfaceInputStreamLoopLexer, InterfaceInputStreamDFALexer):
+    lex = cls()
+    lex.input_stream(io.StringIO('ab "' + 'q' * 25 + '" / cd /* a\n' + ' b\n' * 20 + '*/ "e'), chunk_size=7)
+    result += '%s %s\n' % (cls._options['engine'], ' '.join('%s@%d' % (tok.type, tok.lexpos) for tok in lex))
+    lex.input_stream(io.StringIO('cd <a>>> x'), chunk_size=1)
+    result += '%s %s\n' % (cls._options['engine'], ' '.join('%s@%d' % (tok.type, tok.lexpos) for tok in lex))
+    lex.input_stream(io.StringIO('/* x */ abc "s t"\n' * 1000), chunk_size=64)
+    max_window = 0
+    for tok in lex:
+        max_window = max(max_window, lex.lexlen)
+    result += 'max window: %d\n' % max_window
+
+expect += """\
+loop WORD@0 STRING@3 OP@31 WORD@33 COMMENT@36 OP@104 WORD@105
+loop WORD@0 TAG@3 WORD@9
+max window: 191
+dfa WORD@0 STRING@3 OP@31 WORD@33 COMMENT@36 OP@104 WORD@105
+dfa WORD@0 TAG@3 WORD@9
+max window: 191
+"""
@@ -0,0 +1,43 @@
+from plex import Lexer
+
+
+class InterfaceKeywordsLexer(Lexer):
+    reserved = {'if': 'IF', 'else': 'ELSE', 'while': 'WHILE', 'pass': None}
+
+    __(r'[a-zA-Z_][a-zA-Z_0-9]*')('ID', keywords=reserved)
+    __(r'\d+')('NUMBER', int, keywords={'0': 'ZERO'})
+    __(r'\s+')(None)
+
+
+class InterfaceKeywordsCaseLexer(Lexer):
+    options = {'case-insensitive': True}
+
+    __(r'[a-z_][a-z_0-9]*')('ID', keywords={'If': 'IF', 'ELSE': 'ELSE'})
+    __(r'\s+')(None)
+
+
+def dump(lex, text):
+    lex.input(text)
+    return ' '.join('%s:%r' % (tok.type, tok.value) for tok in lex) + '\n'
+
+
+result = dump(InterfaceKeywordsLexer(), 'if x else iffy 0 pass 10 While while')
+result += dump(InterfaceKeywordsCaseLexer(), 'if IF iF else Else elsewhere')
+
+lex = InterfaceKeywordsLexer()
+lex.input('while 0 whilst')
+columns = lex.tokenize_all()
+result += ' '.join(columns.type(i) for i in range(len(columns))) + '\n'
+
+try:
+    class InterfaceKeywordsHandlerLexer(Lexer):
+        __(r'\w+')(lambda self, t: t, keywords={})
+except TypeError as e:
+    result += 'TypeError: %s\n' % e
+
+expect = '''\
+IF:None ID:None ELSE:None ID:None ZERO:0 NUMBER:10 ID:None WHILE:None
+IF:None IF:None IF:None ELSE:None ELSE:None ID:None
+WHILE ZERO ID
+TypeError: Keywords need a token type, not a handler.
+'''
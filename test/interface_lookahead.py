@@ -0,0 +1,75 @@
+from plex import Lexer
+
+
+class InterfaceLookaheadLexer(Lexer):
+    states = [('string', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('WORD')
+
+    @__(r'\n')
+    def t_newline(self, t):
+        self.lineno += 1
+
+    @__(r'"')
+    def t_string_begin(self, t):
+        self.lexer_calls.append(t.lexpos)
+        self.push_state('string')
+        t.type = 'BEGIN'
+        return t
+
+    __('string', r'[^"]+')('PART')
+
+    @__('string', r'"')
+    def t_string_end(self, t):
+        self.pop_state()
+        t.type = 'END'
+        return t
+
+
+def show(tok):
+    return 'None' if tok is None else '%s:%r@%d,%d' % (tok.type, tok.text, tok.lineno, tok.lexpos)
+
+
+lex = InterfaceLookaheadLexer()
+lex.lexer_calls = []
+lex.input('12 ab\n"cd ef" 34\ngh')
+buf = lex.lookahead()
+
+result = '%s %s %s\n' % (show(buf.peek(3)), show(buf.peek()), lex.lexpos)
+result += '%s %s\n' % (show(buf.next()), buf.mark())
+result += ' '.join(show(buf.next()) for _ in range(3)) + '\n'
+result += '%s %s\n' % (lex.lexstate, buf.snapshot())
+buf.reset()
+result += ' '.join(show(tok) for tok in buf) + ' ' + show(buf.peek(2)) + '\n'
+result += '%s %s\n' % (lex.lexer_calls, len(buf._tokens))
+
+# sync() relexes the tokens after the position in a new state
+lex = InterfaceLookaheadLexer()
+lex.lexer_calls = []
+lex.input('"ab" cd')
+buf = lex.lookahead()
+result += '%s %s %s\n' % (show(buf.next()), show(buf.peek(2)), lex.lexstate)
+buf.sync()
+result += '%s %s\n' % (lex.lexstate, lex.lexpos)
+lex.pop_state()
+result += ' '.join(show(tok) for tok in buf) + ' %s\n' % lex.lexer_calls
+
+try:
+    buf.peek(0)
+except ValueError as e:
+    result += str(e) + '\n'
+
+expect = '''\
+BEGIN:'"'@2,6 NUMBER:'12'@1,0 7
+NUMBER:'12'@1,0 1
+WORD:'ab'@1,3 BEGIN:'"'@2,6 PART:'cd ef'@2,7
+string LexerSnapshot(lexpos=12, lineno=2, state='string', stack=('INITIAL',), more='', less=-1)
+WORD:'ab'@1,3 BEGIN:'"'@2,6 PART:'cd ef'@2,7 END:'"'@2,12 NUMBER:'34'@2,14 WORD:'gh'@3,17 None
+[6] 0
+BEGIN:'"'@1,0 END:'"'@1,3 INITIAL
+string 1
+WORD:'ab'@1,1 BEGIN:'"'@1,3 PART:' cd'@1,4 [0, 3]
+peek() counts tokens from 1
+'''
@@ -0,0 +1,71 @@
+from plex import Lexer
+
+
+class InterfaceProfileLexer(Lexer):
+    states = [('comment', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('WORD')
+    __('if')('IF')
+
+    @__(r'/\*')
+    def t_comment(self, t):
+        self.push_state('comment')
+
+    @__('comment', r'\*/')
+    def t_comment_end(self, t):
+        self.pop_state()
+
+    __('comment', r'[^*]+|\*')(None)
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+
+
+def dump(profile):
+    out = ''
+    for c in profile.rows('chosen'):
+        out += '%s %s: %d %d %d %d %d %d\n' % (c.state, c.rule.pattern, c.attempts, c.matches, c.chosen,
+                                               c.consumed, c.handler_calls, c.value_calls)
+    return out + '%r\n' % sorted(profile.switches.items())
+
+
+lex = InterfaceProfileLexer()
+lex.input('if 12 /* x */ ab ?')
+lex.token()
+profile = lex.start_profile()
+result = ' '.join(tok.type for tok in lex) + '\n'
+result += dump(profile)
+
+# profiling is off again, and the counters stay as they are
+lex.stop_profile()
+lex.input('12 /* x */')
+result += ' '.join(tok.type for tok in lex) + '\n'
+result += dump(profile)
+result += '%s\n' % (profile.table().splitlines()[0].split()[:3],)
+
+expect = '''\
+NUMBER WORD
+INITIAL [ ]+: 8 4 4 4 0 0
+INITIAL \\d+: 8 1 1 2 0 1
+INITIAL [a-z]+: 8 1 1 2 0 0
+INITIAL /\\*: 8 1 1 2 1 0
+comment \\*/: 2 1 1 2 1 0
+comment [^*]+|\\*: 2 2 1 3 0 0
+INITIAL if: 8 0 0 0 0 0
+INITIAL __error__: 0 0 0 0 1 0
+[(('pop_state', 'INITIAL'), 1), (('push_state', 'comment'), 1)]
+NUMBER
+INITIAL [ ]+: 8 4 4 4 0 0
+INITIAL \\d+: 8 1 1 2 0 1
+INITIAL [a-z]+: 8 1 1 2 0 0
+INITIAL /\\*: 8 1 1 2 1 0
+comment \\*/: 2 1 1 2 1 0
+comment [^*]+|\\*: 2 2 1 3 0 0
+INITIAL if: 8 0 0 0 0 0
+INITIAL __error__: 0 0 0 0 1 0
+[(('pop_state', 'INITIAL'), 1), (('push_state', 'comment'), 1)]
+['state', 'rule', 'attempts']
+'''
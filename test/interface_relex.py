@@ -0,0 +1,93 @@
+from plex import Lexer
+
+
+class InterfaceRelexLexer(Lexer):
+    states = [('comment', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('WORD')
+
+    @__(r'\n+')
+    def t_newline(self, t):
+        self.lineno += len(t.text)
+
+    @__(r'/\*')
+    def t_comment(self, t):
+        self.push_state('comment')
+
+    @__('comment', r'\*/')
+    def t_comment_end(self, t):
+        self.pop_state()
+
+    @__('comment', r'\n')
+    def t_comment_newline(self, t):
+        self.lineno += 1
+
+    __('comment', r'[^*\n]+|\*')('COMMENT')
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+        t.type = 'ERROR'
+        return t
+
+
+def dump(tokens):
+    return ''.join('%s %r (%d,%d,%d)\n' % (tokens.type(i), tokens.text(i), tokens.line(i),
+                                           tokens.start(i), tokens.end(i))
+                   for i in range(len(tokens)))
+
+
+lex = InterfaceRelexLexer()
+tokens = lex.tokenize_incremental('12 ab\ncd 34\n/* x */ ef\ngh 56\nij\n')
+
+result = ''
+for start, end, new_text in [(3, 5, 'xyz'),     # replace a word
+                             (7, 7, '\n\n'),    # insert lines
+                             (14, 14, '/*'),    # open a comment
+                             (6, 8, ''),        # delete a line
+                             (0, 0, '?')]:      # an error token
+    tokens = lex.relex(tokens, start, end, new_text)
+    result += '%r: %d segments\n' % (tokens.lexdata, len(tokens.segments))
+    if dump(tokens) != dump(InterfaceRelexLexer().tokenize_incremental(tokens.lexdata)):
+        result += 'mismatch\n'
+result += dump(tokens)
+
+expect = """\
+'12 xyz\\ncd 34\\n/* x */ ef\\ngh 56\\nij\\n': 2 segments
+'12 xyz\\n\\n\\ncd 34\\n/* x */ ef\\ngh 56\\nij\\n': 3 segments
+'12 xyz\\n\\n\\ncd 34/*\\n/* x */ ef\\ngh 56\\nij\\n': 3 segments
+'12 xyz\\ncd 34/*\\n/* x */ ef\\ngh 56\\nij\\n': 3 segments
+'?12 xyz\\ncd 34/*\\n/* x */ ef\\ngh 56\\nij\\n': 4 segments
+ERROR '?' (1,0,1)
+NUMBER '12' (1,1,3)
+WORD 'xyz' (1,4,7)
+WORD 'cd' (2,8,10)
+NUMBER '34' (2,11,13)
+COMMENT '/' (3,16,17)
+COMMENT '*' (3,17,18)
+COMMENT ' x ' (3,18,21)
+WORD 'ef' (3,24,26)
+WORD 'gh' (4,27,29)
+NUMBER '56' (4,30,32)
+WORD 'ij' (5,33,35)
+"""
+
+
+class InterfaceRelexLazyLexer(Lexer):
+    __(r'/\*(.|\n)*?\*/')('COMMENT')
+    __(r'[a-z]+')('ID')
+    __(r'[*/]')('OP')
+    __(r'\s+')(None)
+
+
+# closing a comment left open lines before: the scan of /* looked up to here
+lex = InterfaceRelexLazyLexer()
+tokens = lex.relex(lex.tokenize_incremental('a /* b\nc d\n'), 11, 11, '*/')
+result += dump(tokens)
+
+expect += """\
+ID 'a' (1,0,1)
+COMMENT '/* b\\nc d\\n*/' (1,2,13)
+"""
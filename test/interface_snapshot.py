@@ -0,0 +1,58 @@
+from plex import Lexer
+
+
+class InterfaceSnapshotLexer(Lexer):
+    states = [('string', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('WORD')
+
+    @__(r'\n')
+    def t_newline(self, t):
+        self.lineno += 1
+
+    @__(r'"')
+    def t_string_begin(self, t):
+        self.push_state('string')
+        t.type = 'BEGIN'
+        return t
+
+    @__('string', r'\n')
+    def t_string_newline(self, t):
+        self.lineno += 1
+
+    __('string', r'[^"\n]+')('PART')
+
+    @__('string', r'"')
+    def t_string_end(self, t):
+        self.pop_state()
+        t.type = 'END'
+        return t
+
+
+def take(lex, n):
+    return ' '.join('%s:%r@%d,%d' % (tok.type, tok.text, tok.lineno, tok.lexpos)
+                    for _, tok in zip(range(n), lex)) + '\n'
+
+
+lex = InterfaceSnapshotLexer()
+lex.input('12 ab\n"cd\nef" 34\ngh')
+
+result = take(lex, 3)
+snap = lex.snapshot()
+result += repr(snap) + '\n'
+result += take(lex, 10)
+lex.restore(snap)
+result += take(lex, 10)
+lex.restore(snap)
+result += take(lex, 1)
+result += '%s %s\n' % (lex.snapshot().stack, lex.snapshot() == snap)
+expect = '''\
+NUMBER:'12'@1,0 WORD:'ab'@1,3 BEGIN:'"'@2,6
+LexerSnapshot(lexpos=7, lineno=2, state='string', stack=('INITIAL',), more='', less=-1)
+PART:'cd'@2,7 PART:'ef'@3,10 END:'"'@3,12 NUMBER:'34'@3,14 WORD:'gh'@4,17
+PART:'cd'@2,7 PART:'ef'@3,10 END:'"'@3,12 NUMBER:'34'@3,14 WORD:'gh'@4,17
+PART:'cd'@2,7
+('INITIAL',) False
+'''
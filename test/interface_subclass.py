@@ -0,0 +1,67 @@
+from plex import Lexer
+
+
+class InterfaceSubclassBaseLexer(Lexer):
+    options = {'case-insensitive': True}
+    states = [('string', 'exclusive')]
+    definitions = {'digit': r'[0-9]'}
+
+    __(r'[ ]+')(None)
+    __(r'{digit}+')('NUMBER', int)
+    __(r'if')('IF')
+    __(r'[a-z]+')('WORD')
+
+    @__(r'"')
+    def t_string_begin(self, t):
+        self.begin('string')
+
+    @__('string', r'"')
+    def t_string_end(self, t):
+        self.begin('INITIAL')
+
+    __('string', r'[^"]+')('STRING')
+
+
+# a subclass adds its options, states, definitions and rules to the ones
+# of its base, and its rules come after them: 'iffy' is still a WORD
+class InterfaceSubclassLexer(InterfaceSubclassBaseLexer):
+    options = {'track-lines': True}
+    states = [('comment', 'exclusive')]
+    definitions = {'sign': r'[-+]'}
+
+    __(r'{sign}{digit}+')('SIGNED', int)
+    __(r'iffy')('IFFY')
+    __(r'[a-z]+')('NAME')
+
+    @__(r'\#')
+    def t_comment(self, t):
+        self.begin('comment')
+
+    @__('comment', r'\n')
+    def t_comment_end(self, t):
+        self.begin('INITIAL')
+
+    __('comment', r'[^\n]+')(None)
+
+
+def lex(cls, text):
+    lexer = cls()
+    lexer.input(text)
+    return ' '.join('%s:%r' % (tok.type, tok.value) for tok in lexer) + '\n'
+
+
+text = 'IF iffy 12 "a b" -3 word'
+result = lex(InterfaceSubclassBaseLexer, text.replace('-', ''))
+result += lex(InterfaceSubclassLexer, text + ' # note\nend')
+result += '%s %s\n' % (sorted(InterfaceSubclassLexer._states), sorted(InterfaceSubclassLexer._definitions))
+result += '%s %s\n' % (InterfaceSubclassLexer._options['case-insensitive'],
+                       InterfaceSubclassBaseLexer._options['track-lines'])
+result += '%d %d\n' % (len(InterfaceSubclassBaseLexer._rules), len(InterfaceSubclassLexer._rules))
+
+expect = '''\
+IF:None WORD:None NUMBER:12 STRING:None NUMBER:3 WORD:None
+IF:None WORD:None NUMBER:12 STRING:None SIGNED:-3 WORD:None WORD:None
+['INITIAL', 'comment', 'string'] ['digit', 'sign']
+True False
+7 13
+'''
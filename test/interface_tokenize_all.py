@@ -0,0 +1,80 @@
+from plex import Lexer
+
+
+class InterfaceTokenizeAllLexer(Lexer):
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'\+')('PLUS')
+
+    @__(r'\n+')
+    def t_newline(self, t):
+        self.lineno += len(t.text)
+
+    @__(r'[a-z]+')
+    def t_word(self, t):
+        self.less(2)
+        return 'WORD'
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+        t.type = 'ERROR'
+        return t
+
+    __('__eof__')('EOF')
+
+
+lex = InterfaceTokenizeAllLexer()
+lex.input('12 + abcd\n\n3 ? 4')
+columns = lex.tokenize_all()
+
+result = 'types: %r\n' % (columns.type_names,)
+for i in range(len(columns)):
+    result += '%s %r (%d,%d,%d)\n' % (
+        columns.type(i), columns.text(i), columns.lines[i], columns.starts[i], columns.ends[i])
+
+expect = """\
+types: ['NUMBER', 'PLUS', 'EOF', 'WORD', 'ERROR']
+NUMBER '12' (1,0,2)
+PLUS '+' (1,3,4)
+WORD 'ab' (1,5,7)
+WORD 'cd' (1,7,9)
+NUMBER '3' (3,11,12)
+ERROR '?' (3,13,14)
+NUMBER '4' (3,15,16)
+EOF '' (3,16,16)
+"""
+
+
+class InterfaceTokenizeAllMoreLexer(Lexer):
+    states = [('string', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'[a-z]+')('WORD')
+
+    @__(r'"')
+    def t_begin(self, t):
+        self.begin('string')
+        self.more()
+
+    @__('string', r'[^"]+')
+    def t_string_part(self, t):
+        self.more()
+
+    @__('string', r'"')
+    def t_string_end(self, t):
+        self.begin('INITIAL')
+        return 'STRING'
+
+
+# the text of a token made with more() starts at its first part
+lex = InterfaceTokenizeAllMoreLexer()
+lex.input('ab "zz" cd')
+tokens = [(tok.type, tok.text) for tok in lex]
+lex.input('ab "zz" cd')
+columns = lex.tokenize_all()
+result += '%r\n%r\n' % (tokens, [(columns.type(i), columns.text(i)) for i in range(len(columns))])
+expect += """\
+[('WORD', 'ab'), ('STRING', '"zz"'), ('WORD', 'cd')]
+[('WORD', 'ab'), ('STRING', '"zz"'), ('WORD', 'cd')]
+"""
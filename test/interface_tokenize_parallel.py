@@ -0,0 +1,88 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from plex import Lexer
+
+
+class InterfaceTokenizeParallelLexer(Lexer):
+    states = [('comment', 'exclusive')]
+
+    __(r'[ ]+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('WORD')
+    __(r'"[^"]*"')('STRING')  # may hold newlines
+
+    @__(r'\n+')
+    def t_newline(self, t):
+        self.lineno += len(t.text)
+
+    @__(r'/\*')
+    def t_comment(self, t):
+        self.push_state('comment')
+
+    @__('comment', r'\*/')
+    def t_comment_end(self, t):
+        self.pop_state()
+
+    @__('comment', r'\n')
+    def t_comment_newline(self, t):
+        self.lineno += 1
+
+    __('comment', r'[^*\n]+|\*')(None)
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+        t.type = 'ERROR'
+        return t
+
+    __('__eof__')('EOF')
+
+
+def dump(columns, lex):
+    out = ''
+    for i in range(len(columns)):
+        out += '%s %r (%d,%d,%d)\n' % (
+            columns.type(i), columns.text(i), columns.lines[i], columns.starts[i], columns.ends[i])
+    return out + 'end: %d %d %s\n' % (lex.lexpos, lex.lineno, lex.lexstate)
+
+
+text = '12 ab\n/* a\ncomment\n*/ 34\ncd "a\nlong\nstring" ef\n?\n56 78\ngh'
+
+lex = InterfaceTokenizeParallelLexer()
+lex.input(text)
+expect = dump(lex.tokenize_all(), lex)
+
+# worker processes can't be started while this module is being imported
+result = ''
+with ThreadPoolExecutor(2) as executor:
+    for chunk_size in (4, 9, 1000):
+        lex = InterfaceTokenizeParallelLexer()
+        result = dump(lex.tokenize_parallel(text, chunk_size=chunk_size, executor=executor), lex)
+        if result != expect:
+            break
+
+
+class InterfaceTokenizeParallelLazyLexer(Lexer):
+    __(r'/\*(.|\n)*?\*/')('COMMENT')
+    __(r'[a-z]+')('WORD')
+    __(r'[*/]')('OP')
+    __(r'\s+')(None)
+
+
+# a comment running past the lookahead of its chunk is lexed again
+text = 'a\n' * 10 + '/*' + ' x\n' * 400 + '*/ b\n'
+lex = InterfaceTokenizeParallelLazyLexer()
+lex.input(text)
+expect += dump(lex.tokenize_all(), lex)
+
+with ThreadPoolExecutor(2) as executor:
+    lex = InterfaceTokenizeParallelLazyLexer()
+    result += dump(lex.tokenize_parallel(text, chunk_size=100, lookahead=200, executor=executor), lex)
+
+# copies of a lexer go on lexing its input, the workers get their own copies
+for copier in (copy.copy, copy.deepcopy):
+    lex = InterfaceTokenizeParallelLazyLexer()
+    lex.input('a b c d')
+    lex.token()
+    expect += "['b', 'c', 'd']\n"
+    result += '%s\n' % [tok.text for tok in copier(lex)]
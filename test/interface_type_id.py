@@ -0,0 +1,56 @@
+import pickle
+
+from plex import CompactLexToken, Lexer
+
+
+class InterfaceTypeIdLexer(Lexer):
+    options = {'token-class': CompactLexToken}
+    tokens = ('STRING', 'NUMBER')
+
+    __(r'\s+')(None)
+    __(r'\d+')('NUMBER', int)
+    __(r'[a-z]+')('ID', keywords={'if': 'IF', 'else': 'ELSE', 'pass': None})
+    __(r'\+')('+')
+
+    @__(r'"[^"]*"')
+    def t_string(self, t):
+        return 'STRING'
+
+    @__(r'#')
+    def t_hash(self, t):
+        return 'HASH'  # not declared
+
+    @__('__error__')
+    def t_error(self, t):
+        self.skip(1)
+
+    __('__eof__')('EOF')
+
+
+cls = InterfaceTypeIdLexer
+result = '%r\n' % (cls._token_types.names,)
+TokenType = cls.type_enum()
+
+lex = cls()
+lex.input('if x + "s" pass else 1 #')
+tokens = [lex.token()]
+while tokens[-1].type != 'EOF':
+    tokens.append(lex.token())
+result += ' '.join('%s:%s' % (tok.type, tok.type_id) for tok in tokens) + '\n'
+result += '%d %s\n' % (cls.type_id('ELSE'), cls.type_name(cls.type_id('STRING')))
+
+lex.input('if x + "s" pass else 1 #')
+columns = lex.tokenize_all()
+result += '%s %s %s\n' % (list(columns.types), columns.type_names[7], len(cls._token_types))
+
+result += '%s %s\n' % (TokenType.__name__, ' '.join('%s=%d' % (t.name, t) for t in TokenType))
+result += '%s\n' % (pickle.loads(pickle.dumps(cls._token_types)).names == cls._token_types.names)
+
+expect = """\
+['NUMBER', 'ID', 'IF', 'ELSE', '+', 'EOF', 'STRING']
+IF:2 ID:1 +:4 STRING:6 ELSE:3 NUMBER:0 HASH:None EOF:5
+3 STRING
+[2, 1, 4, 6, 3, 0, 7, 5] HASH 7
+InterfaceTypeIdLexerType NUMBER=0 ID=1 IF=2 ELSE=3 EOF=5 STRING=6
+True
+"""
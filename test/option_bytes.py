@@ -0,0 +1,52 @@
+import os
+import tempfile
+from plex import Lexer, LexError
+
+
+class OptionBytesLexer(Lexer):
+    options = {'bytes': True, 'case-insensitive': True}
+
+    definitions = {'hex': rb'[0-9a-f]'}
+
+    __(rb'\s+')(None)
+    __(b'GET')('GET')
+    __('HTTP/')('HTTP')
+    __(r'\xff\xfe')('BOM')
+    __(r'0x{hex}+')('HEX', lambda s: int(s, 16))
+    __(r'[a-z/.]+')('PATH', lambda _: _)
+    __(r'\d+')('NUMBER', int)
+
+
+result = ''
+expect = """\
+GET=None b'get' (0)
+PATH=b'/index.html' b'/index.html' (4)
+HTTP=None b'HTTP/' (16)
+NUMBER=1 b'1' (21)
+PATH=b'.' b'.' (22)
+NUMBER=1 b'1' (23)
+HEX=171 b'0xAb' (26)
+BOM=None b'\\xff\\xfe' (31)
+Illegal character b'!' at index 4
+"""
+
+fd, path = tempfile.mkstemp()
+with os.fdopen(fd, 'wb') as f:
+    f.write(b'get /index.html HTTP/1.1\r\n0xAb \xff\xfe')
+
+try:
+    lex = OptionBytesLexer()
+    lex.input_file(path)
+    for tok in lex:
+        result += '%s=%r %r (%d)\n' % (tok.type, tok.value, tok.text, tok.lexpos)
+    del lex
+finally:
+    os.remove(path)
+
+lex = OptionBytesLexer()
+lex.input(b'get !')
+lex.token()
+try:
+    lex.token()
+except LexError as e:
+    result += '%s\n' % e.args[0]
@@ -0,0 +1,74 @@
+import re
+
+from plex import Lexer
+
+
+class OptionCasefoldLexer(Lexer):
+    options = {'case-insensitive': True, 'case-fold': True}
+
+    __(r'{.*?}')('BLOCK', lambda s: s[1:-1])
+    __(r'if')('IF', lambda _: _)
+    __(r'THEN')('THEN', lambda _: _)
+
+    @__(r'fi\b')
+    def t_fi(self, t):
+        t.type = 'FI'
+        t.value = (t.text, self.lexmatch.group())
+        return t
+
+    __(r'[A-Z]+[0-9]')('LABEL', lambda _: _)
+    __(r'[a-z]+')('WORD', lambda _: _)
+    __(r'\s')(None)
+
+
+result = ''
+expect = """\
+IF='If' (1,0)
+BLOCK='Cond' (1,3)
+THEN='Then' (1,10)
+LABEL='Loop1' (1,15)
+WORD='StraSSe' (1,21)
+FI=('Fi', 'fi') (1,29)
+"""
+
+
+lex = OptionCasefoldLexer()
+lex.input('If {Cond} Then Loop1 StraSSe Fi')
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+
+class OptionCasefoldRegexLexer(Lexer):
+    options = {'case-insensitive': True, 'case-fold': True}
+
+    @__(r'(?P<key>[A-Z_]+)=[^;\s]*;')
+    def t_pair(self, t):
+        t.type = 'PAIR'
+        t.value = (t.text, self.lexmatch.group('key'))
+        return t
+
+    __(r'ſ[k-m]+')('LONG_S', lambda _: _)
+    __(r'[^\W\d]+')('WORD', lambda _: _)
+    __(r'\s')(None)
+
+
+class OptionCasefoldRegexDfaLexer(OptionCasefoldRegexLexer):
+    options = {'engine': 'dfa'}
+
+
+for cls in (OptionCasefoldRegexLexer, OptionCasefoldRegexDfaLexer):
+    lex = cls()
+    lex.input('Key_A=Vx; MAX_b=; ſkm SKM sKm Àbc')
+    for tok in lex:
+        result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+    result += 'ignorecase: %s\n' % [bool(mr[2].flags & re.IGNORECASE) for mr in cls._compiled['INITIAL'][0]]
+
+expect += """\
+PAIR=('Key_A=Vx;', 'key_a') (1,0)
+PAIR=('MAX_b=;', 'max_b') (1,10)
+LONG_S='ſkm' (1,18)
+LONG_S='SKM' (1,22)
+LONG_S='sKm' (1,26)
+WORD='Àbc' (1,30)
+ignorecase: [False, False, False, False]
+""" * 2
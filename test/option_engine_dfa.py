@@ -0,0 +1,81 @@
+from plex import Lexer
+
+
+class OptionEngineDfaLexer(Lexer):
+    options = {'engine': 'dfa'}
+
+    states = [('string', 'exclusive')]
+
+    __(r'[ \t\n]+')(None)
+    __(r'if|ifdef')('KEYWORD', lambda _: _)
+    __(r'[a-z_][a-z0-9_]*')('ID', lambda _: _)
+    __(r'\d+')('NUMBER', int)
+    __(r'\d+(?=px)')('PIXELS', int)
+    __(r'([%&])\1')('TWICE', lambda _: _)
+    __(r'<')('LT')
+    __(r'<=')('LE')
+    __(r'<<')('LSHIFT')
+    __(r'/\*.*?\*/')('COMMENT', lambda _: _)
+
+    @__(r'"')
+    def t_string_begin(self, t):
+        self.begin('string')
+
+    @__('string', r'[^"]*"')
+    def t_string_body(self, t):
+        self.begin('INITIAL')
+        t.type = 'STRING'
+        t.value = t.text[:-1]
+        return t
+
+    __(r'.')('OTHER', lambda _: _)
+
+
+lex = OptionEngineDfaLexer()
+lex.input('ifdef if ifx 12px <<= /* a */ */ "b c"%%')
+
+result = ''
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+expect = """\
+ID='ifdef' (1,0)
+KEYWORD='if' (1,6)
+ID='ifx' (1,9)
+NUMBER=12 (1,13)
+ID='px' (1,15)
+LSHIFT=None (1,18)
+OTHER='=' (1,20)
+COMMENT='/* a */' (1,22)
+OTHER='*' (1,30)
+OTHER='/' (1,31)
+STRING='b c' (1,34)
+TWICE='%%' (1,38)
+"""
+
+
+class OptionEngineDfaIgnorecaseLexer(Lexer):
+    options = {'engine': 'dfa', 'case-insensitive': True}
+
+    __(r'\s+')(None)
+    __('select')('SELECT')
+    __('straße')('STREET')
+    __(r'"([^"\\]|\\.)*"')('STRING', lambda _: _)
+    __(r'[a-zß]+')('ID', lambda _: _)
+    __(r'//.*?\n')(None)
+
+
+lex = OptionEngineDfaIgnorecaseLexer()
+lex.input('SeLeCt selects STRASSE Straße "a\\"b" // x "y\nz')
+
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+expect += """\
+SELECT=None (1,0)
+ID='selects' (1,7)
+ID='STRASSE' (1,15)
+STREET=None (1,23)
+STRING='"a\\\\"b"' (1,30)
+ID='z' (1,45)
+"""
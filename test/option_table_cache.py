@@ -0,0 +1,59 @@
+import shutil
+import tempfile
+import plex
+from plex import Lexer
+
+cache_dir = tempfile.mkdtemp()
+
+
+def make_lexer(engine, space=None):
+    class OptionTableCacheLexer(Lexer):
+        options = {'table-cache': cache_dir, 'engine': engine}
+
+        __(r'\s')(space)
+        __(r'if')('IF')
+        __(r'[a-z]\w*')('ID')
+        __(r'\d+')('NUMBER', int)
+        __(r'"[^"]*"')('STRING')
+    return OptionTableCacheLexer
+
+
+def tokens(cls):
+    lex = cls()
+    lex.input('if x1 "a b" 42 iffy')
+    return ' '.join('%s:%s' % (t.type, t.text) for t in lex)
+
+
+result = ''
+expect = """\
+loop cold IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+loop warm IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+loop stale IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+loop broken IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+dfa cold IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+dfa warm IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+skip cold IF:if ID:x1 STRING:"a b" NUMBER:42 ID:iffy
+skip kept IF:if SPACE:  ID:x1 SPACE:  STRING:"a b" SPACE:  NUMBER:42 SPACE:  ID:iffy
+"""
+
+try:
+    for engine in ('loop', 'dfa'):
+        cls = make_lexer(engine)
+        path = plex._table_cache_path(cls)
+        result += '%s cold %s\n' % (engine, tokens(cls))
+        assert plex._load_tables(cls)['scanners']
+        result += '%s warm %s\n' % (engine, tokens(make_lexer(engine)))
+        if engine == 'loop':
+            # the tables of other options are rebuilt
+            make_lexer('dfa')()
+            assert not plex._load_tables(cls)['scanners']
+            result += '%s stale %s\n' % (engine, tokens(make_lexer(engine)))
+            with open(path, 'wb') as fd:
+                fd.write(b'broken')
+            assert not plex._load_tables(cls)['scanners']
+            result += '%s broken %s\n' % (engine, tokens(make_lexer(engine)))
+    # the merged pattern of ignored rules isn't reused once a rule is kept
+    result += 'skip cold %s\n' % tokens(make_lexer('loop'))
+    result += 'skip kept %s\n' % tokens(make_lexer('loop', 'SPACE'))
+finally:
+    shutil.rmtree(cache_dir)
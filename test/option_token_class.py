@@ -0,0 +1,38 @@
+import gc
+from plex import Lexer, CompactLexToken
+
+
+class OptionTokenClassLexer(Lexer):
+    options = {'token-class': CompactLexToken}
+
+    __(r'\s+')(None)
+    __(r'\d+')('NUMBER', int)
+
+    @__(r'[a-z]+')
+    def t_word(self, t):
+        t.type = 'WORD'
+        t.value = t.text.upper()
+        t.extra = len(t.text)
+        return t
+
+
+result = ''
+expect = """\
+NUMBER=12 (1,0) extra=None leng=2 has_dict=False same_lexer=True
+WORD='AB' (1,3) extra=2 leng=2 has_dict=False same_lexer=True
+NUMBER=345 (1,6) extra=None leng=3 has_dict=False same_lexer=True
+lexer after collected: None
+"""
+
+
+lex = OptionTokenClassLexer()
+lex.input('12 ab 345')
+tokens = list(lex)
+for tok in tokens:
+    result += '%s=%r (%d,%d) extra=%r leng=%d has_dict=%s same_lexer=%s\n' % (
+        tok.type, tok.value, tok.lineno, tok.lexpos, tok.extra, tok.leng,
+        hasattr(tok, '__dict__'), tok.lexer is lex)
+
+del lex
+gc.collect()
+result += 'lexer after collected: %r\n' % (tokens[0].lexer,)
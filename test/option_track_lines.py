@@ -0,0 +1,44 @@
+from plex import Lexer
+
+
+class OptionTrackLinesLexer(Lexer):
+    options = {'track-lines': True}
+
+    __(r'[ \t]+')(None)
+    __(r'\n')(None)
+    __(r'/\*(.|\n)*?\*/')(None)
+    __(r'"[^"]*"')('STRING')
+    __(r'[a-z]+')('ID')
+
+    @__(r'\#.*')
+    def t_DIRECTIVE(self, t):
+        self.less(1)  # the rest of the line is lexed again
+        return 'HASH'
+
+    @__('__error__')
+    def t_error(self, t):
+        t.value = t.text[0]
+        self.skip(1)
+        return t
+
+
+result = ''
+expect = """\
+ID 1 1 (1, 1, 1, 4)
+STRING 1 5 (1, 5, 3, 3)
+ID 5 2 (5, 2, 5, 5)
+HASH 6 1 (6, 1, 6, 5)
+ID 6 2 (6, 2, 6, 4)
+__error__ 6 4 6
+ID 7 1 (7, 1, 7, 4)
+locate(0)=(1, 1) locate(7)=(2, 1) lineno=7
+"""
+
+lex = OptionTrackLinesLexer()
+lex.input('abc "x\n\ny" /* 1\n */\n def\n#ab\xe9\ndef')
+for tok in lex:
+    if tok.type == '__error__':
+        result += '%s %d %d %d\n' % (tok.type, tok.lineno, tok.column, tok.lloc[0])
+    else:
+        result += '%s %d %d %s\n' % (tok.type, tok.lineno, tok.column, tok.lloc)
+result += 'locate(0)=%s locate(7)=%s lineno=%d\n' % (lex.locate(0), lex.locate(7), lex.lineno)
@@ -1,5 +1,8 @@
+import ast
+import importlib.util
 import sys
 import os.path
+import tempfile
 import unittest
 
 
@@ -13,6 +16,49 @@ def import_case(module):
     return loc['result'], loc['expect']
 
 
+def import_generated_case(module, directory):
+    """
+    Run a case with each lexer class defined at its top level replaced, as
+    soon as it's defined, by the class plex.generate() makes from it.
+    """
+    import plex
+    spec = importlib.util.find_spec(module)
+    tree = ast.parse(spec.loader.get_source(module))
+    body = []
+    for node in tree.body:
+        body.append(node)
+        if isinstance(node, ast.ClassDef):
+            body.append(ast.parse('%s = __generated__(%s)' % (node.name, node.name)).body[0])
+    tree.body = body
+    ast.fix_missing_locations(tree)
+
+    generated = []
+
+    def generate(cls):
+        if not (isinstance(cls, type) and issubclass(cls, plex.Lexer)):
+            return cls
+        name = '%s_%s_generated' % (module, cls.__name__)
+        path = os.path.join(directory, name + '.py')
+        plex.generate(cls, path)
+        gen_spec = importlib.util.spec_from_file_location(name, path)
+        gen_module = sys.modules[name] = importlib.util.module_from_spec(gen_spec)
+        generated.append(name)
+        gen_spec.loader.exec_module(gen_module)
+        return getattr(gen_module, cls.__name__)
+
+    case = importlib.util.module_from_spec(spec)
+    case.__generated__ = generate
+    # the generated modules import the classes from the case
+    sys.modules[module] = case
+    try:
+        exec(compile(tree, spec.origin, 'exec'), case.__dict__)
+    finally:
+        del sys.modules[module]
+        for name in generated:
+            del sys.modules[name]
+    return case.result, case.expect
+
+
 class LexRunTests(unittest.TestCase):
     def test_lex_hedit(self):
         result, expect = import_case('hedit')
@@ -22,6 +68,10 @@ class LexRunTests(unittest.TestCase):
         result, expect = import_case('state_try')
         self.assertEqual(result, expect)
 
+    def test_lex_state_lazy(self):
+        result, expect = import_case('state_lazy')
+        self.assertEqual(result, expect)
+
 
 class LexInterfaceTests(unittest.TestCase):
     def test_lex_intf_rules(self):
@@ -41,17 +91,128 @@ class LexInterfaceTests(unittest.TestCase):
         result, expect = import_case('interface_definitions')
         self.assertEqual(result, expect)
 
+    def test_lex_intf_tokenize_all(self):
+        result, expect = import_case('interface_tokenize_all')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_input_stream(self):
+        result, expect = import_case('interface_input_stream')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_input_file(self):
+        result, expect = import_case('interface_input_file')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_tokenize_parallel(self):
+        result, expect = import_case('interface_tokenize_parallel')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_relex(self):
+        result, expect = import_case('interface_relex')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_snapshot(self):
+        result, expect = import_case('interface_snapshot')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_profile(self):
+        result, expect = import_case('interface_profile')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_keywords(self):
+        result, expect = import_case('interface_keywords')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_atokens(self):
+        result, expect = import_case('interface_atokens')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_clone(self):
+        result, expect = import_case('interface_clone')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_type_id(self):
+        result, expect = import_case('interface_type_id')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_generate(self):
+        result, expect = import_case('interface_generate')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_lookahead(self):
+        result, expect = import_case('interface_lookahead')
+        self.assertEqual(result, expect)
+
+    def test_lex_intf_subclass(self):
+        result, expect = import_case('interface_subclass')
+        self.assertEqual(result, expect)
+
 
 class LexRuntimeTests(unittest.TestCase):
     def test_lex_runtime_eof(self):
         result, expect = import_case('runtime_eof')
         self.assertEqual(result, expect)
 
+    def test_lex_runtime_dispatch(self):
+        result, expect = import_case('runtime_dispatch')
+        self.assertEqual(result, expect)
+
+    def test_lex_runtime_literals(self):
+        result, expect = import_case('runtime_literals')
+        self.assertEqual(result, expect)
+
+    def test_lex_runtime_error_view(self):
+        result, expect = import_case('runtime_error_view')
+        self.assertEqual(result, expect)
+
+    def test_lex_runtime_skip(self):
+        result, expect = import_case('runtime_skip')
+        self.assertEqual(result, expect)
+
 
 class LexOptionTests(unittest.TestCase):
     def test_lex_option_ignorecase(self):
         result, expect = import_case('option_ignorecase')
         self.assertEqual(result, expect)
 
+    def test_lex_option_engine_dfa(self):
+        result, expect = import_case('option_engine_dfa')
+        self.assertEqual(result, expect)
+
+    def test_lex_option_casefold(self):
+        result, expect = import_case('option_casefold')
+        self.assertEqual(result, expect)
+
+    def test_lex_option_token_class(self):
+        result, expect = import_case('option_token_class')
+        self.assertEqual(result, expect)
+
+    def test_lex_option_bytes(self):
+        result, expect = import_case('option_bytes')
+        self.assertEqual(result, expect)
+
+    def test_lex_option_track_lines(self):
+        result, expect = import_case('option_track_lines')
+        self.assertEqual(result, expect)
+
+    def test_lex_option_table_cache(self):
+        result, expect = import_case('option_table_cache')
+        self.assertEqual(result, expect)
+
+
+class LexGeneratedTests(unittest.TestCase):
+    # the cases run again with the lexers generated by plex.generate(),
+    # but state_lazy, which has a state with a broken rule never entered
+    cases = ['hedit', 'state_try'] + sorted(
+        name[:-3] for name in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+        if name.startswith(('interface_', 'runtime_', 'option_')))
+
+    def test_lex_generated(self):
+        self.maxDiff = None
+        for case in self.cases:
+            with self.subTest(case=case), tempfile.TemporaryDirectory() as directory:
+                result, expect = import_generated_case(case, directory)
+                self.assertEqual(result, expect)
+
 
 unittest.main()
@@ -0,0 +1,34 @@
+from plex import Lexer
+
+
+class RuntimeDispatchLexer(Lexer):
+    options = {'case-insensitive': True}
+
+    __(r'[ \t]+')(None)
+    __(r'(?=\d)\w+')('WORD_FROM_DIGIT', lambda _: _)
+    __(r'\d+')('NUMBER', int)
+    __(r'(begin|end)')('KEYWORD', str.lower)
+    __(r'[a-z]+')('WORD', lambda _: _)
+    __(r'x?=')('ASSIGN', lambda _: _)
+    __(r'=>')('ARROW')
+    __(r'\W')('OTHER', lambda _: _)
+
+
+lex = RuntimeDispatchLexer()
+lex.input('BEGIN x= 12ab 34 => Ende; = \u212a')
+
+result = ''
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+expect = """\
+KEYWORD='begin' (1,0)
+ASSIGN='x=' (1,6)
+WORD_FROM_DIGIT='12ab' (1,9)
+WORD_FROM_DIGIT='34' (1,14)
+ARROW=None (1,17)
+WORD='Ende' (1,20)
+OTHER=';' (1,24)
+ASSIGN='=' (1,26)
+WORD='\u212a' (1,28)
+"""
@@ -0,0 +1,37 @@
+import copy
+import pickle
+
+from plex import Lexer, LexError, LexInputView
+
+
+class RuntimeErrorViewLexer(Lexer):
+    __(r'\s+')(None)
+    __(r'[a-z]+')('WORD', lambda _: _)
+
+    @__('__error__')
+    def t_error(self, t):
+        if t.text.startswith('!!'):
+            return
+        t.value = (type(t.text) is LexInputView, t.text[0], t.text[:3], len(t.text), t.text.find(' '))
+        self.skip(1)
+        return t
+
+
+result = ''
+expect = """\
+WORD='ab' 0
+__error__=(True, '#', '# c', 12, 1) 3
+WORD='cd' 5
+LexError: Illegal character '!' at index 8 '!! ef $' True
+copies: '!! ef $' '!! ef $' '!! ef $'
+"""
+
+lex = RuntimeErrorViewLexer()
+lex.input('ab # cd !! ef $')
+try:
+    for tok in lex:
+        result += '%s=%r %d\n' % (tok.type, tok.value, tok.lexpos)
+except LexError as e:
+    result += 'LexError: %s %r %s\n' % (str(e), str(e.text), e.text == '!! ef $')
+    # the view is copied and pickled as its text
+    result += 'copies: %r %r %r\n' % (copy.copy(e.text), copy.deepcopy(e.text), pickle.loads(pickle.dumps(e.text)))
@@ -0,0 +1,47 @@
+from plex import Lexer
+
+
+class RuntimeLiteralsLexer(Lexer):
+    __(r'\s+')(None)
+
+    __(r'<')('LT')
+    __(r'<=')('LE')
+    __(r'<<')('LSHIFT')
+    __(r'<<=')('LSHIFT_ASSIGN')
+    __(r'<<<=')('ASHIFT_ASSIGN')
+    __(r'=')('ASSIGN')
+    __(r'==')('EQ')
+    __(r'==')('EQ_SHADOWED')
+
+    __(r'f[a-z]*')('NAME', lambda _: _)
+    __(r'for')('FOR')
+    __(r'func')('FUNC')
+    __(r'function')('FUNCTION')
+    __(r'->')('ARROW')
+    __(r'-+')('DASHES', len)
+
+
+lex = RuntimeLiteralsLexer()
+lex.input('<<<<= <<= < <= == = for func function fo -> --< -')
+
+result = ''
+for tok in lex:
+    result += '%s=%r (%d,%d)\n' % (tok.type, tok.value, tok.lineno, tok.lexpos)
+
+expect = """\
+LSHIFT=None (1,0)
+LSHIFT_ASSIGN=None (1,2)
+LSHIFT_ASSIGN=None (1,6)
+LT=None (1,10)
+LE=None (1,12)
+EQ=None (1,15)
+ASSIGN=None (1,18)
+NAME='for' (1,20)
+NAME='func' (1,24)
+NAME='function' (1,29)
+NAME='fo' (1,38)
+ARROW=None (1,41)
+DASHES=2 (1,44)
+LT=None (1,46)
+DASHES=1 (1,48)
+"""
@@ -0,0 +1,42 @@
+from plex import Lexer
+
+
+class RuntimeSkipLexer(Lexer):
+    options = {'track-lines': True}
+    states = [('para', 'exclusive')]
+
+    # merged into one skip pattern, newlines counted
+    __([' ', '\t'])(None)
+    __(r'\n+')(None)
+    __(r'[a-z]+')('WORD')
+
+    @__(r'%')
+    def t_para(self, t):
+        self.begin('para')
+
+    # not merged: another rule starts with a newline
+    __('para', r'[ \n]')(None)
+    __('para', r'\n\n')('PARA')
+    __('para', r'[a-z]+')('WORD')
+
+
+lex = RuntimeSkipLexer()
+lex.input('ab \t cd\n\n ef %gh\n\n ij \n\nkl')
+
+result = ''
+for tok in lex:
+    result += '%s %r (%d,%d)\n' % (tok.type, tok.text, tok.lineno, tok.lexpos)
+result += '%s %s\n' % (RuntimeSkipLexer._compiled['INITIAL'][4] is not None,
+                       RuntimeSkipLexer._compiled['para'][4] is not None)
+
+expect = """\
+WORD 'ab' (1,0)
+WORD 'cd' (1,5)
+WORD 'ef' (3,10)
+WORD 'gh' (3,14)
+PARA '\\n\\n' (3,16)
+WORD 'ij' (5,19)
+PARA '\\n\\n' (5,22)
+WORD 'kl' (7,24)
+True False
+"""
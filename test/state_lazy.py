@@ -0,0 +1,56 @@
+import re
+from plex import Lexer
+
+
+class StateLazyLexer(Lexer):
+    states = [('string', 'exclusive'), ('broken', 'exclusive')]
+
+    __('*', r'[ \t]+')(None)
+    __(r'\w+')('WORD')
+
+    @__(r'"')
+    def t_string_begin(self, t):
+        self.begin('string')
+
+    @__('string', r'[^"]+')
+    def t_string_body(self, t):
+        return 'STRING'
+
+    @__('string', r'"')
+    def t_string_end(self, t):
+        self.begin('INITIAL')
+
+    @__(r'\?')
+    def t_broken(self, t):
+        self.begin('broken')
+
+    __('broken', r'[unclosed')('NEVER')
+
+
+result = ''
+expect = """\
+compiled: []
+compiled: ['INITIAL']
+WORD a
+STRING b c
+WORD d
+compiled: ['INITIAL', 'string']
+shared: True
+broken: error
+"""
+
+result += 'compiled: %s\n' % sorted(StateLazyLexer._compiled)
+lex = StateLazyLexer()
+result += 'compiled: %s\n' % sorted(StateLazyLexer._compiled)
+lex.input('a "b c" d')
+for tok in lex:
+    result += '%s %s\n' % (tok.type, tok.text)
+result += 'compiled: %s\n' % sorted(StateLazyLexer._compiled)
+# the matcher of the rule active in all states is compiled once
+result += 'shared: %s\n' % (StateLazyLexer._compiled['INITIAL'][0][0] is StateLazyLexer._compiled['string'][0][0])
+
+lex.input('?')
+try:
+    list(lex)
+except re.error:
+    result += 'broken: error\n'